@@ -43,11 +43,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so that the queries of the other middlewares are recorded too
+    'taskmanager.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # after the session middleware, whose session is saved after it
+    'taskmanager.middleware.ReadAfterWriteMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,11 +84,99 @@ WSGI_APPLICATION = 'projet.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # the SQLite backend of django, which can start the transactions with BEGIN IMMEDIATE
+        'ENGINE': 'taskmanager.sqlite_backend',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # the connections are kept between the requests (the pragmas below are set once per connection)
+        'CONN_MAX_AGE': 600,
+        # the transactions take the write lock when they start instead of failing when they write after a concurrent
+        # write (see taskmanager/sqlite_backend/base.py)
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    },
+    # read only copy of the default database, read by the statistics pages and the export jobs (see
+    # taskmanager/replica.py). Here a copy of the SQLite file made with the online backup API of SQLite: run
+    # "python manage.py snapshot_replica --interval 30" beside the server to refresh it. Until the file exists, the
+    # reads go to the default database. In production, a replica of the database server.
+    'replica': {
+        'ENGINE': 'taskmanager.sqlite_backend',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        # the tests read the default database
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# The writes and the reads of the pages which are not read only go to the default database
+DATABASE_ROUTERS = ['taskmanager.replica.ReplicaRouter']
+
+# Time (s) during which a user who has written reads from the default database: the replica may not have his/her
+# changes yet. At least the interval of the snapshots of the replica.
+REPLICA_LAG = 60
+
+# Pragmas set on every new connection to a SQLite database (see taskmanager/models.configure_sqlite_connection):
+# - WAL: the readers do not wait for the writers and the writers do not wait for the readers
+# - synchronous NORMAL: the commits do not wait for the disk, a power loss may lose the last commits but does not
+#   corrupt the database in WAL mode
+# - 64 MB of page cache (negative: in KiB) and 256 MB of the file mapped in memory, per connection
+# - a locked database is waited for up to 10 s before "database is locked" is raised
+# The benchmark_contention command compares them with the default configuration
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 10000,
+    'temp_store': 'MEMORY',
+}
+
+
+# Authentication backends. The project permissions are answered from the members of the projects
+# (see taskmanager/backends.py), the ModelBackend handles the login and the other permissions
+
+AUTHENTICATION_BACKENDS = [
+    'taskmanager.backends.ProjectMembershipBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Number of seconds the projects of a user are kept in the cache between requests. 0 means that they are read again
+# on every request. When the site runs in several processes the cache must be shared (not the local memory cache)
+PROJECT_PERMISSIONS_CACHE_TIMEOUT = 0
+
+# Number of seconds the statuses are kept in the memory of each process (see taskmanager/models.StatusRegistry). A
+# process sees at once the statuses it has changed itself, the other processes see them after this time at most
+STATUS_REGISTRY_TIMEOUT = 60
+
+# Number of seconds the choices of the assignee of the tasks of a project (its members) are kept in the cache. They are
+# identified by the members version of the project, so any cache backend gives up to date choices. 0 disables the cache
+MEMBER_CHOICES_CACHE_TIMEOUT = 3600
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+#
+# The 'fragments' cache keeps the rendered parts of the project and statistics pages (see taskmanager/fragments.py).
+# Their keys contain the versions of the projects, which are kept in the database, so any backend gives up to date
+# pages, even when it is not shared by the processes of the site:
+# - 'django.core.cache.backends.locmem.LocMemCache': in the memory of each process
+# - 'django.core.cache.backends.filebased.FileBasedCache' with a folder as LOCATION: shared by the processes of a host
+# - a Redis server with the django-redis package: 'django_redis.cache.RedisCache' with 'redis://127.0.0.1:6379/1' as
+#   LOCATION
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'taskmanager-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
+# Number of seconds a rendered fragment is kept in the cache. The fragments of the data which has changed are not used
+# anymore, they only take room until they expire or are evicted. 0 disables the fragments cache
+FRAGMENT_CACHE_TIMEOUT = 24 * 3600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -135,4 +227,26 @@ LOGOUT_REDIRECT_URL = '/login/'
 LOGIN_URL = '/login/'
 
 # pour faire le render des forms en Bootstrap 4
-CRISPY_TEMPLATE_PACK = 'bootstrap4'
\ No newline at end of file
+CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+# Background exports (see taskmanager/jobs.py): folder of the generated zip files and number of exports made at the
+# same time (0 makes the exports during the requests, without background threads)
+EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+
+EXPORT_WORKERS = 2
+
+# The exports waiting or running for more than EXPORT_TIMEOUT seconds, whose file has not been written for as long,
+# have been interrupted (by a restart) and the zip files are deleted EXPORT_RETENTION seconds after the end of their
+# export: run "python manage.py clean_exports" periodically
+EXPORT_TIMEOUT = 3600
+
+EXPORT_RETENTION = 24 * 3600
+
+# The zip files of the exports can be sent by the web server in front of django instead of the django process, which
+# is then free at once however slow the download is. EXPORT_SENDFILE_HEADER is the header telling the web server to
+# send the file and EXPORT_SENDFILE_ROOT replaces EXPORT_ROOT in its value:
+# - nginx: 'X-Accel-Redirect' and the url of an internal location whose alias is EXPORT_ROOT, like '/protected-exports/'
+# - Apache (mod_xsendfile) or lighttpd: 'X-Sendfile' and EXPORT_ROOT
+# None lets django send the files
+EXPORT_SENDFILE_HEADER = None
+EXPORT_SENDFILE_ROOT = '/protected-exports/'
@@ -3,7 +3,20 @@ from django.core.exceptions import ValidationError
 from django.utils.text import Truncator
 
 # models
-from .models import Status, Task, Projet, Journal
+from .models import Status, Task, Projet, Journal, record_deleted_journals
+
+# full text search
+from .search import TASK_SEARCH_TABLE, JOURNAL_SEARCH_TABLE, fts_query, matching_ids, search_enabled
+
+
+class FullTextSearchMixin:
+    """Search in the full text index (see search.py) instead of LIKE '%...%' queries over the search_fields"""
+    search_table = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_enabled() or not fts_query(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=matching_ids(self.search_table, search_term)), False
 
 
 class ProjetAdmin(admin.ModelAdmin):
@@ -19,11 +32,13 @@ class ProjetAdmin(admin.ModelAdmin):
             raise ValidationError("Un projet doit avoir au moins un membre")
 
 
-class JournalAdmin(admin.ModelAdmin):
+class JournalAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('author', 'date', 'apercu_entry', 'task', 'get_project')
     list_filter = ('author', 'date',)
     date_hierarchy = 'date'
     ordering = ('date',)
+    search_fields = ('entry',)
+    search_table = JOURNAL_SEARCH_TABLE
 
     def apercu_entry(self, journal):
         """
@@ -38,6 +53,15 @@ class JournalAdmin(admin.ModelAdmin):
     get_project.short_description = "projet"
     apercu_entry.short_description = "entry"
 
+    # les journaux n'ont pas de signal de suppression (voir models.record_deleted_journals)
+    def delete_model(self, request, obj):
+        record_deleted_journals(Journal.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        record_deleted_journals(queryset)
+        super().delete_queryset(request, queryset)
+
 
 class JournalInline(admin.TabularInline):
     '''
@@ -46,12 +70,13 @@ class JournalInline(admin.TabularInline):
     model = Journal
 
 
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'projet', 'apercu_description', 'assignee', 'start_date', 'due_date', 'priority', 'status',)
     list_filter = ('projet', 'assignee', 'priority', 'status',)
     date_hierarchy = 'start_date'
     ordering = ('start_date',)
     search_fields = ('name', 'description',)
+    search_table = TASK_SEARCH_TABLE
 
     def apercu_description(self, task):
         """
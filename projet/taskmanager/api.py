@@ -0,0 +1,81 @@
+# python modules
+import hashlib
+
+# django modules
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# The fields of the tasks given by the JSON API, the "fields" parameter selects some of them. The foreign keys are
+# given by their id: the names of the projects, the statuses and the users may change without modifying the tasks, the
+# ETag of the responses would not change with them
+TASK_API_FIELDS = ('id', 'name', 'description', 'projet', 'assignee', 'status', 'start_date', 'due_date', 'priority',
+                   'completion_percentage', 'last_modification')
+
+
+class TaskApiError(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """Read the "fields" parameter of a request: the comma separated names of the fields of the tasks to be given
+
+    :param value: the parameter, None or empty for all the fields
+    :return: the tuple of the fields names
+    """
+    if not value:
+        return TASK_API_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in TASK_API_FIELDS]
+    if unknown or not fields:
+        raise TaskApiError("Unknown fields: {}. The fields are {}".format(', '.join(unknown),
+                                                                          ', '.join(TASK_API_FIELDS)))
+    return fields
+
+
+def tasks_etag(count, last_modification, *parts):
+    """Strong ETag of a list of tasks
+
+    Every save of a task changes its last_modification (and the update() of the tasks must set it too, see
+    models.Task), the creation or the deletion of a task changes their number, so the list has changed when one of them
+    has changed.
+
+    :param count: the number of tasks
+    :param last_modification: the latest last_modification of the tasks, None if there is none
+    :param parts: the other values the response depends on (the fields, the user...)
+    """
+    state = (count, last_modification.isoformat() if last_modification else None) + parts
+    return '"{}"'.format(hashlib.md5(repr(state).encode()).hexdigest())
+
+
+def tasks_response(request, tasks, *etag_parts):
+    """JSON response giving a list of tasks, or 304 Not Modified if the client has it already
+
+    Only one aggregate query is made to answer a conditional request (If-None-Match or If-Modified-Since) when the
+    tasks have not changed.
+
+    :param request: GET parameter "fields", see parse_fields
+    :param tasks: the queryset of the tasks
+    :param etag_parts: the other values the list of tasks depends on, see tasks_etag
+    :return: a JSON object with the number of tasks and the tasks, ordered by id
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except TaskApiError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    state = tasks.aggregate(count=Count('id'), last_modification=Max('last_modification'))
+    etag = tasks_etag(state['count'], state['last_modification'], fields, request.user.id, *etag_parts)
+    last_modified = state['last_modification'].timestamp() if state['last_modification'] else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse({'count': state['count'],
+                                 'tasks': list(tasks.order_by('id').values(*fields))})
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # the responses depend on the user
+    response['Cache-Control'] = 'private, no-cache'
+    return response
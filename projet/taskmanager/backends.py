@@ -0,0 +1,66 @@
+# python modules
+import re
+
+# django modules
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+
+# The permission checked by the views to know if a user can see and contribute to a project
+PROJECT_PERMISSION = re.compile(r'^taskmanager\.(\d+)_project_permission$')
+
+
+def project_ids_cache_key(user_id):
+    return 'taskmanager_project_ids_{}'.format(user_id)
+
+
+def forget_project_ids(user_ids):
+    """Remove the projects of these users from the cache. Called whenever the members of a project change"""
+    if settings.PROJECT_PERMISSIONS_CACHE_TIMEOUT:
+        cache.delete_many([project_ids_cache_key(user_id) for user_id in user_ids])
+
+
+class ProjectMembershipBackend:
+    """Authentication backend answering the project permissions from the members of the projects
+
+    A user has the permission 'taskmanager.<id>_project_permission' if he/she is member of the project <id>. The ids
+    of the projects of the user are read once per request (they are kept on the user object, like the ModelBackend does
+    with the permissions), and can also be kept in the django cache between requests if
+    PROJECT_PERMISSIONS_CACHE_TIMEOUT is set.
+
+    This backend does not authenticate anyone: it must be used along with the ModelBackend, placed before it so that
+    the project permissions never reach the ModelBackend.
+    """
+
+    def authenticate(self, request, **credentials):
+        return None
+
+    def get_project_ids(self, user_obj):
+        """Return the set of the ids of the projects of which the user is member"""
+        if not hasattr(user_obj, '_project_ids_cache'):
+            project_ids = None
+            key = project_ids_cache_key(user_obj.id)
+            if settings.PROJECT_PERMISSIONS_CACHE_TIMEOUT:
+                project_ids = cache.get(key)
+
+            if project_ids is None:
+                project_ids = frozenset(user_obj.projets.values_list('id', flat=True))
+                if settings.PROJECT_PERMISSIONS_CACHE_TIMEOUT:
+                    cache.set(key, project_ids, settings.PROJECT_PERMISSIONS_CACHE_TIMEOUT)
+
+            user_obj._project_ids_cache = project_ids
+        return user_obj._project_ids_cache
+
+    def has_perm(self, user_obj, perm, obj=None):
+        match = PROJECT_PERMISSION.match(perm)
+        if match is None:
+            # not a project permission, let the other backends answer
+            return False
+
+        if user_obj.is_active and not user_obj.is_anonymous and int(match.group(1)) in self.get_project_ids(user_obj):
+            return True
+
+        # The project permissions are only given by the membership: the other backends must not be asked (it would
+        # load all the permissions of the user)
+        raise PermissionDenied
@@ -0,0 +1,49 @@
+# django modules
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+# models
+from .models import Projet, Task, Journal, project_counters, next_version
+
+# full text search
+from .search import index_journals
+
+
+# Number of tasks changed by each update(): the ids are parameters of the query, whose number is limited by SQLite
+BULK_BATCH_SIZE = 500
+
+
+def bulk_update_tasks(project, tasks, changes, author, entry):
+    """Apply the same change to many tasks of a project
+
+    The tasks are changed with one update() per BULK_BATCH_SIZE tasks and the journals telling the change are written
+    with one bulk_create, in one transaction. The signals of the tasks and the journals are not sent, so what they would
+    do is done here: the counters and the version of the project are computed again and the journals are indexed for
+    the full text search.
+
+    :param project: the project of the tasks
+    :param tasks: the queryset of the tasks to be changed, tasks of the project only
+    :param changes: a dictionary field name -> value given to update() (the foreign keys by their id: status_id,
+                    assignee_id). The assignee must be a member of the project, which is not checked again here
+    :param author: the user who made the change, author of the journals
+    :param entry: the text of the journals
+    :return: the list of the ids of the changed tasks
+    """
+    with transaction.atomic():
+        task_ids = list(tasks.order_by('id').values_list('id', flat=True))
+        if not task_ids:
+            return task_ids
+
+        # the tasks of the list exactly, their journals are written below. update() does not set last_modification
+        now = timezone.now()
+        for start in range(0, len(task_ids), BULK_BATCH_SIZE):
+            Task.objects.filter(id__in=task_ids[start:start + BULK_BATCH_SIZE]).update(last_modification=now, **changes)
+
+        # bulk_create does not give the ids of the journals with SQLite, the new ones are after the last one
+        last_journal_id = Journal.objects.aggregate(last=Max('id'))['last'] or 0
+        Journal.objects.bulk_create([Journal(task_id=task_id, author=author, entry=entry) for task_id in task_ids])
+        index_journals(last_journal_id)
+
+        Projet.objects.filter(pk=project.pk).update(version=next_version(), **project_counters())
+    return task_ids
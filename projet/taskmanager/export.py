@@ -0,0 +1,354 @@
+# python modules
+import csv
+import datetime
+import io
+import json
+import time
+import xlwt
+import zipfile
+from itertools import islice
+
+# django modules
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch, Q, prefetch_related_objects
+
+# models
+from .models import Projet, Task, Journal, Status, Tombstone
+
+
+# Number of objects read from the database and written in the archive at once. The memory used by an export only
+# depends on this number, not on the number of objects exported
+EXPORT_CHUNK_SIZE = 2000
+
+# Only these fields of the User model are exported, the other ones are confidential
+USER_EXPORT_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+# Format of the dates and times written in the .csv and .xls files
+DATETIME_FORMAT = "%m/%d/%Y, %H:%M:%S"
+
+# Name of the file of the archive describing the export
+MANIFEST_FILE_NAME = 'manifest.json'
+
+# A delta export also contains the changes made this long before its watermark: the changes of the transactions which
+# were not committed yet when the previous export was made. An object may be in two successive exports
+DELTA_OVERLAP = datetime.timedelta(minutes=1)
+
+# Number of rows of a sheet of a .xls file (BIFF8 format). The next rows are written in another sheet of the same name
+# followed by its number, "Task (2)", with the header row again
+XLS_MAX_ROWS = 65536
+
+# Styles of the .xls files, the same objects for all the cells so that xlwt registers each of them once per workbook
+XLS_HEADER_STYLE = xlwt.easyxf('font: bold on')
+XLS_BODY_STYLE = xlwt.XFStyle()
+
+
+def export_querysets(user, exp_p=False, exp_m=False, exp_t=False, exp_j=False, exp_s=False, since=None):
+    """Build the querysets of the data selected by the user
+
+    ONLY the data that refers to the projects of which the user is MEMBER will be exported
+
+    :param user: the user asking for the export
+    :param exp_p, exp_m, exp_t, exp_j, exp_s: booleans, allows to select whether to export projects, projects members,
+                                              projects tasks, tasks journals or status models
+    :param since: the watermark of a previous export: only the projects, members, tasks and journals created or
+                  modified since then are exported (delta export). The whole data if None
+    :return: the list of the querysets to be exported
+    """
+    projects_queryset = user.projets.all()  # only projects that the user has access to
+    changed_projects = projects_queryset
+    tasks_queryset = Task.objects.filter(projet__in=projects_queryset)
+    journals_queryset = Journal.objects.filter(task__projet__in=projects_queryset)
+    if since is not None:
+        since = since - DELTA_OVERLAP
+        changed_projects = projects_queryset.filter(last_modification__gte=since)
+        tasks_queryset = tasks_queryset.filter(last_modification__gte=since)
+        # the journals are not modified once written
+        journals_queryset = journals_queryset.filter(date__gte=since)
+
+    querysets = []
+    if exp_p:
+        querysets.append(changed_projects)
+    if exp_m:
+        # infos about project members
+        querysets.append(User.objects.filter(projets__in=changed_projects).distinct())
+    if exp_t:
+        # all the tasks in these projects
+        querysets.append(tasks_queryset)
+    if exp_j:
+        # all the journals in these tasks
+        querysets.append(journals_queryset)
+    if exp_s:
+        querysets.append(Status.objects.all())
+    return querysets
+
+
+def export_manifest(user, watermark, since=None):
+    """Describe an export, written in the archive as MANIFEST_FILE_NAME
+
+    The watermark is the time at which the export started: it is the 'since' of the next delta export. A delta export
+    also lists the projects, tasks and journals deleted since the previous export (see models.Tombstone)
+
+    :param user: the user asking for the export
+    :param watermark: the time at which the export started
+    :param since: the watermark of the previous export for a delta export, None for a full export
+    :return: a dictionary
+    """
+    manifest = {'watermark': watermark, 'since': since, 'deleted': []}
+    if since is not None:
+        tombstones = Tombstone.objects.filter(Q(projet_id__in=user.projets.values('id')) | Q(user=user),
+                                              deleted__gte=since - DELTA_OVERLAP).order_by('deleted', 'id')
+        manifest['deleted'] = list(tombstones.values('model', 'object_id', 'name', 'projet_id', 'deleted'))
+    return manifest
+
+
+def export_file_name(model, file_format):
+    """Name of the file of the archive containing the data of a model"""
+    return model._meta.model.__name__.lower() + '_data.' + file_format
+
+
+def iter_chunks(queryset):
+    """Iterate over a queryset by lists of EXPORT_CHUNK_SIZE objects, without caching the whole queryset
+
+    The foreign keys are written in the exported files so they are retrieved in the same query as the objects (with
+    the projects of the tasks of the journals, see Task.natural_key), and the members of the projects with one query
+    for each chunk
+    """
+    if queryset.model != User:
+        related_fields = [field.name for field in queryset.model._meta.fields if field.is_relation]
+        if queryset.model == Journal:
+            related_fields.append('task__projet')
+        if related_fields:
+            queryset = queryset.select_related(*related_fields)
+
+    objects = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(objects, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        if queryset.model == Projet:
+            prefetch_related_objects(chunk, Prefetch('members', queryset=User.objects.only('username')))
+        yield chunk
+
+
+def _format_value(field_value):
+    # this is to control the format of the date that will be written in the file
+    if isinstance(field_value, datetime.datetime):
+        field_value = field_value.strftime(DATETIME_FORMAT)
+    return field_value
+
+
+def dump_csv(queryset):
+    """Generate the .csv file of a queryset, piece by piece (one piece for each chunk of objects)"""
+    output = io.StringIO()
+    # create an instance of csv writer that writes on the stream 'output' opened above
+    csv_writer = csv.writer(output, dialect='excel', delimiter=';')
+    model = queryset.model
+
+    # there are some things that may be different from a model to another
+    if model == Projet:
+        # for example, I also want to write in the project csv the username of the members
+        csv_writer.writerow(['ID', 'NAME', 'MEMBERS'])
+    elif model == User:
+        # if the model is User, only export non confidential fields
+        csv_writer.writerow(['USERNAME', 'NAME', 'SURNAME', 'E-MAIL'])
+    else:
+        # get all the field names and write them as headers
+        field_names = [field.name for field in model._meta.fields]
+        # the task of a journal is identified by its name and the name of its project
+        csv_writer.writerow([field.upper() for field in field_names] + (['PROJET'] if model == Journal else []))
+
+    for chunk in iter_chunks(queryset):
+        for obj in chunk:
+            if model == Projet:
+                # build a comma separated list with all the users that are in the project
+                members = ', '.join([member.username for member in obj.members.all()])
+                csv_writer.writerow([obj.id, obj.name, members])
+            elif model == User:
+                csv_writer.writerow([obj.username, obj.first_name, obj.last_name, obj.email])
+            elif model == Journal:
+                csv_writer.writerow([_format_value(getattr(obj, field)) for field in field_names] +
+                                    [obj.task.projet.name if obj.task.projet_id else ''])
+            else:
+                csv_writer.writerow([_format_value(getattr(obj, field)) for field in field_names])
+
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+    yield output.getvalue()
+
+
+def dump_serialized(queryset, file_format):
+    """Generate the .json or .xml file of a queryset with the django serializers, piece by piece
+
+    Each chunk of objects is serialized separately and only the objects are kept from its output, so the pieces put
+    together give the same file as serializing the whole queryset at once.
+    """
+    options = {'use_natural_foreign_keys': True}
+    # if the model is User, only export non confidential fields
+    if queryset.model == User:
+        options['fields'] = USER_EXPORT_FIELDS
+
+    first = True
+    for chunk in iter_chunks(queryset):
+        text = serializers.serialize(file_format, chunk, **options)
+        if file_format == 'json':
+            # the output is "[obj, obj, ...]"
+            header, body, footer = '[', text[1:-1], ']'
+            separator = ', '
+        else:
+            # the output is the xml declaration and the root element opening tag, the objects and the closing tag
+            body_start = text.index('>', text.index('<django-objects')) + 1
+            body_end = text.rindex('</django-objects>')
+            header, body, footer = text[:body_start], text[body_start:body_end], text[body_end:]
+            separator = ''
+
+        yield (header if first else separator) + body
+        first = False
+
+    if first:
+        # nothing has been exported, serialize an empty list to get the header and the footer
+        yield serializers.serialize(file_format, [], **options)
+    else:
+        yield footer
+
+
+def _xls_write_row(ws, row_num, values, style):
+    """Write a row of text cells of a sheet at once, with a style already used by the workbook"""
+    row = ws.row(row_num)
+    for col_num, value in enumerate(values):
+        if value:
+            row.set_cell_text(col_num, value, style)
+        else:
+            row.set_cell_blank(col_num, style)
+
+
+def dump_xls(queryset):
+    """Generate the .xls file of a queryset
+
+    The rows are spread over several sheets when there are more than XLS_MAX_ROWS of them. xlwt keeps the whole
+    workbook in memory, so the file is generated in one piece, but the rows of each chunk are flushed to their binary
+    form once written, which takes much less memory than the cells objects
+    """
+    model = queryset.model
+    wb = xlwt.Workbook(encoding='utf-8')  # create excel workbook
+    sheet_name = model._meta.model.__name__
+
+    # get all the field names and write them as headers
+    # if User only confidential data
+    if model == User:
+        field_names = list(USER_EXPORT_FIELDS)
+    else:
+        field_names = [field.name for field in model._meta.fields]
+    header = [field_name.upper() for field_name in field_names]
+    # add a column for the members of the project
+    # (otherwise it won't be done automatically because it's ManytoMany)
+    if model == Projet:
+        header.append('MEMBERS')
+    # and one for the project of the task of a journal, see dump_csv
+    elif model == Journal:
+        header.append('PROJET')
+
+    sheets = []
+
+    def add_sheet():
+        sheets.append(wb.add_sheet(sheet_name if not sheets else '{} ({})'.format(sheet_name, len(sheets) + 1)))
+        _xls_write_row(sheets[-1], 0, header, XLS_HEADER_STYLE)
+        return sheets[-1]
+
+    ws = add_sheet()
+    row_num = 0
+    for chunk in iter_chunks(queryset):
+        for obj in chunk:
+            row_num += 1
+            if row_num == XLS_MAX_ROWS:
+                ws.flush_row_data()
+                ws = add_sheet()
+                row_num = 1
+            values = [str(_format_value(getattr(obj, field_name))) for field_name in field_names]
+            # add the column with the members of the project (prefetched by iter_chunks)
+            if model == Projet:
+                values.append(', '.join([member.username for member in obj.members.all()]))
+            elif model == Journal:
+                values.append(obj.task.projet.name if obj.task.projet_id else '')
+            _xls_write_row(ws, row_num, values, XLS_BODY_STYLE)
+        ws.flush_row_data()
+
+    output = io.BytesIO()
+    wb.save(output)
+    yield output.getvalue()
+
+
+def dump(queryset, file_format):
+    """Generate the file of a queryset in the given format (csv, json, xml or xls), piece by piece"""
+    if file_format == 'csv':
+        return dump_csv(queryset)
+    elif file_format == 'json' or file_format == 'xml':
+        return dump_serialized(queryset, file_format)
+    elif file_format == 'xls':
+        return dump_xls(queryset)
+    raise ValueError("Unknown export format: {}".format(file_format))
+
+
+class ZipStream:
+    """Write only file object in which the zip archive is written
+
+    The ZipFile can not seek in it, so it writes the archive sequentially. The written bytes are kept until they are
+    retrieved with pop().
+    """
+
+    def __init__(self):
+        self._data = []
+
+    def write(self, data):
+        self._data.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._data)
+        self._data = []
+        return data
+
+
+def zip_stream(querysets, file_format, compress=True, manifest=None):
+    """Generate a zip archive containing one file for each queryset, piece by piece
+
+    The archive is sent as soon as it is written: only the current chunk of objects is kept in memory
+
+    :param querysets: the querysets to be exported
+    :param file_format: among csv, json, xml, xls (MS-Excel)
+    :param compress: whether the files are compressed (deflate) or only stored in the archive
+    :param manifest: the description of the export written in the archive (see export_manifest), if any
+    :return: a generator of the bytes of the archive
+    """
+    file_format = file_format.lower()
+    stream = ZipStream()
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+
+    def zip_info(name):
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = compression
+        info.external_attr = 0o600 << 16
+        return info
+
+    with zipfile.ZipFile(stream, 'w', compression) as data_zip:
+        for queryset in querysets:
+            # generates the name of the output file depending on the model and the file format
+            with data_zip.open(zip_info(export_file_name(queryset.model, file_format)), 'w',
+                               force_zip64=True) as output:
+                for piece in dump(queryset, file_format):
+                    output.write(piece if isinstance(piece, bytes) else piece.encode('utf-8'))
+                    data = stream.pop()
+                    if data:
+                        yield data
+
+        if manifest is not None:
+            data_zip.writestr(zip_info(MANIFEST_FILE_NAME), json.dumps(manifest, cls=DjangoJSONEncoder, indent=2))
+
+    # the end of the archive (the central directory) is written when it is closed
+    yield stream.pop()
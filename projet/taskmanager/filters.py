@@ -0,0 +1,123 @@
+# python modules
+from collections import namedtuple
+from functools import lru_cache
+
+# django modules
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+
+# Number of compiled filter plans kept in memory. A plan only depends on the normalized filter, not on the project, so
+# the same plan is shared by every project page using the same filter
+FILTER_CACHE_SIZE = 256
+
+# Nodes of the filter tree sent by the filter form of the project page (see static/taskmanager/js/project.js).
+# A Condition is one line of the form, a Group is an OR/AND block containing other lines or blocks
+Condition = namedtuple('Condition', ['link', 'method', 'value'])
+Group = namedtuple('Group', ['kind', 'children'])
+
+# An empty OR/AND block matches every task of the project
+MATCH_ALL = Q(pk__isnull=False)
+
+# For each filter method: the function used to clean the value sent by the form, the lookup and whether it is negated
+LOOKUPS = {
+    'assign': (int, 'assignee__id', False),
+    'not_assign': (int, 'assignee__id', True),
+    'status': (int, 'status__id', False),
+    'not_status': (int, 'status__id', True),
+    'start_before': (parse_date, 'start_date__lte', False),
+    'start_after': (parse_date, 'start_date__gte', False),
+    'end_before': (parse_date, 'due_date__lte', False),
+    'end_after': (parse_date, 'due_date__gte', False),
+}
+
+
+def _group_marker(key):
+    """Return the kind of the block ('or'/'and') and whether the key opens or closes it, None for a filter line"""
+    for kind in ('or', 'and'):
+        if key.startswith('input_{}-'.format(kind)):
+            return kind, True
+        if key.startswith('input_end_{}-'.format(kind)):
+            return kind, False
+    return None
+
+
+def _clean_condition(values):
+    """Build a Condition from the [link, method, value] list of a filter line, None if the line is not valid"""
+    if len(values) != 3:
+        return None
+    link, method, value = values
+    if method not in LOOKUPS:
+        return None
+    try:
+        value = LOOKUPS[method][0](value)
+    except ValueError:
+        return None
+    if value is None:
+        return None
+    return Condition('and' if link == 'and' else 'or', method, value)
+
+
+def parse_filters(query_dict):
+    """Parse the filter form of the project page into a tree of Condition and Group
+
+    The form sends each line as three values ([link, method, value]) under the number of the line. The OR/AND blocks
+    are delimited by the empty 'input_<kind>-<n>' and 'input_end_<kind>-<n>' fields. The keys are read in the order
+    they have been sent so that the tree follows the form.
+
+    The returned tree is made of tuples only: it is hashable and is used as the cache key of the compiled filter. The
+    lines numbers are not part of it, so two forms describing the same filter give the same tree.
+
+    :param query_dict: the request.GET QueryDict of the project page
+    :return: a tuple of Condition and Group
+    """
+    # stack of the blocks being read, the bottom one is the root of the tree
+    stack = [(None, None, [])]
+    for key, values in query_dict.lists():
+        marker = _group_marker(key)
+        if marker is None:
+            condition = _clean_condition(values)
+            if condition is not None:
+                stack[-1][2].append(condition)
+        elif marker[1]:
+            # a new block is opened
+            stack.append((marker[0], key.split('-', 1)[1], []))
+        elif len(stack) > 1 and stack[-1][0] == marker[0] and stack[-1][1] == key.split('-', 1)[1]:
+            # the current block is closed, add it to its parent
+            kind, number, children = stack.pop()
+            stack[-1][2].append(Group(kind, tuple(children)))
+
+    # blocks which have never been closed are ignored
+    return tuple(stack[0][2])
+
+
+def _compile(nodes):
+    filters = Q()
+    for node in nodes:
+        if isinstance(node, Group):
+            link = node.kind
+            node_filter = _compile(node.children) or MATCH_ALL
+        else:
+            link = node.link
+            lookup, negate = LOOKUPS[node.method][1:]
+            node_filter = ~Q(**{lookup: node.value}) if negate else Q(**{lookup: node.value})
+
+        if link == 'and':
+            filters &= node_filter
+        else:
+            filters |= node_filter
+
+    return filters
+
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def compile_filters(tree):
+    """Compile a tree given by parse_filters into a single Q object
+
+    The blocks are merged in the Q object instead of being evaluated as sub queries, so the whole filter ends in one
+    WHERE clause. The result is cached: the returned Q object is shared and must not be modified.
+
+    :param tree: the tuple returned by parse_filters
+    :return: a Q object to be used on the tasks of a project
+    """
+    return _compile(tree)
@@ -3,11 +3,39 @@ from datetime import datetime
 
 # django modules
 from django import forms
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.forms import DateInput
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive
 
 # models
-from .models import Projet, Journal, Task, Status
+from .models import Projet, Journal, Task, status_registry
+
+# filters
+from .filters import parse_filters, compile_filters
+
+# bulk operations on the tasks
+from .bulk import BULK_BATCH_SIZE
+
+
+def member_choices(project):
+    """The (id, username) choices of the assignee of the tasks of a project
+
+    They are kept in the cache under the members version of the project (see Projet.members_version), a change of the
+    members gives another key. The members are read with one query of their id and username only.
+
+    :param project: the project, its members_version must be up to date
+    :return: the list of the choices, ordered by id
+    """
+    key = 'taskmanager_member_choices_{}_{}'.format(project.id, project.members_version)
+    choices = cache.get(key) if settings.MEMBER_CHOICES_CACHE_TIMEOUT else None
+    if choices is None:
+        choices = list(project.members.order_by('id').values_list('id', 'username'))
+        if settings.MEMBER_CHOICES_CACHE_TIMEOUT:
+            cache.set(key, choices, settings.MEMBER_CHOICES_CACHE_TIMEOUT)
+    return choices
 
 
 # REPLACED BY GENERIC VIEWS
@@ -83,15 +111,14 @@ class JournalForm(forms.ModelForm):
 
 class TaskForm(forms.ModelForm):
     def __init__(self, project, *args, **kwargs):
-        # Use to limit the possible choice for the assignee field to members of the project
-        assignee_choices = [(member.id, member.username) for member in project.members.all()]
         super(TaskForm, self).__init__(*args, **kwargs)
 
         # Set the style properties
         self.fields['assignee'].label = "Assign to :"
         self.fields['assignee'].widget.attrs.update({'class': 'form-control'})
-        # Actually limit the choices for the assignee field
-        self.fields['assignee'].choices = assignee_choices
+        # Actually limit the choices for the assignee field to the members of the project. They are only read when the
+        # field is displayed (the membership of the assignee is checked by Task.clean)
+        self.fields['assignee'].choices = lambda: member_choices(project)
         self.fields['name'].label = 'Task name'
         self.fields['name'].widget.attrs.update({'class': 'form-control', 'placeholder': 'Task name'})
         self.fields['description'].widget.attrs.update(
@@ -103,6 +130,9 @@ class TaskForm(forms.ModelForm):
         self.fields['due_date'].label = 'Due date'
         self.fields['due_date'].widget.attrs.update({'class': 'form-control'})
         self.fields['status'].widget.attrs.update({'class': 'form-control'})
+        # The choices of the status field are read in the registry of the statuses instead of the database
+        self.fields['status'].choices = [('', self.fields['status'].empty_label)] + [
+            (status.id, str(status)) for status in status_registry.all()]
         self.fields['priority'].widget.attrs.update({'class': 'form-control'})
         self.fields['priority'].initial = 1
         self.fields['completion_percentage'].widget.attrs.update({'class': 'form-control'})
@@ -111,10 +141,13 @@ class TaskForm(forms.ModelForm):
         # This field is only used in order to set up the project field with the project.
         # Shall not be modified by the user
         self.fields['projet'].widget.attrs.update({'style': 'display: none'})
+        # the hidden field only offers this project, the others are neither displayed nor accepted
+        self.fields['projet'].queryset = Projet.objects.filter(id=project.id)
         self.fields['projet'].initial = project
         # If a "new" status has be defined then initialize the status field with it
-        if Status.objects.filter(name="New"):
-            self.fields['status'].initial = Status.objects.filter(name="New")[0]
+        new_status = status_registry.id_of("New")
+        if new_status is not None:
+            self.fields['status'].initial = new_status
 
     class Meta:
         model = Task
@@ -150,7 +183,96 @@ class TaskForm(forms.ModelForm):
         return completion_percentage
 
 
+class BulkTaskForm(forms.Form):
+    """Form of the bulk operations on the tasks of a project (see views.bulk_tasks_view)
+
+    The tasks are selected by their ids (comma separated) and/or by the filter of the project page, sent in the same
+    format as the filter form (see filters.parse_filters). The fields left empty are not changed.
+    """
+    ids = forms.CharField(required=False)
+    status = forms.TypedChoiceField(coerce=int, required=False, empty_value=None)
+    assignee = forms.IntegerField(required=False)
+    priority = forms.IntegerField(required=False, min_value=1, max_value=10)
+    completion_percentage = forms.IntegerField(required=False, min_value=0, max_value=100)
+
+    def __init__(self, project, *args, **kwargs):
+        super(BulkTaskForm, self).__init__(*args, **kwargs)
+        self.project = project
+        self.fields['status'].choices = [(status.id, str(status)) for status in status_registry.all()]
+
+    def clean_ids(self):
+        try:
+            ids = [int(value) for value in self.cleaned_data['ids'].split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError("The ids must be comma separated numbers.")
+        # the ids are parameters of the query selecting the tasks, the more tasks are selected with a filter
+        if len(ids) > BULK_BATCH_SIZE:
+            raise ValidationError("Select at most {} tasks by their ids, or use a filter.".format(BULK_BATCH_SIZE))
+        return ids
+
+    # the membership of the assignee is checked once for all the tasks
+    def clean_assignee(self):
+        assignee = self.cleaned_data['assignee']
+        if assignee is not None:
+            self.assignee_name = self.project.members.filter(id=assignee).values_list('username', flat=True).first()
+            if self.assignee_name is None:
+                raise ValidationError("The assignee must be a member of the project.")
+        return assignee
+
+    def clean(self):
+        cleaned_data = super(BulkTaskForm, self).clean()
+        # the compiled filter is cached, see filters.compile_filters
+        cleaned_data['filters'] = compile_filters(parse_filters(self.data))
+        if self.errors:
+            return cleaned_data
+        if not cleaned_data['ids'] and not cleaned_data['filters']:
+            raise ValidationError("Select the tasks by their ids or with a filter.")
+        if not self.changes():
+            raise ValidationError("Choose at least one change.")
+        return cleaned_data
+
+    def changes(self):
+        """The changes of the tasks, to be given to update() (see bulk.bulk_update_tasks)"""
+        changes = {
+            'status_id': self.cleaned_data.get('status'),
+            'assignee_id': self.cleaned_data.get('assignee'),
+            'priority': self.cleaned_data.get('priority'),
+            'completion_percentage': self.cleaned_data.get('completion_percentage'),
+        }
+        return {name: value for name, value in changes.items() if value is not None}
+
+    def entry(self):
+        """The text of the journals written on the changed tasks"""
+        changes = self.changes()
+        texts = []
+        if 'status_id' in changes:
+            texts.append("status {}".format(status_registry.get(changes['status_id'])))
+        if 'assignee_id' in changes:
+            texts.append("assigned to {}".format(self.assignee_name))
+        if 'priority' in changes:
+            texts.append("priority {}".format(changes['priority']))
+        if 'completion_percentage' in changes:
+            texts.append("advancement {} %".format(changes['completion_percentage']))
+        entry = "Bulk change: " + ", ".join(texts)
+        return entry[:Journal._meta.get_field('entry').max_length]
+
+
 # form used to select what models to export
+class WatermarkField(forms.DateTimeField):
+    """A date and time field also accepting the ISO 8601 format of the watermark written in the manifest.json file of
+    the exports (for example 2020-05-01T22:00:00.123Z)"""
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            try:
+                watermark = parse_datetime(value.strip())
+            except ValueError:
+                watermark = None
+            if watermark is not None:
+                return self.from_current_timezone(watermark) if is_naive(watermark) else watermark
+        return super().to_python(value)
+
+
 class ExportDataForm(forms.Form):
     # 5 boolean fields to select the models
     projects = forms.BooleanField(required=False)
@@ -167,6 +289,11 @@ class ExportDataForm(forms.Form):
     ]
     # select field to select among the 4 file formats above
     file_format = forms.ChoiceField(choices=FORMAT_FIELD_CHOICES)
+    # compress the files of the zip archive (deflate), or only store them
+    compress = forms.BooleanField(required=False, initial=True)
+    # delta export: only the changes since a previous export
+    since = WatermarkField(required=False, label="Only the changes since",
+                           help_text="The watermark of the manifest.json of a previous export")
 
     # check if at least one tick has been put
     def clean(self):
@@ -177,3 +304,8 @@ class ExportDataForm(forms.Form):
         j = self.cleaned_data['journals']
         if not (p or t or pm or s or j):
             raise ValidationError("Put at least a tick")
+
+
+class ImportDataForm(forms.Form):
+    # a data.zip file made by the export
+    archive = forms.FileField(label="Archive (data.zip)")
@@ -0,0 +1,52 @@
+# python modules
+import hashlib
+
+# django modules
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.safestring import mark_safe
+
+
+# Name of the cache (in the CACHES setting) of the rendered fragments
+FRAGMENT_CACHE = 'fragments'
+
+
+def fragment_key(name, *parts):
+    """Key of a fragment in the cache
+
+    The parts identify the rendered data: the id and the version of the projects shown (see Projet.version), the user
+    when the fragment depends on him/her, the parameters of the url... A change of the data gives another key, so the
+    cached fragments never have to be deleted, the old ones are evicted by the cache.
+
+    :param name: the name of the fragment
+    :param parts: the values identifying the data, their repr() is used
+    """
+    return 'taskmanager_fragment_{}_{}'.format(name, hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def cached_fragments(fragments):
+    """Return the html of fragments, from the cache or rendered and then kept in the cache
+
+    All the fragments are read from the cache at once, and the rendered ones written at once.
+
+    :param fragments: a list of (key, function rendering the fragment), see fragment_key
+    :return: the list of the html of the fragments, in the same order
+    """
+    if not settings.FRAGMENT_CACHE_TIMEOUT:
+        return [mark_safe(render()) for key, render in fragments]
+
+    cache = caches[FRAGMENT_CACHE]
+    cached = cache.get_many([key for key, render in fragments])
+    rendered = {}
+    for key, render in fragments:
+        if key not in cached and key not in rendered:
+            rendered[key] = render()
+    if rendered:
+        cache.set_many(rendered, settings.FRAGMENT_CACHE_TIMEOUT)
+    cached.update(rendered)
+    return [mark_safe(cached[key]) for key, render in fragments]
+
+
+def cached_fragment(key, render):
+    """Return the html of one fragment, see cached_fragments"""
+    return cached_fragments([(key, render)])[0]
@@ -0,0 +1,428 @@
+# python modules
+import csv
+import io
+import json
+import re
+import zipfile
+from datetime import datetime
+from xml.etree import ElementTree
+
+# django modules
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+# models
+from .models import (Projet, Task, Journal, Status, sync_project_group, project_counters, next_version,
+                     next_members_version, duration_class)
+from .backends import forget_project_ids
+from .search import index_all
+
+# export
+from .export import USER_EXPORT_FIELDS, export_file_name
+
+
+# Number of objects kept in memory before they are inserted in the database. The memory used by an import only depends
+# on this number (and on the lookup tables of the names), not on the size of the archive
+IMPORT_BATCH_SIZE = 2000
+
+# The models of an archive, in the order they are imported: the objects refer to the ones imported before them
+IMPORT_MODELS = (Status, User, Projet, Task, Journal)
+IMPORT_FORMATS = ('csv', 'json', 'xml', 'xls')
+
+# Size of the pieces of the .json files read at once
+JSON_READ_SIZE = 64 * 1024
+
+# The dates and times of the .csv and .xls files (export.DATETIME_FORMAT), parsed without strptime which is slow
+EXPORTED_DATETIME = re.compile(r'^(\d{2})/(\d{2})/(\d{4}), (\d{2}):(\d{2}):(\d{2})$')
+
+
+class ImportDataError(Exception):
+    """The archive can not be imported. Nothing has been written in the database"""
+
+
+def read_csv(file, model):
+    """Read the rows of a .csv file written by export.dump_csv, one by one
+
+    :return: a generator of dictionaries field name -> value, the members of the projects are a list of usernames
+    """
+    reader = csv.reader(io.TextIOWrapper(file, encoding='utf-8', newline=''), dialect='excel', delimiter=';')
+    header = next(reader, None)
+    if header is None:
+        return
+    # the columns of the users have their own names
+    columns = list(USER_EXPORT_FIELDS) if model == User else [name.lower() for name in header]
+
+    for line in reader:
+        row = dict(zip(columns, line))
+        if 'members' in row:
+            row['members'] = [username for username in row['members'].split(', ') if username]
+        yield row
+
+
+def read_xls(file, model):
+    """Read the rows of a .xls file written by export.dump_xls, sheet by sheet
+
+    xlrd needs the whole file, the rows are then read one by one
+    """
+    try:
+        import xlrd
+    except ImportError:
+        raise ImportDataError("The xlrd package is needed to import .xls files")
+
+    book = xlrd.open_workbook(file_contents=file.read(), on_demand=True)
+    # every value has been written as a string, None included
+    nullable = {field.name for field in model._meta.fields if field.null}
+    for sheet in book.sheets():
+        if sheet.nrows == 0:
+            continue
+        columns = [name.lower() for name in sheet.row_values(0)]
+        for row_num in range(1, sheet.nrows):
+            row = dict(zip(columns, sheet.row_values(row_num)))
+            for name in nullable.intersection(row):
+                if row[name] == 'None':
+                    row[name] = None
+            if 'members' in row:
+                row['members'] = [username for username in row['members'].split(', ') if username]
+            yield row
+
+
+def _natural(value):
+    # the natural key of the users is a list (username,), the one of the other models is the name
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def read_json(file, model):
+    """Read the objects of a .json file written by the django serializer, one by one
+
+    The file is decoded piece by piece: only the current objects are kept in memory
+    """
+    decoder = json.JSONDecoder()
+    text = io.TextIOWrapper(file, encoding='utf-8')
+    buffer = text.read(JSON_READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ImportDataError("{} is not a list of serialized objects".format(export_file_name(model, 'json')))
+    buffer = buffer[1:]
+
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except ValueError:
+            # the object is not complete, read the next piece of the file
+            piece = text.read(JSON_READ_SIZE)
+            if not piece:
+                raise ImportDataError("{} is truncated".format(export_file_name(model, 'json')))
+            buffer += piece
+            continue
+        buffer = buffer[end:]
+
+        row = {name: _natural(value) for name, value in obj['fields'].items()}
+        if 'members' in obj['fields']:
+            row['members'] = [_natural(member) for member in obj['fields']['members']]
+        if isinstance(obj['fields'].get('task'), list):
+            # the natural key of the tasks is their name and the name of their project, see Task.natural_key
+            row['task'], row['projet'] = obj['fields']['task']
+        yield row
+
+
+def _xml_natural(element):
+    # the serializer writes one <natural> element per item of the natural key, so one per character of the names
+    return ''.join(natural.text or '' for natural in element.findall('natural'))
+
+
+def read_xml(file, model):
+    """Read the objects of a .xml file written by the django serializer, one by one
+
+    The file is parsed incrementally and each object is dropped once it has been read
+    """
+    depth = 0
+    root = None
+    for event, element in ElementTree.iterparse(file, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        # the objects of the file, not the members of the projects which are also <object> elements
+        if depth != 1 or element.tag != 'object':
+            continue
+
+        row = {}
+        for field in element.findall('field'):
+            name = field.get('name')
+            if field.get('rel') == 'ManyToManyRel':
+                row[name] = [_xml_natural(member) for member in field.findall('object')]
+            elif field.find('None') is not None:
+                row[name] = None
+            elif model == Journal and name == 'task' and len(field.findall('natural')) == 2:
+                # the natural key of the tasks is their name and the name of their project, see Task.natural_key
+                row['task'], row['projet'] = (natural.text or '' for natural in field.findall('natural'))
+            elif field.get('rel'):
+                row[name] = _xml_natural(field)
+            else:
+                row[name] = field.text or ''
+        yield row
+        root.clear()
+
+
+READERS = {
+    'csv': read_csv,
+    'xls': read_xls,
+    'json': read_json,
+    'xml': read_xml,
+}
+
+
+def to_python(field, value):
+    """Convert a value read in a file to the value of a field of the model"""
+    if value is None or (value == '' and field.null):
+        return None
+    if isinstance(field, models.DateTimeField) and isinstance(value, str):
+        # the dates of the .csv and .xls files are written in UTC without the time zone
+        match = EXPORTED_DATETIME.match(value)
+        if match is not None:
+            month, day, year, hour, minute, second = map(int, match.groups())
+            try:
+                return datetime(year, month, day, hour, minute, second, tzinfo=timezone.utc)
+            except ValueError as error:
+                raise ImportDataError("Wrong value for {}.{}: {}".format(field.model.__name__, field.name, error))
+    if isinstance(value, float) and isinstance(field, models.IntegerField):
+        value = int(value)
+    try:
+        return field.to_python(value)
+    except ValidationError as error:
+        raise ImportDataError("Wrong value for {}.{}: {}".format(field.model.__name__, field.name, error.messages[0]))
+
+
+class Importer:
+    """Import the objects of an archive made by the data export
+
+    The objects referring to each other by their names (the natural keys written by the export), the names are resolved
+    through lookup tables kept in memory: the statuses and the projects by name, the users by username and the tasks of
+    the archive by name and project name. The statuses, users and projects which already exist are reused, the missing
+    ones are created. The tasks and the journals are always created.
+
+    The objects are inserted with bulk_create, which sends no signal: what the signals would have done is done by
+    finish(). The imported tasks are modified at the time of the import (last_modification) so that the next delta
+    export has them, the journals keep their date.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.statuses = dict(Status.objects.values_list('name', 'id'))
+        self.users = dict(User.objects.values_list('username', 'id'))
+        # the projects names are not unique, the oldest project is used
+        self.projects = dict(Projet.objects.order_by('-id').values_list('name', 'id'))
+        # the tasks of the archive, (project name, task name) -> id, and task name -> id for the archives in which the
+        # project of the task of the journals is not written (exported before it was)
+        self.tasks = {}
+        self.task_names = {}
+        # the tasks and the journals created by the import have a bigger id
+        self.last_task_id = Task.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        self.last_journal_id = Journal.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        self.ambiguous_tasks = set()
+        # the projects in which objects have been imported
+        self.touched_projects = set()
+        # model name -> number of imported objects
+        self.counts = {model._meta.model_name: 0 for model in IMPORT_MODELS}
+
+    def status_id(self, name):
+        # the empty foreign keys are written as an empty string in the .csv files
+        if not name:
+            return None
+        if name not in self.statuses:
+            self.statuses[name] = Status.objects.create(name=name).id
+            self.counts['status'] += 1
+        return self.statuses[name]
+
+    def user_id(self, username):
+        if not username:
+            return None
+        if username not in self.users:
+            self.users[username] = User.objects.create_user(username).id
+            self.counts['user'] += 1
+        return self.users[username]
+
+    def project_id(self, name):
+        if not name:
+            return None
+        if name not in self.projects:
+            self.projects[name] = Projet.objects.create(name=name).id
+            self.counts['projet'] += 1
+        self.touched_projects.add(self.projects[name])
+        return self.projects[name]
+
+    def task_id(self, project_name, name):
+        """Resolve the task of a journal
+
+        :param project_name: the name of the project of the task, None if the archive does not give it
+        :param name: the name of the task
+        """
+        if project_name is None:
+            key, tasks = name, self.task_names
+        else:
+            # the tasks without project are written with an empty project name
+            key, tasks = (project_name or None, name), self.tasks
+        if key in self.ambiguous_tasks:
+            raise ImportDataError("Several tasks of the archive are named {}, the journals of these tasks can not be "
+                                  "imported".format(name))
+        if key not in tasks:
+            raise ImportDataError("The task {} is not in the archive".format(name))
+        return tasks[key]
+
+    def import_status(self, rows):
+        for row in rows:
+            self.status_id(row['name'])
+
+    def import_user(self, rows):
+        fields = [User._meta.get_field(name) for name in USER_EXPORT_FIELDS]
+
+        def flush(batch):
+            User.objects.bulk_create(batch)
+            self.users.update(User.objects.filter(username__in=[user.username for user in batch])
+                              .values_list('username', 'id'))
+            self.counts['user'] += len(batch)
+
+        batch = []
+        for row in rows:
+            if row['username'] in self.users:
+                continue
+            values = {field.name: to_python(field, row.get(field.name)) or '' for field in fields}
+            # the users of an archive have no password, they have to reset it
+            batch.append(User(password=make_password(None), **values))
+            # a user exported twice is created once
+            self.users[row['username']] = None
+            if len(batch) >= self.batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    def import_projet(self, rows):
+        members = Projet.members.through
+
+        batch = []
+        for row in rows:
+            project_id = self.project_id(row['name'])
+            for username in row.get('members', []):
+                batch.append(members(projet_id=project_id, user_id=self.user_id(username)))
+            if len(batch) >= self.batch_size:
+                members.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        members.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def import_task(self, rows):
+        fields = [Task._meta.get_field(name) for name in ('name', 'description', 'start_date', 'due_date', 'priority',
+                                                          'completion_percentage')]
+        keys = set()
+
+        batch = []
+        for row in rows:
+            task = Task(projet_id=self.project_id(row.get('projet')), assignee_id=self.user_id(row.get('assignee')),
+                        status_id=self.status_id(row.get('status')),
+                        **{field.name: to_python(field, row.get(field.name)) for field in fields if field.name in row})
+            # the signals are not sent by bulk_create
+            if task.start_date is not None and task.due_date is not None:
+                task.duration_class = duration_class(task.start_date, task.due_date)
+            batch.append(task)
+
+            for key in ((row.get('projet') or None, task.name), task.name):
+                if key in keys:
+                    self.ambiguous_tasks.add(key)
+                keys.add(key)
+
+            if len(batch) >= self.batch_size:
+                Task.objects.bulk_create(batch)
+                self.counts['task'] += len(batch)
+                batch = []
+        Task.objects.bulk_create(batch)
+        self.counts['task'] += len(batch)
+
+        # the ids of the new tasks, for the journals
+        for project_name, name, task_id in Task.objects.filter(id__gt=self.last_task_id).values_list(
+                'projet__name', 'name', 'id'):
+            self.tasks[project_name, name] = task_id
+            self.task_names[name] = task_id
+
+    def import_journal(self, rows):
+        date_field = Journal._meta.get_field('date')
+        entry_field = Journal._meta.get_field('entry')
+
+        batch = []
+        for row in rows:
+            date = to_python(date_field, row.get('date')) or timezone.now()
+            batch.append(Journal(date=date, entry=to_python(entry_field, row['entry']),
+                                 author_id=self.user_id(row['author']),
+                                 task_id=self.task_id(row.get('projet'), row['task'])))
+            if len(batch) >= self.batch_size:
+                Journal.objects.bulk_create(batch)
+                self.counts['journal'] += len(batch)
+                batch = []
+        Journal.objects.bulk_create(batch)
+        self.counts['journal'] += len(batch)
+
+    def finish(self):
+        """Update what the signals would have updated if the objects had been saved one by one"""
+        projects = Projet.objects.filter(id__in=self.touched_projects)
+        for project in projects:
+            sync_project_group(project)
+        projects.update(version=next_version(), members_version=next_members_version(), **project_counters())
+        forget_project_ids(Projet.members.through.objects.filter(projet_id__in=self.touched_projects)
+                           .values_list('user_id', flat=True))
+        index_all(self.last_task_id, self.last_journal_id)
+
+
+def archive_files(data_zip):
+    """Find the files of the archive, in the order they must be imported
+
+    :param data_zip: the ZipFile
+    :return: a list of (model, file format, name of the file)
+    """
+    names = set(data_zip.namelist())
+    files = []
+    for model in IMPORT_MODELS:
+        for file_format in IMPORT_FORMATS:
+            name = export_file_name(model, file_format)
+            if name in names:
+                files.append((model, file_format, name))
+    if not files:
+        raise ImportDataError("The archive does not contain any exported data")
+    return files
+
+
+def import_archive(archive, batch_size=IMPORT_BATCH_SIZE):
+    """Import the data of a zip archive made by the data export, in one transaction
+
+    The files of the archive are read incrementally and the objects are inserted by batches.
+
+    :param archive: the path of the archive or a file object
+    :param batch_size: number of objects inserted at once
+    :return: a dictionary model name -> number of objects created
+    """
+    try:
+        data_zip = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ImportDataError("The file is not a zip archive")
+
+    with data_zip, transaction.atomic():
+        importer = Importer(batch_size)
+        for model, file_format, name in archive_files(data_zip):
+            with data_zip.open(name) as file:
+                rows = READERS[file_format](file, model)
+                try:
+                    getattr(importer, 'import_' + model._meta.model_name)(rows)
+                except (KeyError, TypeError, ElementTree.ParseError, UnicodeDecodeError) as error:
+                    raise ImportDataError("{} is not a file exported by the application ({}: {})"
+                                          .format(name, type(error).__name__, error))
+        importer.finish()
+    return importer.counts
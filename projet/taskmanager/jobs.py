@@ -0,0 +1,210 @@
+# python modules
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+# django modules
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+# models
+from .models import ExportJob, Task, Journal, Status
+
+# export
+from .export import export_querysets, export_manifest, zip_stream
+
+# replica
+from .replica import read_from_replica, snapshot_time, using_replica
+
+
+# The fields of the ExportDataForm used to select the data to export, in the order of the export_querysets arguments
+EXPORT_MODELS = ('projects', 'projects_members', 'tasks', 'journals', 'status')
+
+# Protect the creation of the jobs and the pending jobs dictionary, so that two identical requests made at the same
+# time end in one job
+_lock = threading.Lock()
+# key -> id of the jobs waiting or running in this process
+_pending = {}
+_executor = None
+
+
+def get_executor():
+    """Return the pool of threads running the exports, created the first time it is needed
+
+    The jobs left unfinished by the previous run of the process are not cleaned there: the other processes may be
+    running theirs, see clean_exports
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.EXPORT_WORKERS, thread_name_prefix='export')
+    return _executor
+
+
+def data_version(user):
+    """Summary of the data the user can export. It changes whenever an object is added, removed or modified
+
+    The names of the statuses and the users are written in the archives (natural keys): their changes increment the
+    versions of the projects showing them (see models.py), and the statuses are given with their names
+
+    :param user:
+    :return: a tuple of the number of objects, the biggest id, the last modification and the sum of the versions of the
+    exportable data
+    """
+    projects = user.projets.all()
+    return (
+        tuple(projects.aggregate(Count('id', distinct=True), Max('id'), Count('members'),
+                                 Max('last_modification'), Sum('version')).values()),
+        tuple(Task.objects.filter(projet__in=projects).aggregate(Count('id'), Max('id'),
+                                                                 Max('last_modification')).values()),
+        tuple(Journal.objects.filter(task__projet__in=projects).aggregate(Count('id'), Max('id')).values()),
+        tuple(Status.objects.order_by('id').values_list('id', 'name')),
+    )
+
+
+def export_key(user, selection, file_format, compress, since=None):
+    """Key identifying an export: two exports with the same key give the same zip file (but the watermark)"""
+    key = repr((user.id, tuple(selection), file_format, compress, since, data_version(user)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def submit_export(user, selection, file_format, compress=True, since=None, replica=True):
+    """Start an export in background
+
+    If the same export (same user, data selection, format, watermark and unchanged data) is already pending or
+    running, or has already been done, that job is returned instead of starting a new one.
+
+    :param user: the user asking for the export
+    :param selection: the names of the ticked fields of the ExportDataForm (see EXPORT_MODELS)
+    :param file_format: among csv, json, xml, xls (MS-Excel)
+    :param compress: whether the files of the zip archive are compressed
+    :param since: the watermark of a previous export for a delta export, None to export everything
+    :param replica: whether the data is read from the replica database (False when the user has just written, see
+    replica.recently_written)
+    :return: the ExportJob
+    """
+    selection = [name for name in EXPORT_MODELS if name in selection]
+    # the data of the export decides the key
+    with read_from_replica(replica):
+        key = export_key(user, selection, file_format, compress, since)
+
+    with _lock:
+        if key in _pending:
+            return ExportJob.objects.get(id=_pending[key])
+
+        # pending or running in another process, unless it has been interrupted (see clean_exports)
+        job = ExportJob.objects.filter(
+            user=user, key=key, status__in=[ExportJob.PENDING, ExportJob.RUNNING],
+            created__gte=timezone.now() - timedelta(seconds=settings.EXPORT_TIMEOUT)).order_by('-id').first()
+        if job is not None:
+            return job
+
+        job = ExportJob.objects.filter(user=user, key=key, status=ExportJob.DONE).order_by('-id').first()
+        if job is not None and os.path.exists(job.file_path):
+            return job
+
+        job = ExportJob.objects.create(user=user, key=key, selection=','.join(selection), file_format=file_format,
+                                       compress=compress, since=since)
+        _pending[key] = job.id
+
+    if settings.EXPORT_WORKERS:
+        get_executor().submit(run_export_thread, job.id, replica)
+    else:
+        # no background threads, the export is made during the request
+        run_export(job.id, replica)
+    return job
+
+
+def run_export(job_id, replica=False):
+    """Write the zip file of an export job
+
+    :param job_id:
+    :param replica: whether the data is read from the replica database
+    """
+    job = ExportJob.objects.select_related('user').get(id=job_id)
+    job.status = ExportJob.RUNNING
+    job.save(update_fields=['status'])
+
+    # the file is written under a temporary name so that an unfinished file is never downloaded
+    temp_path = job.file_path + '.part'
+    try:
+        selection = job.selection.split(',')
+        with read_from_replica(replica):
+            # the replica has what has been written before its last snapshot
+            watermark = snapshot_time() if using_replica() else timezone.now()
+            querysets = export_querysets(job.user, *[name in selection for name in EXPORT_MODELS], since=job.since)
+            manifest = export_manifest(job.user, watermark, job.since)
+
+            os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+            with open(temp_path, 'wb') as output:
+                for data in zip_stream(querysets, job.file_format, job.compress, manifest):
+                    output.write(data)
+            os.replace(temp_path, job.file_path)
+
+        job.status = ExportJob.DONE
+    except Exception as error:
+        job.status = ExportJob.FAILED
+        job.error = str(error)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    finally:
+        job.finished = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished'])
+        with _lock:
+            _pending.pop(job.key, None)
+
+
+def run_export_thread(job_id, replica=False):
+    """Run an export job in a thread of the executor"""
+    try:
+        run_export(job_id, replica)
+    finally:
+        # the thread has its own connections to the databases
+        connections.close_all()
+
+
+def clean_exports():
+    """Mark the interrupted jobs as failed and delete the old exports
+
+    The jobs waiting or running for more than EXPORT_TIMEOUT seconds, but the ones of this process and the ones whose
+    file has been written during the last EXPORT_TIMEOUT seconds (running in another process), have been interrupted
+    by the end of their process. Run by the clean_exports command only. The jobs finished for more than EXPORT_RETENTION seconds are deleted with
+    their zip file, and so are the files of EXPORT_ROOT as old which belong to no job (left by an interrupted job).
+
+    :return: the number of jobs marked as failed and the number of jobs deleted
+    """
+    now = timezone.now()
+    deadline = now - timedelta(seconds=settings.EXPORT_TIMEOUT)
+    with _lock:
+        running = list(_pending.values())
+    unfinished = ExportJob.objects.filter(status__in=[ExportJob.PENDING, ExportJob.RUNNING])
+    interrupted = [job.id for job in unfinished.filter(created__lt=deadline).exclude(id__in=running).only('id')
+                   if not written_since(job.file_path + '.part', deadline)]
+    failed = unfinished.filter(id__in=interrupted).update(status=ExportJob.FAILED,
+                                                          error="The export has been interrupted", finished=now)
+
+    old_jobs = ExportJob.objects.filter(finished__lt=now - timedelta(seconds=settings.EXPORT_RETENTION))
+    deleted = 0
+    for job in old_jobs.only('id'):
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        deleted += 1
+    old_jobs.delete()
+
+    if os.path.isdir(settings.EXPORT_ROOT):
+        job_files = {os.path.basename(job.file_path) for job in ExportJob.objects.only('id')}
+        for name in os.listdir(settings.EXPORT_ROOT):
+            path = os.path.join(settings.EXPORT_ROOT, name)
+            if name not in job_files and os.path.getmtime(path) < time.time() - settings.EXPORT_RETENTION:
+                os.remove(path)
+    return failed, deleted
+
+
+def written_since(path, moment):
+    """Whether a file exists and has been modified after a moment (a datetime)"""
+    return os.path.exists(path) and os.path.getmtime(path) >= moment.timestamp()
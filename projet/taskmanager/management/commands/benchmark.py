@@ -0,0 +1,246 @@
+# python modules
+import json
+import math
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+# django modules
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, reset_queries
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import resolve, reverse
+
+# models
+from taskmanager.models import Projet, Task, Journal, Status, ExportJob, project_counters, duration_class
+
+# export
+from taskmanager.jobs import EXPORT_MODELS
+
+# full text search
+from taskmanager.search import rebuild_index
+
+# replica
+from taskmanager.replica import REPLICA_DATABASE
+
+from .explain_queries import view_urls
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    values = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = "Measure the pages and the exports of the taskmanager app on a generated dataset. The dataset is built in " \
+           "a test database, the real database is not used. The results (latency percentiles in ms and number of " \
+           "queries) are written as JSON and can be compared with a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=20, help="Number of projects")
+        parser.add_argument('--tasks', type=int, default=2000, help="Number of tasks (spread over the projects)")
+        parser.add_argument('--journals', type=int, default=10000, help="Number of journals (spread over the tasks)")
+        parser.add_argument('--users', type=int, default=50, help="Number of users")
+        parser.add_argument('--members', type=int, default=10, help="Number of members of each project")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the dataset generator")
+        parser.add_argument('--repeat', type=int, default=10, help="Number of measures of each page")
+        parser.add_argument('--output', help="Write the results in this file instead of the standard output")
+        parser.add_argument('--baseline', help="Compare the results with this file (written by a previous run)")
+        parser.add_argument('--tolerance', type=float, default=20,
+                            help="Percentage of latency increase reported as a regression")
+
+    def seed(self, options):
+        """Generate the dataset. The same options always give the same dataset"""
+        generator = random.Random(options['seed'])
+        today = date.today()
+
+        User.objects.bulk_create([User(username='user_{}'.format(i)) for i in range(options['users'])])
+        users = list(User.objects.order_by('id'))
+        # the staff pages (metrics, import) are requested too
+        user = users[0]
+        user.is_staff = True
+        user.save(update_fields=['is_staff'])
+
+        statuses = [Status.objects.create(name=name) for name in ('New', 'In progress', 'Finished')]
+
+        Projet.objects.bulk_create([Projet(name='project_{}'.format(i)) for i in range(options['projects'])])
+        projects = list(Projet.objects.order_by('id'))
+
+        # the first user is member of every project, he/she is the one requesting the pages
+        members = []
+        for project in projects:
+            project_members = {user} | set(generator.sample(users, min(options['members'], len(users))))
+            members += [Projet.members.through(projet=project, user=member) for member in project_members]
+        Projet.members.through.objects.bulk_create(members)
+        project_members = {}
+        for member in members:
+            project_members.setdefault(member.projet_id, []).append(member.user)
+
+        tasks = []
+        for i in range(options['tasks']):
+            project = projects[i % len(projects)]
+            start_date = today + timedelta(days=generator.randint(-180, 180))
+            due_date = start_date + timedelta(days=generator.randint(0, 60))
+            tasks.append(Task(name='task_{}'.format(i), projet=project, description='description of task {}'.format(i),
+                              assignee=generator.choice(project_members[project.id]),
+                              start_date=start_date, due_date=due_date,
+                              duration_class=duration_class(start_date, due_date),
+                              priority=generator.randint(1, 10), status=generator.choice(statuses),
+                              completion_percentage=generator.randint(0, 100)))
+        Task.objects.bulk_create(tasks)
+        tasks = list(Task.objects.order_by('id').values_list('id', 'projet_id'))
+
+        journals = []
+        for i in range(options['journals']):
+            task_id, project_id = generator.choice(tasks)
+            journals.append(Journal(entry='entry {}'.format(i), author=generator.choice(project_members[project_id]),
+                                    task_id=task_id))
+        Journal.objects.bulk_create(journals)
+
+        # bulk_create does not send the signals updating the counters of the projects and the search index
+        Projet.objects.update(**project_counters())
+        rebuild_index()
+
+        return user, statuses
+
+    def cases(self, user, statuses):
+        """Return the list of the measured cases: (name, function making the request)"""
+        client = Client()
+        client.force_login(user)
+
+        project = user.projets.order_by('id').first()
+        today = date.today()
+        # a filter of the project page with an OR block
+        nested_filter = '?input_or-1=&2=and&2=assign&2={}&3=or&3=status&3={}&input_end_or-1=&4=and&4=end_after&4={}' \
+            .format(user.id, statuses[0].id, today)
+
+        urls = view_urls(user) + [
+            ('project (nested filter)', reverse('project', args=[project.id]) + nested_filter),
+            ('redirect', reverse('redirect')),
+            ('signup', reverse('signup')),
+            ('new_project', reverse('new_project')),
+            ('select-data', reverse('select-data')),
+            ('import-data', reverse('import-data')),
+        ]
+        cases = [(name, lambda url=url: client.get(url)) for name, url in urls]
+
+        def export(file_format, compress=True):
+            """Ask for an export of all the data of the user, made during the request (EXPORT_WORKERS = 0)"""
+            # otherwise the export already made would be returned
+            ExportJob.objects.filter(user=user, file_format=file_format, compress=compress).delete()
+            data = dict.fromkeys(EXPORT_MODELS, 'on')
+            data['file_format'] = file_format
+            if compress:
+                data['compress'] = 'on'
+            response = client.post(reverse('select-data'), data)
+            return resolve(response.url).kwargs['job_id']
+
+        # the page and the file of an export
+        job_id = export('json', compress=False)
+        cases += [
+            ('export_job', lambda: client.get(reverse('export_job', args=[job_id]))),
+            ('export_download', lambda: b''.join(
+                client.get(reverse('export_download', args=[job_id])).streaming_content)),
+        ]
+
+        # every export format
+        for file_format in ('csv', 'json', 'xml', 'xls'):
+            cases.append(('export ({})'.format(file_format), lambda file_format=file_format: export(file_format)))
+
+        # the writes are measured last, they add journals and tasks to the dataset
+        bulk_data = {'2': ['and', 'assign', user.id], 'priority': 5}
+        cases.append(('bulk_tasks', lambda: client.post(reverse('bulk_tasks', args=[project.id]), bulk_data)))
+        archive = b''.join(client.get(reverse('export_download', args=[job_id])).streaming_content)
+        cases.append(('import (json)', lambda: client.post(reverse('import-data'), {
+            'archive': SimpleUploadedFile('data.zip', archive, content_type='application/zip')})))
+
+        # the metrics of the requests above
+        cases.append(('metrics', lambda: client.get(reverse('metrics'))))
+        return cases
+
+    def measure(self, cases, repeat):
+        results = {}
+        for name, request in cases:
+            durations = []
+            queries = []
+            for i in range(repeat):
+                # the query log is bounded: once full, the captured queries could not be counted
+                reset_queries()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    request()
+                    durations.append((time.perf_counter() - start) * 1000)
+                queries.append(len(captured))
+
+            results[name] = {
+                'p50': round(percentile(durations, 50), 3),
+                'p90': round(percentile(durations, 90), 3),
+                'p99': round(percentile(durations, 99), 3),
+                'queries': max(queries),
+            }
+            self.stderr.write("{}: {p50} ms, {queries} queries".format(name, **results[name]))
+        return results
+
+    def compare(self, results, baseline, tolerance):
+        """Write the differences with the baseline. Return the number of regressions"""
+        regressions = 0
+        for name, result in results.items():
+            if name not in baseline['results']:
+                continue
+            reference = baseline['results'][name]
+            change = (result['p50'] - reference['p50']) / reference['p50'] * 100 if reference['p50'] else 0
+            regression = change > tolerance or result['queries'] > reference['queries']
+            regressions += regression
+            line = "{}: p50 {} -> {} ms ({:+.1f} %), queries {} -> {}".format(
+                name, reference['p50'], result['p50'], change, reference['queries'], result['queries'])
+            self.stderr.write(self.style.ERROR(line) if regression else line)
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['projects'] < 1 or options['users'] < 1:
+            raise CommandError("At least one project and one user are needed")
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        # the dataset is generated in a test database, the exports are written in a temporary folder
+        setup_test_environment()
+        export_root = tempfile.mkdtemp()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # the replica reads the test database too
+        connections[REPLICA_DATABASE].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            # the exports are made during the requests, so that their queries are counted
+            with override_settings(EXPORT_ROOT=export_root, EXPORT_WORKERS=0):
+                user, statuses = self.seed(options)
+                results = self.measure(self.cases(user, statuses), options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(export_root, ignore_errors=True)
+            teardown_test_environment()
+
+        dataset = {name: options[name] for name in ('projects', 'tasks', 'journals', 'users', 'members', 'seed')}
+        report = json.dumps({'dataset': dataset, 'repeat': options['repeat'], 'results': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        if baseline is not None:
+            if baseline['dataset'] != dataset:
+                self.stderr.write(self.style.WARNING("The baseline has been measured on another dataset"))
+            regressions = self.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("{} regression(s) compared with the baseline".format(regressions))
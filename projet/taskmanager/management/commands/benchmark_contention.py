@@ -0,0 +1,172 @@
+# python modules
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# django modules
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.db.models import Count, Max
+from django.test.utils import override_settings
+
+# models
+from taskmanager.models import Projet, Task, Journal
+
+# replica
+from taskmanager.replica import REPLICA_DATABASE, read_from_replica, snapshot_replica
+
+from .benchmark import Command as BenchmarkCommand, percentile
+
+# Interval (s) between the copies of the database to the replica with --replica
+SNAPSHOT_INTERVAL = 2
+
+
+class Command(BaseCommand):
+    help = "Measure the concurrent reads and writes of the SQLite database: reader threads read the pages of the " \
+           "projects while writer threads write journals and change the members of the projects. Each operation is " \
+           "handled like a request (the connection is closed at its end unless CONN_MAX_AGE keeps it). The number " \
+           "of operations per second, their latency percentiles (ms) and the 'database is locked' errors are " \
+           "written. Run it with and without --no-profile to compare the production profile of the database " \
+           "(SQLITE_PRAGMAS, CONN_MAX_AGE and the transaction_mode option) with the default SQLite configuration, " \
+           "and with --replica to compare the readers reading a copy of the database (see taskmanager/replica.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help="Number of reader threads")
+        parser.add_argument('--writers', type=int, default=4, help="Number of writer threads")
+        parser.add_argument('--duration', type=float, default=10, help="Duration of the test (s)")
+        parser.add_argument('--no-profile', action='store_true',
+                            help="Use the default SQLite configuration: no pragmas, one connection per operation")
+        parser.add_argument('--replica', action='store_true',
+                            help="The readers read the replica, copied from the database every {} s".format(
+                                SNAPSHOT_INTERVAL))
+
+    def read(self, generator, projects, user):
+        """The queries of the project page and the statistics of a project"""
+        project = generator.choice(projects)
+        list(Task.objects.filter(projet_id=project).select_related('status', 'assignee')
+             .order_by('-priority', '-id')[:50])
+        Task.objects.filter(projet_id=project).aggregate(Count('id'), Max('last_modification'))
+        list(user.projets.values_list('id', 'version'))
+
+    def write(self, generator, projects, tasks, users):
+        """A journal written on a task (see views.task_view), or a member leaving and coming back to a project"""
+        if generator.random() < 0.8:
+            task = Task.objects.get(id=generator.choice(tasks))
+            Journal.objects.create(entry='contention', author_id=task.assignee_id or users[0], task=task)
+            task.save(update_fields=['last_modification'])
+        else:
+            project = Projet.objects.get(id=generator.choice(projects))
+            member = project.members.exclude(id=users[0]).first()
+            if member is not None:
+                project.members.remove(member)
+                project.members.add(member)
+
+    def worker(self, operation, deadline, results):
+        """Repeat an operation until the deadline, record (latency, error)"""
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            error = None
+            try:
+                operation()
+            except OperationalError as exception:
+                error = str(exception)
+            results.append((time.perf_counter() - start, error))
+            # the end of a request
+            close_old_connections()
+        connections.close_all()
+
+    def snapshots(self, deadline, results):
+        """Copy the database to the replica every SNAPSHOT_INTERVAL seconds until the deadline, record the durations"""
+        while time.perf_counter() + SNAPSHOT_INTERVAL < deadline:
+            time.sleep(SNAPSHOT_INTERVAL)
+            start = time.perf_counter()
+            snapshot_replica()
+            results.append(time.perf_counter() - start)
+        connections.close_all()
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This benchmark is made for SQLite")
+
+        # a database file: the in-memory test database does not have the journal modes of a real one
+        database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        replica_database = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+        replica = connections[REPLICA_DATABASE]
+        old_name = connection.settings_dict['NAME']
+        connection.settings_dict['TEST']['NAME'] = database
+        replica.settings_dict['NAME'] = replica_database
+        profile = {}
+        if options['no_profile']:
+            profile = {'SQLITE_PRAGMAS': {}}
+        try:
+            with override_settings(**profile):
+                if options['no_profile']:
+                    connection.settings_dict['CONN_MAX_AGE'] = 0
+                    connection.settings_dict['OPTIONS'] = {}
+                    replica.settings_dict['CONN_MAX_AGE'] = 0
+                    replica.settings_dict['OPTIONS'] = {}
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            replica.close()
+            for name in (database, replica_database):
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(name + suffix):
+                        os.remove(name + suffix)
+
+    def run(self, options):
+        dataset = {'projects': 20, 'tasks': 5000, 'journals': 20000, 'users': 50, 'members': 10, 'seed': 0}
+        user, statuses = BenchmarkCommand().seed(dataset)
+        projects = list(Projet.objects.values_list('id', flat=True))
+        tasks = list(Task.objects.values_list('id', flat=True))
+        users = [user.id]
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        if options['replica']:
+            snapshot_replica()
+        connections.close_all()
+
+        deadline = time.perf_counter() + options['duration']
+        reads, writes, snapshots = [], [], []
+        threads = []
+
+        def read(generator):
+            with read_from_replica(options['replica']):
+                self.read(generator, projects, user)
+
+        for i in range(options['readers']):
+            generator = random.Random(i)
+            threads.append(threading.Thread(target=self.worker, args=(
+                lambda generator=generator: read(generator), deadline, reads)))
+        for i in range(options['writers']):
+            generator = random.Random(-i)
+            threads.append(threading.Thread(target=self.worker, args=(
+                lambda generator=generator: self.write(generator, projects, tasks, users), deadline, writes)))
+        if options['replica']:
+            threads.append(threading.Thread(target=self.snapshots, args=(deadline, snapshots)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write("journal mode {}, CONN_MAX_AGE {}, OPTIONS {}, pragmas {}{}".format(
+            journal_mode, connection.settings_dict['CONN_MAX_AGE'], connection.settings_dict['OPTIONS'] or None,
+            settings.SQLITE_PRAGMAS or None, ", reads on the replica" if options['replica'] else ""))
+        if snapshots:
+            self.stdout.write("snapshots: {}, p50 {:.1f} ms".format(
+                len(snapshots), percentile([duration * 1000 for duration in snapshots], 50)))
+        for name, results in (('reads', reads), ('writes', writes)):
+            durations = [duration * 1000 for duration, error in results if error is None]
+            errors = Counter(error for duration, error in results if error is not None)
+            line = "{}: {:.1f} operations/s".format(name, len(durations) / options['duration'])
+            if durations:
+                line += ", p50 {:.1f} ms, p99 {:.1f} ms".format(percentile(durations, 50), percentile(durations, 99))
+            self.stdout.write(line)
+            for error, count in errors.items():
+                self.stdout.write(self.style.ERROR("{}: {} error(s) '{}'".format(name, count, error)))
@@ -0,0 +1,44 @@
+# python modules
+import time
+
+# django modules
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+# models
+from taskmanager.models import Projet, Task
+
+
+class Command(BaseCommand):
+    help = "Measure the time needed to add and remove many members to a project. Nothing is kept in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=5000, help="Number of members added and removed")
+        parser.add_argument('--tasks', type=int, default=1000, help="Number of tasks of the project")
+
+    def measure(self, name, function):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            duration = time.perf_counter() - start
+        self.stdout.write("{}: {:.3f} s, {} queries".format(name, duration, len(queries)))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Build a project whose tasks are assigned to the members to be removed
+            User.objects.bulk_create([User(username='benchmark_member_{}'.format(i))
+                                      for i in range(options['members'])])
+            users = list(User.objects.filter(username__startswith='benchmark_member_'))
+            project = Projet.objects.create(name='benchmark')
+            Task.objects.bulk_create([Task(name='benchmark_task_{}'.format(i), projet=project,
+                                           assignee=users[i % len(users)]) for i in range(options['tasks'])])
+
+            self.measure("add {} members".format(len(users)), lambda: project.members.add(*users))
+            self.measure("remove {} members".format(len(users)), lambda: project.members.remove(*users))
+            self.measure("add {} members again".format(len(users)), lambda: project.members.add(*users))
+            self.measure("delete the project", project.delete)
+
+            # Do not keep anything
+            transaction.set_rollback(True)
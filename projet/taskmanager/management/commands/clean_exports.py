@@ -0,0 +1,15 @@
+# django modules
+from django.core.management.base import BaseCommand
+
+# jobs
+from taskmanager.jobs import clean_exports
+
+
+class Command(BaseCommand):
+    help = "Mark the interrupted export jobs as failed and delete the exports finished for more than EXPORT_RETENTION " \
+           "seconds with their zip files (see taskmanager/jobs.py)"
+
+    def handle(self, *args, **options):
+        failed, deleted = clean_exports()
+        self.stdout.write(self.style.SUCCESS("{} interrupted export(s) marked as failed, {} old export(s) deleted".format(
+            failed, deleted)))
@@ -0,0 +1,124 @@
+# python modules
+from datetime import date, timedelta
+
+# django modules
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+# replica
+from taskmanager.replica import read_from_primary
+
+
+def view_urls(user):
+    """Return the urls of the pages (GET) of the taskmanager app, for the first project and task of the user
+
+    :param user:
+    :return: a list of (url name, url)
+    """
+    project = user.projets.order_by('id').first()
+    if project is None:
+        raise CommandError("The user {} is not member of any project".format(user))
+    task = project.task_set.order_by('id').first()
+
+    # a filter of the project page: the tasks to be done during the next month
+    today = date.today()
+    project_filter = '?1=and&1=end_after&1={}&2=and&2=start_before&2={}'.format(today, today + timedelta(days=30))
+
+    urls = [
+        ('projects', reverse('projects')),
+        ('edit_project', reverse('edit_project', args=[project.id])),
+        ('project', reverse('project', args=[project.id])),
+        ('project (filtered)', reverse('project', args=[project.id]) + project_filter),
+        ('newtask', reverse('newtask', args=[project.id])),
+        ('myprofile', reverse('myprofile')),
+        ('taches_assignees', reverse('taches_assignees')),
+        ('taches_terminees', reverse('taches_terminees')),
+        ('taches_projets', reverse('taches_projets')),
+        ('taches_recents_home', reverse('taches_recents_home')),
+        ('taches_recents', reverse('taches_recents', args=[project.id])),
+        ('search', reverse('search') + '?q=task'),
+        ('api_project_tasks', reverse('api_project_tasks', args=[project.id])),
+        ('api_user_tasks', reverse('api_user_tasks', args=[user.id])),
+        ('api_project_timeline', reverse('api_project_timeline', args=[project.id])),
+        ('api_user_timeline', reverse('api_user_timeline', args=[user.id])),
+    ]
+    if task is not None:
+        urls += [
+            ('task', reverse('task', args=[task.id])),
+            ('edittask', reverse('edittask', args=[task.id])),
+        ]
+    return urls
+
+
+class Command(BaseCommand):
+    help = "Print the SQLite query plan of the queries of each page of the taskmanager app, without and with the " \
+           "indexes of the app models. Nothing is kept in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="The pages are displayed for this user")
+
+    def explain(self, client, urls):
+        for name, url in urls:
+            # the query log is bounded: once full, the queries of the page could not be captured
+            reset_queries()
+            # the read only pages would read from the replica (see replica.py), whose queries are not captured and which
+            # has its own indexes
+            with CaptureQueriesContext(connection) as queries, read_from_primary():
+                client.get(url)
+
+            self.stdout.write(self.style.MIGRATE_HEADING("{} ({})".format(name, url)))
+            explained = set()
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or sql in explained:
+                    continue
+                explained.add(sql)
+
+                self.stdout.write("  " + sql)
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                    for row in cursor.fetchall():
+                        self.stdout.write("    " + row[-1])
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("This command only works with SQLite")
+
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError("The user {} does not exist".format(options['username']))
+
+        # the indexes declared in the Meta of the models of the app
+        indexes = [index.name for model in apps.get_app_config('taskmanager').get_models()
+                   for index in model._meta.indexes]
+
+        # let the test client request the pages
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                client = Client()
+                client.force_login(user)
+                urls = view_urls(user)
+
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        for index in indexes:
+                            cursor.execute('DROP INDEX IF EXISTS "{}"'.format(index))
+                    self.stdout.write(self.style.SUCCESS("BEFORE: without the indexes {}".format(', '.join(indexes))))
+                    self.explain(client, urls)
+                    # put the indexes back
+                    transaction.set_rollback(True)
+
+                self.stdout.write(self.style.SUCCESS("AFTER: with the indexes"))
+                self.explain(client, urls)
+
+                # Do not keep the session
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
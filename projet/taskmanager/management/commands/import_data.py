@@ -0,0 +1,28 @@
+# django modules
+from django.core.management.base import BaseCommand, CommandError
+
+# import
+from taskmanager.importer import IMPORT_BATCH_SIZE, ImportDataError, import_archive
+
+
+class Command(BaseCommand):
+    help = "Import a zip archive made by the export of the taskmanager app (csv, json, xml or xls). The statuses, " \
+           "users and projects are matched by name, the tasks and the journals are created. Everything is imported " \
+           "in one transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help="The path of the data.zip file")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help="Number of objects inserted at once")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("The batch size must be positive")
+
+        try:
+            counts = import_archive(options['archive'], options['batch_size'])
+        except (OSError, ImportDataError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS("Imported: " + ", ".join(
+            "{} {}".format(count, name) for name, count in counts.items())))
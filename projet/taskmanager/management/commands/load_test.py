@@ -0,0 +1,189 @@
+# python modules
+import http.client
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+# django modules
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+# models
+from taskmanager.models import ExportJob
+
+# export
+from taskmanager.jobs import EXPORT_MODELS, run_export
+
+# replica
+from taskmanager.replica import REPLICA_DATABASE
+
+from .benchmark import Command as BenchmarkCommand, percentile
+
+
+# Size of the pieces read by the clients, and receive buffer of the slow clients so that the server cannot send them
+# much more than what they have read (like a client at the other end of a slow network)
+READ_SIZE = 8192
+SLOW_CLIENT_BUFFER = 16384
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkerPoolServer(WSGIServer):
+    """WSGI server handling the requests with a fixed number of threads, like the synchronous workers of a production
+    WSGI server: each request keeps a worker busy until its response has been sent to the client"""
+
+    def __init__(self, address, workers):
+        super().__init__(address, QuietRequestHandler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class Command(BaseCommand):
+    help = "Load test of the site served by a fixed number of synchronous workers. Concurrent clients request the " \
+           "statistics pages and the JSON API while slow clients download an export, during a given time. The " \
+           "number of requests per second and the latency percentiles (ms) of each page are written. Run it with " \
+           "and without --sendfile to compare the workers sending the export files with the web server sending " \
+           "them (EXPORT_SENDFILE_HEADER). The dataset is built in a test database, see the benchmark command"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Number of workers of the server")
+        parser.add_argument('--clients', type=int, default=8, help="Number of clients requesting the pages")
+        parser.add_argument('--slow-clients', type=int, default=4, help="Number of clients downloading the export")
+        parser.add_argument('--read-rate', type=int, default=256, help="Download speed of the slow clients (kB/s)")
+        parser.add_argument('--duration', type=float, default=10, help="Duration of the test (s)")
+        parser.add_argument('--sendfile', action='store_true',
+                            help="The export files are sent by the web server (only the headers are measured)")
+        parser.add_argument('--tasks', type=int, default=2000, help="Number of tasks of the dataset")
+        parser.add_argument('--journals', type=int, default=20000, help="Number of journals of the dataset")
+
+    def client(self, port, cookie, urls, deadline, read_delay, results):
+        """Request the urls one after the other until the deadline, and record (url name, latency, status)
+
+        :param read_delay: the time waited after reading each READ_SIZE bytes, for the slow clients
+        """
+        i = 0
+        while time.perf_counter() < deadline:
+            name, url = urls[i % len(urls)]
+            i += 1
+            start = time.perf_counter()
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            if read_delay:
+                conn.connect()
+                conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_CLIENT_BUFFER)
+            conn.request('GET', url, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            while response.read(READ_SIZE):
+                if read_delay:
+                    time.sleep(read_delay)
+                if time.perf_counter() > deadline:
+                    # the unfinished downloads are not counted
+                    break
+            else:
+                results.append((name, time.perf_counter() - start, response.status))
+            conn.close()
+
+    def handle(self, *args, **options):
+        export_root = tempfile.mkdtemp()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # the replica reads the test database too
+        connections[REPLICA_DATABASE].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['127.0.0.1'], EXPORT_ROOT=export_root,
+                                   EXPORT_SENDFILE_HEADER='X-Accel-Redirect' if options['sendfile'] else None):
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(export_root, ignore_errors=True)
+
+    def run(self, options):
+        dataset = {'projects': 20, 'tasks': options['tasks'], 'journals': options['journals'], 'users': 50,
+                   'members': 10, 'seed': 0}
+        user, statuses = BenchmarkCommand().seed(dataset)
+        project = user.projets.order_by('id').first()
+
+        # the export downloaded by the slow clients
+        job = ExportJob.objects.create(user=user, key='load_test', selection=','.join(EXPORT_MODELS),
+                                       file_format='json', compress=False)
+        run_export(job.id)
+        job.refresh_from_db()
+
+        client = Client()
+        client.force_login(user)
+        cookie = '{}={}'.format(settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+        pages = [
+            ('myprofile', reverse('myprofile')),
+            ('taches_projets', reverse('taches_projets')),
+            ('taches_recents_home', reverse('taches_recents_home')),
+            ('project', reverse('project', args=[project.id])),
+            ('api_user_tasks', reverse('api_user_tasks', args=[user.id])),
+        ]
+        downloads = [('export_download', reverse('export_download', args=[job.id]))]
+
+        server = WorkerPoolServer(('127.0.0.1', 0), options['workers'])
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        results = []
+        deadline = time.perf_counter() + options['duration']
+        port = server.server_address[1]
+        read_delay = READ_SIZE / (options['read_rate'] * 1024)
+        # the clients do not start with the same page
+        clients = [threading.Thread(target=self.client,
+                                    args=(port, cookie, pages[i % len(pages):] + pages[:i % len(pages)], deadline, 0,
+                                          results))
+                   for i in range(options['clients'])]
+        clients += [threading.Thread(target=self.client, args=(port, cookie, downloads, deadline, read_delay, results))
+                    for i in range(options['slow_clients'])]
+        try:
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        errors = sum(status != 200 for name, duration, status in results)
+        self.stdout.write("{} workers, {} clients, {} slow clients at {} kB/s, export of {} kB{}".format(
+            options['workers'], options['clients'], options['slow_clients'], options['read_rate'],
+            os.path.getsize(job.file_path) // 1024,
+            ", sent by the web server" if options['sendfile'] else ""))
+        for name, url in pages + downloads:
+            durations = [duration * 1000 for page, duration, status in results if page == name]
+            if durations:
+                self.stdout.write("{}: {:.1f} requests/s, p50 {:.1f} ms, p90 {:.1f} ms".format(
+                    name, len(durations) / options['duration'], percentile(durations, 50),
+                    percentile(durations, 90)))
+        pages_count = sum(name != 'export_download' for name, duration, status in results)
+        self.stdout.write(self.style.SUCCESS("pages: {:.1f} requests/s".format(pages_count / options['duration'])))
+        if errors:
+            self.stdout.write(self.style.ERROR("{} requests failed".format(errors)))
@@ -0,0 +1,18 @@
+# django modules
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+# full text search
+from taskmanager.search import rebuild_index, search_enabled
+
+
+class Command(BaseCommand):
+    help = "Index again all the tasks and the journals for the full text search (SQLite FTS5)"
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            raise CommandError("The full text search only works with SQLite")
+
+        with transaction.atomic():
+            task_count, journal_count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS("{} task(s) and {} journal(s) indexed".format(task_count, journal_count)))
@@ -0,0 +1,39 @@
+# django modules
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+# models
+from taskmanager.models import Projet, project_counters, next_version
+
+
+class Command(BaseCommand):
+    help = "Compute again the counters of the projects (tasks, finished tasks, completion and members) and repair the " \
+           "ones which have drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only display the drifted counters")
+
+    def handle(self, *args, **options):
+        counters = project_counters()
+
+        with transaction.atomic():
+            # Compare the counters with their real values in one query
+            real_values = {'real_' + name: expression for name, expression in counters.items()}
+            drifted = Q()
+            for name in counters:
+                drifted |= ~Q(**{name: F('real_' + name)})
+            projects = Projet.objects.annotate(**real_values).filter(drifted)
+
+            count = 0
+            for project in projects:
+                count += 1
+                self.stdout.write("{} ({}): ".format(project.name, project.id) + ", ".join(
+                    "{} {} -> {}".format(name, getattr(project, name), getattr(project, 'real_' + name))
+                    for name in counters if getattr(project, name) != getattr(project, 'real_' + name)))
+
+            if count and not options['dry_run']:
+                Projet.objects.filter(id__in=projects.values('id')).update(version=next_version(), **counters)
+
+        self.stdout.write(self.style.SUCCESS("{} project(s) with drifted counters{}".format(
+            count, "" if options['dry_run'] else " repaired")))
@@ -0,0 +1,34 @@
+# python modules
+import time
+
+# django modules
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# replica
+from taskmanager.replica import REPLICA_DATABASE, snapshot_replica
+
+
+class Command(BaseCommand):
+    help = "Copy the default SQLite database to the replica database (see taskmanager/replica.py) with the online " \
+           "backup API of SQLite, once or every --interval seconds. The site stays available during the copy"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Copy the database again every INTERVAL seconds, until interrupted (at most the "
+                                 "REPLICA_LAG setting)")
+
+    def handle(self, *args, **options):
+        if REPLICA_DATABASE not in connections.databases:
+            raise CommandError("There is no '{}' database in the DATABASES setting".format(REPLICA_DATABASE))
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite' or connections[REPLICA_DATABASE].vendor != 'sqlite':
+            raise CommandError("The replica is copied from a SQLite database to a SQLite database only")
+
+        while True:
+            start = time.perf_counter()
+            snapshot = snapshot_replica()
+            self.stdout.write(self.style.SUCCESS("Replica copied at {:%Y-%m-%d %H:%M:%S} in {:.2f} s".format(
+                snapshot, time.perf_counter() - start)))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,132 @@
+# python modules
+import re
+import threading
+from bisect import bisect_left
+
+
+# Upper bounds of the histograms buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# A statement executed at least this number of times during one request is reported as repeated (N+1 queries)
+REPEATED_QUERY_THRESHOLD = 5
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus way: number of observations under each bucket bound, sum and count"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        """Lines of the histogram in the Prometheus text format"""
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield '{}_bucket{} {}'.format(name, format_labels(labels + [('le', bound)]), cumulative)
+        yield '{}_sum{} {}'.format(name, format_labels(labels), self.sum)
+        yield '{}_count{} {}'.format(name, format_labels(labels), self.count)
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in labels) + '}'
+
+
+def fingerprint(sql):
+    """Normalize a SQL statement so that the executions of the same query give the same fingerprint
+
+    The parameters are already out of the statement (%s), only the length of the IN lists differs
+    """
+    return re.sub(r'IN \((%s, )*%s\)', 'IN (...)', sql)
+
+
+class ViewMetrics:
+    """The metrics of the requests of one view"""
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERIES_BUCKETS)
+        self.queries_duration = Histogram(DURATION_BUCKETS)
+        self.repeated_requests = 0
+        # fingerprint -> biggest number of executions during one request
+        self.repeated_queries = {}
+
+
+class MetricsRegistry:
+    """In-process metrics of the requests, by view. Shared by the threads of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, duration, queries_count, queries_duration, statements):
+        """Record a request
+
+        :param view: the name of the url of the request
+        :param duration: the wall time of the request (s)
+        :param queries_count: the number of SQL queries
+        :param queries_duration: the time spent in the SQL queries (s)
+        :param statements: a dictionary fingerprint -> number of executions during the request
+        """
+        repeated = {sql: count for sql, count in statements.items() if count >= REPEATED_QUERY_THRESHOLD}
+        with self._lock:
+            metrics = self._views.setdefault(view, ViewMetrics())
+            metrics.duration.observe(duration)
+            metrics.queries.observe(queries_count)
+            metrics.queries_duration.observe(queries_duration)
+            if repeated:
+                metrics.repeated_requests += 1
+                for sql, count in repeated.items():
+                    metrics.repeated_queries[sql] = max(count, metrics.repeated_queries.get(sql, 0))
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def render(self):
+        """Return all the metrics in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            views = sorted(self._views.items())
+
+            def add_histograms(name, attribute, description):
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} histogram'.format(name))
+                for view, metrics in views:
+                    lines.extend(getattr(metrics, attribute).samples(name, [('view', view)]))
+
+            add_histograms('taskmanager_request_duration_seconds', 'duration', "Wall time of the requests")
+            add_histograms('taskmanager_request_queries', 'queries', "Number of SQL queries of the requests")
+            add_histograms('taskmanager_request_queries_duration_seconds', 'queries_duration',
+                           "Time spent in the SQL queries of the requests")
+
+            lines.append('# HELP taskmanager_repeated_queries_requests_total Requests executing the same statement '
+                         'at least {} times'.format(REPEATED_QUERY_THRESHOLD))
+            lines.append('# TYPE taskmanager_repeated_queries_requests_total counter')
+            for view, metrics in views:
+                lines.append('taskmanager_repeated_queries_requests_total{} {}'.format(
+                    format_labels([('view', view)]), metrics.repeated_requests))
+
+            lines.append('# HELP taskmanager_repeated_query_max Biggest number of executions of a repeated '
+                         'statement during one request')
+            lines.append('# TYPE taskmanager_repeated_query_max gauge')
+            for view, metrics in views:
+                for sql, count in sorted(metrics.repeated_queries.items()):
+                    lines.append('taskmanager_repeated_query_max{} {}'.format(
+                        format_labels([('view', view), ('query', sql)]), count))
+
+        return '\n'.join(lines) + '\n'
+
+
+# The metrics of the process
+registry = MetricsRegistry()
@@ -0,0 +1,75 @@
+# python modules
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+# django modules
+from django.db import connections
+
+# metrics
+from .metrics import registry, fingerprint
+
+# replica
+from .replica import LAST_WRITE_SESSION_KEY, request_has_written, start_request
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing the queries of a request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[fingerprint(sql)] += 1
+
+
+class QueryMetricsMiddleware:
+    """Record the wall time and the SQL queries of each request, by url name, in the metrics registry
+
+    The metrics can be read in the Prometheus text format on the metrics page (see views.metrics_view)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # the url name is only known once the url has been resolved
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is not None and resolver_match.url_name:
+            view = resolver_match.url_name
+        else:
+            view = 'unknown'
+
+        registry.record(view, duration, recorder.count, recorder.duration, recorder.statements)
+        return response
+
+
+class ReadAfterWriteMiddleware:
+    """Remember in the session the time of the last write of the user in the database, so that the next requests read
+    from the default database instead of the replica for a while (see replica.recently_written)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_request()
+        response = self.get_response(request)
+        if request_has_written():
+            request.session[LAST_WRITE_SESSION_KEY] = time.time()
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0002_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['task', 'date'], name='journal_task_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['projet', 'priority'], name='task_projet_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assignee', 'status'], name='task_assignee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['projet', 'last_modification'], name='task_projet_last_mod_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['projet', 'start_date'], name='task_projet_start_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['projet', 'due_date'], name='task_projet_due_date_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:29
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_projects(apps, schema_editor):
+    """Initialize the counters of the existing projects"""
+    Projet = apps.get_model('taskmanager', 'Projet')
+    Task = apps.get_model('taskmanager', 'Task')
+
+    tasks = Task.objects.filter(projet=OuterRef('pk')).order_by().values('projet')
+    members = Projet.members.through.objects.filter(projet=OuterRef('pk')).order_by().values('projet')
+
+    def subquery(queryset, aggregate):
+        return Coalesce(Subquery(queryset.annotate(value=aggregate).values('value'), output_field=IntegerField()), 0)
+
+    Projet.objects.update(
+        task_count=subquery(tasks, Count('id')),
+        finished_count=subquery(tasks.filter(status__name='Finished'), Count('id')),
+        completion_sum=subquery(tasks, Sum('completion_percentage')),
+        member_count=subquery(members, Count('user')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projet',
+            name='completion_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projet',
+            name='finished_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projet',
+            name='member_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projet',
+            name='task_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_projects, migrations.RunPython.noop),
+    ]
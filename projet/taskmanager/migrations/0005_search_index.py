@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_search_tables(apps, schema_editor):
+    """Create the FTS5 tables of the full text search (see search.py) and index the existing tasks and journals"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("CREATE VIRTUAL TABLE taskmanager_task_search USING fts5(name, description, "
+                          "prefix='2 3', tokenize='unicode61 remove_diacritics 1')")
+    schema_editor.execute("CREATE VIRTUAL TABLE taskmanager_journal_search USING fts5(entry, "
+                          "prefix='2 3', tokenize='unicode61 remove_diacritics 1')")
+    schema_editor.execute("INSERT INTO taskmanager_task_search (rowid, name, description) "
+                          "SELECT id, name, COALESCE(description, '') FROM taskmanager_task")
+    schema_editor.execute("INSERT INTO taskmanager_journal_search (rowid, entry) "
+                          "SELECT id, entry FROM taskmanager_journal")
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE taskmanager_task_search")
+    schema_editor.execute("DROP TABLE taskmanager_journal_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0004_project_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('taskmanager', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projet',
+            name='last_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='last_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('projet', 'Project'), ('task', 'Task'), ('journal', 'Journal')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('projet_id', models.IntegerField(blank=True, null=True)),
+                ('deleted', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0006_delta_export'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projet',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0007_project_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assignee', 'last_modification'], name='task_assignee_last_mod_idx'),
+        ),
+    ]
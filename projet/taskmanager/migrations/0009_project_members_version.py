@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0008_task_api_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projet',
+            name='members_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
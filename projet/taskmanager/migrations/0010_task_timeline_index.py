@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+def classify_tasks(apps, schema_editor):
+    """Initialize the class of the duration of the existing tasks (see models.duration_class)"""
+    Task = apps.get_model('taskmanager', 'Task')
+
+    classes = {}
+    for task_id, start_date, due_date in Task.objects.values_list('id', 'start_date', 'due_date').iterator():
+        classes.setdefault(max((due_date - start_date).days, 0).bit_length(), []).append(task_id)
+    for duration_class, task_ids in classes.items():
+        # the number of parameters of a query is limited
+        for start in range(0, len(task_ids), 500):
+            Task.objects.filter(id__in=task_ids[start:start + 500]).update(duration_class=duration_class)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0009_project_members_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='duration_class',
+            field=models.SmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(classify_tasks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['projet', 'duration_class', 'start_date'], name='task_projet_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assignee', 'duration_class', 'start_date'], name='task_assignee_timeline_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskmanager', '0010_task_timeline_index'),
+    ]
+
+    operations = [
+        # the default is not written in the database schema, the journal table does not need to be rebuilt
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='journal',
+                name='date',
+                field=models.DateTimeField(default=django.utils.timezone.now, editable=False,
+                                           verbose_name='Date de parution'),
+            ),
+        ]),
+    ]
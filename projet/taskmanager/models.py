@@ -1,28 +1,96 @@
 # python modules
+import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import date
 
 # django modules
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models, transaction
 from django.contrib.auth.models import User, Group, Permission
 from django.core.exceptions import ValidationError
 from django.dispatch import receiver
-from django.db.models.signals import m2m_changed, pre_delete
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
+from django.utils import timezone
+
+# permissions
+from .backends import forget_project_ids
+
+# full text search
+from .search import index_task, index_journal, unindex_project, unindex_task
+
+
+class ProjetQuerySet(models.QuerySet):
+    def delete(self):
+        with deleting_projects(self.values_list('id', flat=True)):
+            return super().delete()
 
 
 class Projet(models.Model):
     name = models.CharField(max_length=100)
     members = models.ManyToManyField(User, related_name='projets')
 
+    # Statistics of the project, kept up to date by the signals of the tasks and the members (see below). The
+    # reconcile_counters command computes them again if they ever drift
+    task_count = models.IntegerField(default=0, editable=False)
+    finished_count = models.IntegerField(default=0, editable=False)
+    completion_sum = models.IntegerField(default=0, editable=False)
+    member_count = models.IntegerField(default=0, editable=False)
+    # the name or the members have changed (the counters do not count as a modification)
+    last_modification = models.DateTimeField(auto_now=True)
+    # incremented by every change of the project, its members, its tasks or their journals: the cached fragments of the
+    # pages showing the project are identified by it (see fragments.py)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # incremented by every change of the members or of their names only: the cached choices of the assignee of the
+    # tasks are identified by it (see forms.member_choices)
+    members_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProjetQuerySet.as_manager()
+
+    # Fields written only by the update() of the signals: the values of an instance read before them are out of date
+    COUNTER_FIELDS = ('task_count', 'finished_count', 'completion_sum', 'member_count')
+    SIGNAL_FIELDS = COUNTER_FIELDS + ('members_version',)
+
     def __str__(self):
         return self.name
 
+    def delete(self, *args, **kwargs):
+        with deleting_projects([self.id]):
+            return super().delete(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        """Save the project without writing back the counters and the members version, kept up to date by the database
+        (see below)
+
+        They are saved for an existing project only if they are given in update_fields
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.SIGNAL_FIELDS]
+        super().save(*args, **kwargs)
+
+    @property
+    def completion_percentage(self):
+        """The mean of the completion percentage of the tasks of the project"""
+        if self.task_count > 0:
+            return self.completion_sum / self.task_count
+        return 0
+
     # this is used to make the django json and xml serializer write the primary key natural value (the name of the
     # project) instead of the ID number
     def natural_key(self):
         return self.name
 
 
+# Name of the status of the finished tasks
+FINISHED_STATUS = 'Finished'
+
+
 class Status(models.Model):
     name = models.CharField(max_length=30, unique=True)  # not possible to duplicate a status
 
@@ -37,6 +105,75 @@ class Status(models.Model):
         return self.name
 
 
+class StatusRegistry:
+    """In-process cache of the statuses, a small table which almost never changes. Shared by the threads of the process
+
+    The statuses are read with one query, then kept STATUS_REGISTRY_TIMEOUT seconds. They are read again after a
+    status has been saved or deleted in the process (see the signals below), or when an unknown id is asked for.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # id -> Status, name -> id
+        self._by_id = None
+        self._by_name = None
+        self._loaded = 0
+
+    def _load(self, reload=False):
+        with self._lock:
+            if reload or self._by_id is None or time.monotonic() - self._loaded > settings.STATUS_REGISTRY_TIMEOUT:
+                # the primary database: a status that has just been created may not be in the replica yet
+                by_id = {status.id: status for status in Status.objects.using(DEFAULT_DB_ALIAS).order_by('id')}
+                self._by_id, self._by_name = by_id, {status.name: status.id for status in by_id.values()}
+                self._loaded = time.monotonic()
+            return self._by_id, self._by_name
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id = self._by_name = None
+
+    def all(self):
+        """The statuses, ordered by id"""
+        return list(self._load()[0].values())
+
+    def get(self, status_id):
+        """The status of this id, None if there is none"""
+        if status_id is None:
+            return None
+        by_id = self._load()[0]
+        if status_id not in by_id:
+            # created by another process
+            by_id = self._load(reload=True)[0]
+        return by_id.get(status_id)
+
+    def id_of(self, name):
+        """The id of the status of this name, None if there is none"""
+        return self._load()[1].get(name)
+
+    def ids_containing(self, text):
+        """The ids of the statuses whose name contains the text (like the name__contains lookup)"""
+        return [status_id for name, status_id in self._load()[1].items() if text in name]
+
+    def attach(self, tasks):
+        """Give the tasks their status from the registry, so that it is neither joined nor read for each task
+
+        :param tasks: an iterable of tasks
+        :return: the list of the tasks
+        """
+        tasks = list(tasks)
+        for task in tasks:
+            Task.status.field.set_cached_value(task, self.get(task.status_id))
+        return tasks
+
+    def is_finished(self, status_id):
+        """Whether the tasks of this status are finished (see FINISHED_STATUS)"""
+        status = self.get(status_id)
+        return status is not None and status.name == FINISHED_STATUS
+
+
+status_registry = StatusRegistry()
+
+
 class Task(models.Model):
     name = models.CharField(max_length=100, verbose_name="Nom")
     # the null property is True because we assign the project manually to the task after having checked if the assignee
@@ -48,104 +185,458 @@ class Task(models.Model):
     due_date = models.DateField(default=date.today, verbose_name="Date de fin")
     priority = models.SmallIntegerField(default=1, help_text="Entre 1 et 10")
     status = models.ForeignKey('Status', on_delete=models.SET_NULL, null=True)
-    last_modification = models.DateTimeField(auto_now_add=True)
+    # updated by every save. The queryset.update() of the tasks must set it too
+    last_modification = models.DateTimeField(auto_now=True)
     completion_percentage = models.SmallIntegerField(default=0, verbose_name="Pourcentage d'avancement")
+    # the class of the duration of the task, see duration_class. Set by every save, the queryset.update() of the dates
+    # and the bulk inserts must set it too
+    duration_class = models.SmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Indexes matching the queries of the views (see the explain_queries command)
+        indexes = [
+            # project page, ordered by priority
+            models.Index(fields=['projet', 'priority'], name='task_projet_priority_idx'),
+            # tasks of the user, finished or not
+            models.Index(fields=['assignee', 'status'], name='task_assignee_status_idx'),
+            # recent tasks of a project, and the ETag of its tasks in the JSON API (see api.tasks_response)
+            models.Index(fields=['projet', 'last_modification'], name='task_projet_last_mod_idx'),
+            # ETag of the tasks of a user in the JSON API
+            models.Index(fields=['assignee', 'last_modification'], name='task_assignee_last_mod_idx'),
+            # start and due dates filters of the project page
+            models.Index(fields=['projet', 'start_date'], name='task_projet_start_date_idx'),
+            models.Index(fields=['projet', 'due_date'], name='task_projet_due_date_idx'),
+            # tasks overlapping a period, of a project or of a user (see timeline.overlap_filter)
+            models.Index(fields=['projet', 'duration_class', 'start_date'], name='task_projet_timeline_idx'),
+            models.Index(fields=['assignee', 'duration_class', 'start_date'], name='task_assignee_timeline_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-    # check if assignee is a member of the project
+    # check if assignee is a member of the project, with one query on the unique index of the members table (the
+    # members are not loaded)
     def clean(self):
-        if self.projet is None:
+        if self.projet_id is None:
             return
-        if self.assignee not in self.projet.members.all():
+        if self.assignee_id is None or not Projet.members.through.objects.filter(
+                projet_id=self.projet_id, user_id=self.assignee_id).exists():
             raise ValidationError("Il faut que la perssonne à qui on assigne la tâche soit membre du projet")
 
     def natural_key(self):
-        return self.name
+        # the names of the tasks are unique in their project only, see importer.Importer.task_id
+        return self.name, self.projet.name if self.projet_id is not None else ''
+
+
+def duration_class(start_date, due_date):
+    """The class of the duration of a task: 0 for a task of one day, then k for a task lasting from 2^(k-1) to 2^k - 1
+    days after its start date (the number of bits of the number of days)
+
+    The tasks of a class last at most 2^k - 1 days, so the tasks of the class overlapping a period start at most
+    2^k - 1 days before it: they are found with one range of start dates (see timeline.overlap_filter)
+    """
+    return max((due_date - start_date).days, 0).bit_length()
 
 
 class Journal(models.Model):
-    # date and time fixed at the moment of the creation
-    date = models.DateTimeField(auto_now_add=True, verbose_name="Date de parution")
+    # date and time fixed at the moment of the creation, but the imported journals keep theirs (see importer.py)
+    date = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Date de parution")
     entry = models.CharField(max_length=240)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     task = models.ForeignKey('Task', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # journal of a task, ordered by date
+            models.Index(fields=['task', 'date'], name='journal_task_date_idx'),
+        ]
+
     def natural_key(self):
         return self.name
 
 
+class ExportJob(models.Model):
+    """An export of data made in background (see jobs.py). The zip file is written in the EXPORT_ROOT folder"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    # identify the exports of the same data, see jobs.export_key
+    key = models.CharField(max_length=40, db_index=True)
+    # comma separated names of the fields of the ExportDataForm which have been ticked
+    selection = models.CharField(max_length=100)
+    file_format = models.CharField(max_length=4)
+    compress = models.BooleanField(default=True)
+    # watermark of the previous export for a delta export (see export.export_manifest)
+    since = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{} export of {} ({})".format(self.file_format, self.user, self.status)
+
+    @property
+    def file_path(self):
+        return os.path.join(settings.EXPORT_ROOT, '{}.zip'.format(self.id))
+
+
+class Tombstone(models.Model):
+    """A deleted project, task or journal, so that the delta exports can tell the deletions (see export.py)
+
+    The deletion of a project is recorded for each of its members since they are not members anymore once it is
+    deleted. The journals deleted along with their task or their project are not recorded: the deletion of the task or
+    the project implies them.
+    """
+    PROJECT = 'projet'
+    TASK = 'task'
+    JOURNAL = 'journal'
+    MODEL_CHOICES = [
+        (PROJECT, 'Project'),
+        (TASK, 'Task'),
+        (JOURNAL, 'Journal'),
+    ]
+
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.IntegerField()
+    # the natural key of the object, the files of the exports refer to the objects by their name
+    name = models.CharField(max_length=100, blank=True)
+    # the project of the deleted task or journal, not a foreign key since the project may be deleted later
+    projet_id = models.IntegerField(null=True, blank=True)
+    # the member of the deleted project
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    deleted = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return "{} {} deleted on {}".format(self.model, self.object_id, self.deleted)
+
+
 @receiver(m2m_changed, sender=Projet.members.through)
-def update_tasks_assignment(sender, **kwargs):
+def update_tasks_assignment(sender, instance, action, reverse, **kwargs):
     """
     This function is called whenever the project members field of a project is modified.
     His scope is to make sure that a task is not assigned to someone who is no more member of the project
 
     :param sender:
+    :param instance: the project, or the user if the members have been modified from the user side
+    :param action:
+    :param reverse: True if the members have been modified from the user side
     :param kwargs:
     :return:
     """
-    project_tasks = kwargs['instance'].task_set.all()
-    project_members = kwargs['instance'].members.all()
-    # Retrieve the tasks with an forbidden assignment
-    wrong_assignee_task = project_tasks.exclude(assignee__in=project_members)
-    for task in wrong_assignee_task:
-        task.assignee = None
-        task.save()
+    # Only the people leaving a project can make a wrong assignment
+    if action not in ('post_remove', 'post_clear'):
+        return
 
+    if reverse:
+        # Retrieve the tasks of the user in the projects he/she left
+        wrong_assignee_task = Task.objects.filter(assignee=instance).exclude(projet__members=instance)
+    else:
+        # Retrieve the tasks with an forbidden assignment
+        wrong_assignee_task = instance.task_set.filter(assignee__isnull=False).exclude(
+            assignee__projets=instance)
+    # the versions of the projects are incremented by count_members
+    wrong_assignee_task.update(assignee=None, last_modification=timezone.now())
 
-@receiver(m2m_changed, sender=Projet.members.through)
-def creat_project_group(sender, **kwargs):
-    """Function which manage permissions
 
-    This function is called whenever the member field of a project is modified.
-    His scope is to make sure that newcomers get the permissions and leaving people left their permission
-    Alose creat the permission when the project is created
+def get_project_group(project):
+    """Return the group of permission of the project. Creat it with the permission when the project is new
 
-    :param sender:
-    :param kwargs:
-    :return:
+    :param project:
+    :return: the group of the project
     """
-
-    project_name = kwargs['instance'].name
-    project_id = kwargs['instance'].id
-    # Check if a permission exist/if it is a new project
-    if not Permission.objects.filter(codename='{}_project_permission'.format(project_id)):
+    group = Group.objects.filter(name="{}_project_group".format(project.id)).first()
+    if group is None:
         # permission creation procedure
         content_type = ContentType.objects.get_for_model(Projet)
         permission = Permission.objects.create(
-            codename='{}_project_permission'.format(project_id),
-            name='can see and contribute to the project {}({})"'.format(project_name, project_id),
+            codename='{}_project_permission'.format(project.id),
+            name='can see and contribute to the project {}({})"'.format(project.name, project.id),
             content_type=content_type,
         )
-        permission.save()
         # TODO ajouter ici les autres permissions
 
         # Creat a group of permission for each project. New permissions for project members can be add through it
-        group = Group(name="{}_project_group".format(project_id))
-        group.save()
+        group = Group.objects.create(name="{}_project_group".format(project.id))
 
         # Add permissions to the group
         group.permissions.add(permission)
-        for member in kwargs['instance'].members.all():
-            member.groups.add(group)
-            member.save()
+    return group
+
+
+def sync_project_group(project):
+    """Make the users of the group of the project be the members of the project
+
+    The newcomers and the leaving people are computed by the database and added or removed with one query each
+
+    :param project:
+    :return:
+    """
+    group = get_project_group(project)
+    user_groups = User.groups.through
+
+    # Remove the leaving people
+    user_groups.objects.filter(group=group).exclude(user__projets=project).delete()
+    # Add the newcomers
+    newcomers = project.members.exclude(groups=group).values_list('id', flat=True)
+    user_groups.objects.bulk_create([user_groups(user_id=user_id, group=group) for user_id in newcomers])
+
+
+@receiver(m2m_changed, sender=Projet.members.through)
+def creat_project_group(sender, instance, action, reverse, pk_set, **kwargs):
+    """Function which manage permissions
+
+    This function is called whenever the member field of a project is modified.
+    His scope is to make sure that newcomers get the permissions and leaving people left their permission
+    Alose creat the permission when the project is created
+
+    :param sender:
+    :param instance: the project, or the user if the members have been modified from the user side
+    :param action:
+    :param reverse: True if the members have been modified from the user side
+    :param pk_set: the ids of the added or removed users (or projects)
+    :param kwargs:
+    :return:
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    with transaction.atomic():
+        if not reverse:
+            sync_project_group(instance)
+        elif action == 'post_clear':
+            # The user left all his/her projects
+            User.groups.through.objects.filter(user=instance, group__name__endswith='_project_group').delete()
+        else:
+            for project in Projet.objects.filter(id__in=pk_set):
+                sync_project_group(project)
+
+
+@receiver(m2m_changed, sender=Projet.members.through)
+def update_members_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Remove from the cache the projects of the users joining or leaving a project (see backends.py)
+
+    :param sender:
+    :param instance: the project, or the user if the members have been modified from the user side
+    :param action:
+    :param reverse: True if the members have been modified from the user side
+    :param pk_set: the ids of the added or removed users (or projects)
+    :param kwargs:
+    :return:
+    """
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            forget_project_ids([instance.id])
+    elif action in ('post_add', 'post_remove'):
+        forget_project_ids(pk_set)
+    elif action == 'pre_clear':
+        forget_project_ids(instance.members.values_list('id', flat=True))
+
+
+def next_version():
+    """Expression incrementing the version of the projects, to be used in their update()"""
+    return F('version') + 1
+
+
+def next_members_version():
+    """Expression incrementing the members version of the projects, to be used in their update()"""
+    return F('members_version') + 1
+
+
+def update_project_counters(project_id, task_count=0, finished_count=0, completion_sum=0):
+    """Add the given numbers to the counters of a project and increment its version, with one atomic update
+
+    The version is incremented even if the counters do not change: a task of the project has been modified
+
+    :param project_id:
+    :param task_count, finished_count, completion_sum: the numbers to be added (negative to subtract them)
+    :return:
+    """
+    if project_id is None:
+        return
+    Projet.objects.filter(pk=project_id).update(task_count=F('task_count') + task_count,
+                                                finished_count=F('finished_count') + finished_count,
+                                                completion_sum=F('completion_sum') + completion_sum,
+                                                version=next_version())
+
+
+@receiver(pre_save, sender=Task)
+def remember_counted_task(sender, instance, **kwargs):
+    """Retrieve how a modified task is counted in the counters of its project before it is saved
+
+    :param sender:
+    :param instance: the task to be saved
+    :param kwargs:
+    :return:
+    """
+    instance.counted_state = None
+    if instance.pk is not None:
+        # The task may have been built from a form, so the previous values are read in the database
+        state = Task.objects.filter(pk=instance.pk).values_list(
+            'projet_id', 'status_id', 'completion_percentage').first()
+        if state is not None:
+            instance.counted_state = (state[0], status_registry.is_finished(state[1]), state[2])
+
+
+@receiver(pre_save, sender=Task)
+def set_duration_class(sender, instance, **kwargs):
+    """Compute the class of the duration of a task from its dates (see duration_class)"""
+    # the dates may have been given as strings
+    start_date = sender._meta.get_field('start_date').to_python(instance.start_date)
+    due_date = sender._meta.get_field('due_date').to_python(instance.due_date)
+    if start_date is not None and due_date is not None:
+        instance.duration_class = duration_class(start_date, due_date)
+
+
+@receiver(post_save, sender=Task)
+def count_saved_task(sender, instance, **kwargs):
+    """Update the counters of the project of a created or modified task
+
+    :param sender:
+    :param instance: the saved task
+    :param kwargs:
+    :return:
+    """
+    old_state = getattr(instance, 'counted_state', None)
+    finished = status_registry.is_finished(instance.status_id)
+    new_state = (instance.projet_id, finished, instance.completion_percentage)
+
+    if old_state is not None and old_state[0] == new_state[0]:
+        # same project, only the differences are counted
+        update_project_counters(new_state[0], 0, new_state[1] - old_state[1], new_state[2] - old_state[2])
     else:
-        # It is not a new project so the permissions may need an update
-        # Retrieve the project's group
-        group = Group.objects.get(name="{}_project_group".format(project_id))
-        old_member = group.user_set.all()
-        curent_member = kwargs['instance'].members.all()
-        # Compute the newcomers list and and the leaving people list
-        new_member = curent_member.exclude(id__in=old_member)
-        member_to_be_remove = old_member.exclude(id__in=curent_member)
-        for member in new_member:
-            member.groups.add(group)
-            member.save()
-        for member in member_to_be_remove:
-            member.groups.remove(group)
-            member.save()
+        if old_state is not None:
+            update_project_counters(old_state[0], -1, -old_state[1], -old_state[2])
+        update_project_counters(new_state[0], 1, int(new_state[1]), new_state[2])
+    instance.counted_state = new_state
+
+
+# The ids of the projects being deleted by the thread
+_deleting = threading.local()
+
+
+@contextmanager
+def deleting_projects(project_ids):
+    """Mark projects as being deleted until the end of the block
+
+    Django deletes the tasks of a deleted project one by one with their signals, sent before the ones of the project.
+    What the signals of the tasks do is rather done once for all of them by the signals of the project (see below), or
+    not at all: the counters of the project are deleted with it. Marked by Projet.delete and ProjetQuerySet.delete
+    """
+    project_ids = set(project_ids)
+    if not hasattr(_deleting, 'project_ids'):
+        _deleting.project_ids = set()
+    marked = project_ids - _deleting.project_ids
+    _deleting.project_ids |= marked
+    try:
+        yield
+    finally:
+        _deleting.project_ids -= marked
+
+
+def deleted_with_project(task):
+    """Whether the task is deleted along with its project, the signals of the task have nothing to do then"""
+    return task.projet_id in getattr(_deleting, 'project_ids', ())
+
+
+@receiver(pre_delete, sender=Task)
+def count_deleted_task(sender, instance, **kwargs):
+    """Remove a deleted task from the counters of its project
+
+    :param sender:
+    :param instance: the deleted task
+    :param kwargs:
+    :return:
+    """
+    if deleted_with_project(instance):
+        return
+    finished = status_registry.is_finished(instance.status_id)
+    update_project_counters(instance.projet_id, -1, -finished, -instance.completion_percentage)
+
+
+@receiver(m2m_changed, sender=Projet.members.through)
+def count_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the number of members of the projects whose members have been modified
+
+    The people added are always new members, so they are just added to the counter. The people removed may not have
+    been members, so the members of the project are counted again.
+
+    :param sender:
+    :param instance: the project, or the user if the members have been modified from the user side
+    :param action:
+    :param reverse: True if the members have been modified from the user side
+    :param pk_set: the ids of the added or removed users (or projects)
+    :param kwargs:
+    :return:
+    """
+    # a change of the members is a modification of the projects
+    now = timezone.now()
+    if reverse:
+        if action == 'post_add':
+            Projet.objects.filter(id__in=pk_set).update(member_count=F('member_count') + 1, last_modification=now,
+                                                        version=next_version(),
+                                                        members_version=next_members_version())
+        elif action == 'post_remove':
+            recount_members(Projet.objects.filter(id__in=pk_set))
+        elif action == 'pre_clear':
+            # The user is leaving all his/her projects
+            Projet.objects.filter(members=instance).update(member_count=F('member_count') - 1, last_modification=now,
+                                                           version=next_version(),
+                                                           members_version=next_members_version())
+    elif action == 'post_add':
+        Projet.objects.filter(pk=instance.pk).update(member_count=F('member_count') + len(pk_set),
+                                                     last_modification=now, version=next_version(),
+                                                     members_version=next_members_version())
+    elif action == 'post_remove':
+        recount_members(Projet.objects.filter(pk=instance.pk))
+    elif action == 'post_clear':
+        Projet.objects.filter(pk=instance.pk).update(member_count=0, last_modification=now, version=next_version(),
+                                                     members_version=next_members_version())
+
+
+def project_counters():
+    """Expressions computing the counters of the projects from the tasks and the members tables
+
+    :return: a dictionary counter name -> expression, to be used in update() or annotate() on projects
+    """
+    tasks = Task.objects.filter(projet=OuterRef('pk')).order_by().values('projet')
+    members = Projet.members.through.objects.filter(projet=OuterRef('pk')).order_by().values('projet')
+
+    def subquery(queryset, aggregate):
+        return Coalesce(Subquery(queryset.annotate(value=aggregate).values('value'), output_field=IntegerField()), 0)
+
+    return {
+        'task_count': subquery(tasks, Count('id')),
+        'finished_count': subquery(tasks.filter(status__name=FINISHED_STATUS), Count('id')),
+        'completion_sum': subquery(tasks, Sum('completion_percentage')),
+        'member_count': subquery(members, Count('user')),
+    }
+
+
+def recount_members(projects):
+    """Count again the members of the projects whose members have changed, with one query"""
+    projects.update(member_count=project_counters()['member_count'], last_modification=timezone.now(),
+                    version=next_version(), members_version=next_members_version())
+
+
+@receiver(pre_delete, sender=Projet)
+def forget_members_permissions(sender, **kwargs):
+    """The members of a deleted project lose its permission, remove their projects from the cache
+
+    :param sender:
+    :param kwargs:
+    :return:
+    """
+    forget_project_ids(kwargs['instance'].members.values_list('id', flat=True))
 
 
 @receiver(pre_delete, sender=Projet)
@@ -157,14 +648,182 @@ def delete_related_group_and_permissions(sender, **kwargs):
     :return:
     """
     project_id = kwargs['instance'].id
-    group = Group.objects.get(name="{}_project_group".format(project_id))
-    # TODO suprimer les permissions qu'on ajoute
-    permission = group.permissions.get(codename='{}_project_permission'.format(project_id))
+    groups = Group.objects.filter(name="{}_project_group".format(project_id))
+
+    with transaction.atomic():
+        # Remove permission to all members
+        User.groups.through.objects.filter(group__in=groups).delete()
+        # TODO suprimer les permissions qu'on ajoute
+        Permission.objects.filter(codename='{}_project_permission'.format(project_id)).delete()
+        groups.delete()
+
+
+@receiver(pre_delete, sender=Projet)
+def record_deleted_project(sender, instance, **kwargs):
+    """Record the deletion of a project for each of its members, and the deletion of its tasks (see Tombstone), with
+    one bulk_create"""
+    tombstones = [Tombstone(model=Tombstone.PROJECT, object_id=instance.id, name=instance.name, projet_id=instance.id,
+                            user_id=user_id) for user_id in instance.members.values_list('id', flat=True)]
+    # the tasks deleted along with the project are not recorded by their own signal (see deleting_projects)
+    tombstones += [Tombstone(model=Tombstone.TASK, object_id=task_id, name=name, projet_id=instance.id)
+                   for task_id, name in instance.task_set.values_list('id', 'name')]
+    Tombstone.objects.bulk_create(tombstones)
+
+
+@receiver(post_delete, sender=Task)
+def record_deleted_task(sender, instance, **kwargs):
+    if deleted_with_project(instance):
+        return
+    Tombstone.objects.create(model=Tombstone.TASK, object_id=instance.id, name=instance.name,
+                             projet_id=instance.projet_id)
+
+
+def record_deleted_journals(journals):
+    """Record the deletion of journals deleted on their own. There is no signal for the journals so that django can
+    delete the journals of a task with one query
+
+    :param journals: the queryset of the journals to be deleted
+    """
+    Tombstone.objects.bulk_create([
+        Tombstone(model=Tombstone.JOURNAL, object_id=journal_id, projet_id=project_id)
+        for journal_id, project_id in journals.values_list('id', 'task__projet_id')])
+
+
+@receiver(post_save, sender=Task)
+def index_saved_task(sender, instance, **kwargs):
+    """Index the name and the description of a created or modified task for the full text search (see search.py)"""
+    index_task(instance.id, instance.name, instance.description)
+
+
+@receiver(pre_delete, sender=Task)
+def unindex_deleted_task(sender, instance, **kwargs):
+    """Remove a task and its journals from the full text search index
+
+    The journals are removed along with their task, not by a post_delete signal of the journals which would prevent
+    django from deleting them with one query
+    """
+    # the tasks deleted along with their project are removed at once (see unindex_deleted_project)
+    if deleted_with_project(instance):
+        return
+    unindex_task(instance.id)
+
+
+@receiver(pre_delete, sender=Projet)
+def unindex_deleted_project(sender, instance, **kwargs):
+    """Remove the tasks of a deleted project and their journals from the full text search index, with one query each"""
+    unindex_project(instance.id)
+
+
+@receiver(post_save, sender=Journal)
+def index_saved_journal(sender, instance, **kwargs):
+    """Index the entry of a created or modified journal for the full text search (see search.py)"""
+    index_journal(instance.id, instance.entry)
+
+
+@receiver(pre_save, sender=Projet)
+def change_saved_project_version(sender, instance, **kwargs):
+    """The name of a modified project is shown by the cached fragments (see fragments.py)
+
+    The version is incremented by the database: the one of the instance may be out of date
+    """
+    if not instance._state.adding:
+        instance.version = next_version()
+
+
+@receiver(post_save, sender=Projet)
+def read_saved_project_version(sender, instance, created, **kwargs):
+    if not created:
+        instance.refresh_from_db(fields=['version'])
+
+
+@receiver(post_save, sender=Journal)
+def change_journal_project_version(sender, instance, **kwargs):
+    """A journal written is a change of the project of its task (see fragments.py)"""
+    Projet.objects.filter(task=instance.task_id).update(version=next_version())
+
+
+@receiver(post_save, sender=User)
+def change_user_projects_versions(sender, instance, created, update_fields, **kwargs):
+    """The names of the members and the assignees are shown by the cached fragments (see fragments.py) and the cached
+    choices of the assignee of the tasks (see forms.member_choices). The names of the authors of the journals are
+    written in the exports (see jobs.data_version), the authors may have left the project
+
+    The login of a user only saves his/her last_login, which is not shown
+    """
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    Projet.objects.filter(Q(members=instance) | Q(task__journal__author=instance)).update(
+        version=next_version(), members_version=next_members_version())
+
+
+@receiver(pre_delete, sender=User)
+def change_deleted_user_projects_versions(sender, instance, **kwargs):
+    """The user leaves his/her projects and his/her tasks are not assigned anymore, without the m2m_changed signal"""
+    Projet.objects.filter(Q(members=instance) | Q(task__assignee=instance)).update(
+        version=next_version(), members_version=next_members_version())
+
+
+@receiver(pre_delete, sender=User)
+def touch_deleted_user_tasks(sender, instance, **kwargs):
+    """The tasks of a deleted user are not assigned anymore, set by an update() of django (SET_NULL): their
+    last_modification must change for the ETag of the JSON API (see api.tasks_etag)"""
+    Task.objects.filter(assignee=instance).update(last_modification=timezone.now())
+
+
+@receiver(pre_delete, sender=Status)
+def touch_deleted_status_tasks(sender, instance, **kwargs):
+    """The tasks of a deleted status have no status anymore, see touch_deleted_user_tasks"""
+    Task.objects.filter(status=instance).update(last_modification=timezone.now())
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+def change_all_projects_versions(sender, instance, **kwargs):
+    """The name of the status of the tasks is shown by the cached fragments of every project (see fragments.py)"""
+    Projet.objects.update(version=next_version())
+
+
+@receiver(pre_save, sender=Status)
+def remember_finished_status(sender, instance, **kwargs):
+    """Retrieve whether a modified status was the finished one before it is saved, see recount_finished_tasks"""
+    instance.was_finished = False
+    if instance.pk is not None:
+        instance.was_finished = Status.objects.filter(pk=instance.pk, name=FINISHED_STATUS).exists()
+
+
+@receiver(post_save, sender=Status)
+def recount_renamed_status_tasks(sender, instance, **kwargs):
+    """A status renamed to or from FINISHED_STATUS changes the finished tasks of the projects using it"""
+    if getattr(instance, 'was_finished', False) != (instance.name == FINISHED_STATUS):
+        recount_finished_tasks(Projet.objects.filter(pk__in=Task.objects.filter(status=instance).values('projet')))
+
+
+@receiver(post_delete, sender=Status)
+def recount_deleted_status_tasks(sender, instance, **kwargs):
+    """The tasks of a deleted finished status have no status anymore (SET_NULL), so they are not finished"""
+    if instance.name == FINISHED_STATUS:
+        recount_finished_tasks(Projet.objects.filter(finished_count__gt=0))
+
+
+def recount_finished_tasks(projects):
+    """Count again the finished tasks of projects, with one query"""
+    projects.update(finished_count=project_counters()['finished_count'], version=next_version())
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+def invalidate_status_registry(sender, instance, **kwargs):
+    """Read the statuses again the next time they are needed, and once more after the commit: a registry loaded in
+    the transaction would keep its changes if it is rolled back"""
+    status_registry.invalidate()
+    transaction.on_commit(status_registry.invalidate)
 
-    # Remove permission to all members
-    for member in group.user_set.all():
-        member.groups.remove(group)
-        member.save()
 
-    group.delete()
-    permission.delete()
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Set the SQLITE_PRAGMAS setting on every new connection to a SQLite database"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
@@ -0,0 +1,163 @@
+# python modules
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+# django modules
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+
+# The alias of the replica in the DATABASES setting. The replica is a copy of the default database (the primary), a
+# SQLite file made by the snapshot_replica command in development
+REPLICA_DATABASE = 'replica'
+
+# Key of the session keeping the time of the last write of the user in the primary database
+LAST_WRITE_SESSION_KEY = 'taskmanager_last_write'
+
+# Whether the current thread reads from the replica, whether it has written in the primary database, and whether it
+# must read from the primary database only
+_state = threading.local()
+
+
+def replica_available():
+    """The replica is configured and, if it is a SQLite database, its file has been made"""
+    if REPLICA_DATABASE not in connections.databases:
+        return False
+    settings_dict = connections[REPLICA_DATABASE].settings_dict
+    if connections[REPLICA_DATABASE].vendor == 'sqlite':
+        return os.path.exists(settings_dict['NAME'])
+    return True
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """Send the reads of the current thread to the replica, if it is available, until the end of the block
+
+    After a write in the block, the rest of the block reads from the default database.
+    """
+    previous, written = getattr(_state, 'replica', False), getattr(_state, 'written', False)
+    _state.replica, _state.written = enabled and replica_available(), False
+    try:
+        yield
+    finally:
+        _state.replica = previous
+        _state.written = written or _state.written
+
+
+@contextmanager
+def read_from_primary():
+    """Send all the reads of the current thread to the default database until the end of the block, including the ones
+    of the blocks of read_from_replica inside it (e.g. the replica_view pages)"""
+    previous = getattr(_state, 'primary', False)
+    _state.primary = True
+    try:
+        yield
+    finally:
+        _state.primary = previous
+
+
+def replica_stream(chunks, enabled=True):
+    """Iterate over the chunks of a streamed response reading from the replica: they are made after the view has
+    returned, out of read_from_replica"""
+    with read_from_replica(enabled):
+        yield from chunks
+
+
+def using_replica():
+    """Whether the reads of the current thread are sent to the replica"""
+    return (getattr(_state, 'replica', False) and not getattr(_state, 'written', False)
+            and not getattr(_state, 'primary', False))
+
+
+def recently_written(request):
+    """The user has written in the primary database since less than REPLICA_LAG seconds: the replica may not have his/
+    her changes yet"""
+    return time.time() - request.session.get(LAST_WRITE_SESSION_KEY, 0) < settings.REPLICA_LAG
+
+
+def replica_view(view):
+    """Decorator of the read only views: their queries are sent to the replica, unless the user has just written"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with read_from_replica(not recently_written(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def start_request():
+    """Forget the writes of the previous request handled by the thread"""
+    _state.written = False
+
+
+def request_has_written():
+    """Whether the current request has written in the default database"""
+    return getattr(_state, 'written', False)
+
+
+def snapshot_time():
+    """The time of the copy of the primary database read by the replica (see snapshot_replica)
+
+    Everything committed in the primary before this time is in the replica, so it is the watermark of the exports made
+    from the replica (see export.export_manifest)
+    """
+    replica = connections[REPLICA_DATABASE]
+    with replica.cursor() as cursor:
+        # the snapshot_replica command writes the time of the copy in the user version of the file
+        cursor.execute('PRAGMA user_version')
+        timestamp = cursor.fetchone()[0]
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc)
+
+
+def snapshot_replica():
+    """Copy the primary SQLite database to the replica with the online backup API of SQLite
+
+    The copy is a consistent state of the primary, which stays available for the writers during the copy. The readers
+    of the replica see the previous copy until the new one is complete.
+
+    :return: the time of the copy
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    replica = connections[REPLICA_DATABASE]
+    primary.ensure_connection()
+    replica.ensure_connection()
+
+    # what is committed before this time is in the copy
+    start = timezone.now()
+    primary.connection.backup(replica.connection)
+    with replica.cursor() as cursor:
+        cursor.execute('PRAGMA user_version = {}'.format(int(start.timestamp())))
+    return start
+
+
+class ReplicaRouter:
+    """Database router sending the reads of the read only views and of the export jobs to the replica (see
+    read_from_replica and replica_view), and everything else to the default database
+
+    The writes are remembered: the rest of the request, and the next requests of the user during REPLICA_LAG seconds
+    (see middleware.ReadAfterWriteMiddleware), read from the default database so that the user sees his/her changes.
+    The sessions are always read from the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'sessions' and using_replica():
+            return REPLICA_DATABASE
+        # not the database of the instance given in the hints, which may have been read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != 'sessions':
+            _state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same objects
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # the replica is a copy of the default database, with its tables
+        return db != REPLICA_DATABASE
@@ -0,0 +1,193 @@
+# python modules
+import re
+
+# django modules
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+
+# The SQLite FTS5 tables indexing the text of the tasks and the journals (created by the 0005 migration). The rowid of
+# an indexed row is the id of the task or the journal, so that a row is updated or removed without searching it
+TASK_SEARCH_TABLE = 'taskmanager_task_search'
+JOURNAL_SEARCH_TABLE = 'taskmanager_journal_search'
+
+# Default and biggest number of results of a search
+SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 100
+
+# Weight of the name of the tasks in the ranking, compared to their description
+TASK_NAME_WEIGHT = 10.0
+
+# The words of the searched text
+SEARCH_TERM = re.compile(r'\w+')
+
+# Markers of the matching words in the snippets, replaced by <mark> once the text has been escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+
+def search_enabled():
+    """The full text search is only available with SQLite (FTS5)"""
+    return connection.vendor == 'sqlite'
+
+
+def fts_query(text):
+    """Translate the text typed by the user into a FTS5 query: the rows containing all the words, or words starting
+    with them. The special characters of the FTS5 syntax are left out
+
+    :param text:
+    :return: the query, or an empty string if the text does not contain any word
+    """
+    return ' '.join('"{}"*'.format(term) for term in SEARCH_TERM.findall(text))
+
+
+def index_task(task_id, name, description):
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT OR REPLACE INTO {} (rowid, name, description) VALUES (%s, %s, %s)'
+                       .format(TASK_SEARCH_TABLE), [task_id, name, description or ''])
+
+
+def index_journal(journal_id, entry):
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT OR REPLACE INTO {} (rowid, entry) VALUES (%s, %s)'.format(JOURNAL_SEARCH_TABLE),
+                       [journal_id, entry])
+
+
+def unindex_task(task_id):
+    """Remove a task which is being deleted and its journals from the index
+
+    The journals deleted on their own (from the administration) stay in the index until it is rebuilt, but the searches
+    do not return them since they are joined with the journals table
+    """
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(TASK_SEARCH_TABLE), [task_id])
+        cursor.execute('DELETE FROM {} WHERE rowid IN (SELECT id FROM taskmanager_journal WHERE task_id = %s)'
+                       .format(JOURNAL_SEARCH_TABLE), [task_id])
+
+
+def unindex_project(project_id):
+    """Remove the tasks of a project which is being deleted and their journals from the index, with one query each,
+    instead of unindex_task for each of the tasks
+    """
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE rowid IN (SELECT id FROM taskmanager_task WHERE projet_id = %s)'
+                       .format(TASK_SEARCH_TABLE), [project_id])
+        cursor.execute('DELETE FROM {} WHERE rowid IN (SELECT j.id FROM taskmanager_journal j '
+                       'INNER JOIN taskmanager_task t ON t.id = j.task_id WHERE t.projet_id = %s)'
+                       .format(JOURNAL_SEARCH_TABLE), [project_id])
+
+
+def index_all(after_task_id=0, after_journal_id=0):
+    """Index the tasks and the journals whose id is bigger than the given ones (all of them by default), with one query
+    each. Used to rebuild the index and for the objects inserted without signals (see importer.py)
+
+    :return: the number of tasks and the number of journals indexed
+    """
+    if not search_enabled():
+        return 0, 0
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT OR REPLACE INTO {} (rowid, name, description) '
+                       'SELECT id, name, COALESCE(description, \'\') FROM taskmanager_task WHERE id > %s'
+                       .format(TASK_SEARCH_TABLE), [after_task_id])
+        task_count = cursor.rowcount
+    return task_count, index_journals(after_journal_id)
+
+
+def index_journals(after_journal_id=0):
+    """Index the journals whose id is bigger than the given one with one query, see index_all. Used for the journals
+    written with bulk_create (see bulk.py)
+
+    :return: the number of journals indexed
+    """
+    if not search_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT OR REPLACE INTO {} (rowid, entry) SELECT id, entry FROM taskmanager_journal '
+                       'WHERE id > %s'.format(JOURNAL_SEARCH_TABLE), [after_journal_id])
+        return cursor.rowcount
+
+
+def rebuild_index():
+    """Index again all the tasks and the journals
+
+    :return: the number of tasks and the number of journals indexed
+    """
+    with connection.cursor() as cursor:
+        for table in (TASK_SEARCH_TABLE, JOURNAL_SEARCH_TABLE):
+            cursor.execute('DELETE FROM {}'.format(table))
+        counts = index_all()
+        # merge the b-trees of the index, the searches are faster
+        for table in (TASK_SEARCH_TABLE, JOURNAL_SEARCH_TABLE):
+            cursor.execute('INSERT INTO {0} ({0}) VALUES (\'optimize\')'.format(table))
+    return counts
+
+
+def matching_ids(table, text):
+    """Expression of the ids of the tasks or the journals matching a text, to be used in a filter: id__in=...
+
+    :param table: TASK_SEARCH_TABLE or JOURNAL_SEARCH_TABLE
+    :param text: the text typed by the user
+    """
+    return RawSQL('SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(table), [fts_query(text)])
+
+
+def search(user, text, limit=SEARCH_RESULTS):
+    """Search the tasks and the journals of the projects of a user
+
+    The tasks and the journals are ranked together by relevance (bm25), the name of the tasks weighing more than their
+    description. The projects of the user are checked in the same query.
+
+    :param user:
+    :param text: the text typed by the user
+    :param limit: the number of results
+    :return: a list of dictionaries (type, id, task, task_name, project, snippet, score), the best results first
+    """
+    query = fts_query(text)
+    if not query or not search_enabled():
+        return []
+
+    snippet = "snippet({}, -1, '{}', '{}', '…', 12)"
+    sql = '''SELECT 'task', t.id, t.id, t.name, t.projet_id, {task_snippet}, bm25({task_table}, %s, 1.0) AS score
+        FROM {task_table}
+        INNER JOIN taskmanager_task t ON t.id = {task_table}.rowid
+        WHERE {task_table} MATCH %s AND t.projet_id IN (SELECT projet_id FROM taskmanager_projet_members
+                                                          WHERE user_id = %s)
+        UNION ALL
+        SELECT 'journal', j.id, t.id, t.name, t.projet_id, {journal_snippet}, bm25({journal_table}) AS score
+        FROM {journal_table}
+        INNER JOIN taskmanager_journal j ON j.id = {journal_table}.rowid
+        INNER JOIN taskmanager_task t ON t.id = j.task_id
+        WHERE {journal_table} MATCH %s AND t.projet_id IN (SELECT projet_id FROM taskmanager_projet_members
+                                                             WHERE user_id = %s)
+        ORDER BY score
+        LIMIT %s'''.format(task_table=TASK_SEARCH_TABLE, journal_table=JOURNAL_SEARCH_TABLE,
+               task_snippet=snippet.format(TASK_SEARCH_TABLE, MATCH_START, MATCH_END),
+               journal_snippet=snippet.format(JOURNAL_SEARCH_TABLE, MATCH_START, MATCH_END))
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [TASK_NAME_WEIGHT, query, user.id, query, user.id, limit])
+        rows = cursor.fetchall()
+
+    results = []
+    for kind, object_id, task_id, task_name, project_id, text_snippet, score in rows:
+        results.append({
+            'type': kind,
+            'id': object_id,
+            'task': task_id,
+            'task_name': task_name,
+            'project': project_id,
+            # the text is escaped, only the <mark> of the matching words are html
+            'snippet': escape(text_snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'),
+            # bm25 gives negative scores, the best is the lowest
+            'score': -score,
+        })
+    return results
@@ -0,0 +1,34 @@
+# django modules
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """The SQLite backend of django, with the way the transactions are started given by OPTIONS['transaction_mode']
+
+    A transaction started by BEGIN (DEFERRED, the default) which reads and then writes has to turn its read lock into a
+    write lock. When another connection has written meanwhile, SQLite does not wait (the busy timeout does not apply)
+    and fails at once with "database is locked". BEGIN IMMEDIATE takes the write lock at the start of the transaction,
+    so the transactions writing wait for each other instead. The reads outside of transactions are not affected (in WAL
+    mode they do not wait for the writers).
+    """
+    transaction_mode = None
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # not a parameter of sqlite3.connect()
+        transaction_mode = kwargs.pop('transaction_mode', None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured("The transaction_mode option must be one of {}".format(
+                ', '.join(TRANSACTION_MODES)))
+        self.transaction_mode = transaction_mode
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute('BEGIN {}'.format(self.transaction_mode.upper()))
@@ -1,3 +1,757 @@
-from django.test import TestCase
+import io
+import os
+import random
+import tempfile
+from unittest import mock
+from datetime import date, datetime, timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .backends import ProjectMembershipBackend, project_ids_cache_key
+from .bulk import BULK_BATCH_SIZE
+from .export import export_querysets, zip_stream
+from .fragments import FRAGMENT_CACHE, fragment_key
+from .filters import Condition, Group, parse_filters, compile_filters
+from .importer import IMPORT_FORMATS, import_archive
+from .jobs import clean_exports, export_key, submit_export
+from .models import ExportJob, Projet, Status, Task, Journal, Tombstone, project_counters
+from .replica import (LAST_WRITE_SESSION_KEY, REPLICA_DATABASE, ReplicaRouter, read_from_primary,
+                      read_from_replica)
+from .search import JOURNAL_SEARCH_TABLE, MAX_SEARCH_RESULTS, TASK_SEARCH_TABLE, search
+from .timeline import overlap_filter
+from .views import TASKS_PER_PAGE, paginate_tasks
+
+
+def create_tasks(project, users, statuses, count):
+    """Create tasks with every combination of assignee, status, priority and dates"""
+    start = date(2020, 1, 1)
+    return [Task.objects.create(projet=project, name="Task {}".format(number), assignee=users[number % len(users)],
+                                status=statuses[number % len(statuses)], priority=number % 3 + 1,
+                                start_date=start + timedelta(days=number % 7),
+                                due_date=start + timedelta(days=number % 7 + number % 5),
+                                completion_percentage=number % 101, description="Description {}".format(number))
+            for number in range(count)]
+
+
+class FiltersTests(TestCase):
+    """The filter of the project page compiled into one Q object (see filters.py)"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(name) for name in ('a', 'b', 'c')]
+        self.statuses = [Status.objects.create(name=name) for name in ('New', 'Started', 'Finished')]
+        self.project = Projet.objects.create(name="Project")
+        self.project.members.set(self.users)
+        create_tasks(self.project, self.users, self.statuses, 60)
+
+    def subquery_filter(self, nodes):
+        """The filter of a tree built block by block, each block being a sub query on the tasks of the project as the
+        project page used to do"""
+        filters = Q()
+        for node in nodes:
+            if isinstance(node, Group):
+                node_filter = Q(pk__in=self.project.task_set.filter(self.subquery_filter(node.children)))
+                link = node.kind
+            else:
+                node_filter = compile_filters((node._replace(link='and'),))
+                link = node.link
+            if link == 'and':
+                filters &= node_filter
+            else:
+                filters |= node_filter
+        return filters
+
+    def filtered_ids(self, filters):
+        return list(self.project.task_set.filter(filters).order_by('id').values_list('id', flat=True))
+
+    def test_nested_groups(self):
+        query_dict = QueryDict('&'.join([
+            '1=and&1=start_after&1=2020-01-02',
+            'input_and-1=',
+            '2=or&2=assign&2={}'.format(self.users[0].id),
+            'input_or-2=',
+            '3=and&3=status&3={}'.format(self.statuses[1].id),
+            '4=and&4=end_before&4=2020-01-08',
+            'input_end_or-2=',
+            '5=and&5=not_assign&5={}'.format(self.users[2].id),
+            'input_end_and-1=',
+            '6=or&6=status&6={}'.format(self.statuses[2].id),
+        ]))
+        tree = parse_filters(query_dict)
+        self.assertEqual(tree, (
+            Condition('and', 'start_after', date(2020, 1, 2)),
+            Group('and', (
+                Condition('or', 'assign', self.users[0].id),
+                Group('or', (
+                    Condition('and', 'status', self.statuses[1].id),
+                    Condition('and', 'end_before', date(2020, 1, 8)),
+                )),
+                Condition('and', 'not_assign', self.users[2].id),
+            )),
+            Condition('or', 'status', self.statuses[2].id),
+        ))
+
+        ids = self.filtered_ids(compile_filters(tree))
+        self.assertTrue(0 < len(ids) < 60)
+        self.assertEqual(ids, self.filtered_ids(self.subquery_filter(tree)))
+
+    def test_empty_and_unclosed_groups(self):
+        # an empty block matches every task, a block which is never closed is ignored
+        tree = parse_filters(QueryDict('input_and-1=&input_end_and-1=&2=and&2=status&2={}&input_or-3=&4=or&4=assign&'
+                                       '4={}'.format(self.statuses[0].id, self.users[0].id)))
+        self.assertEqual(tree, (Group('and', ()), Condition('and', 'status', self.statuses[0].id)))
+        self.assertEqual(self.filtered_ids(compile_filters(tree)), self.filtered_ids(self.subquery_filter(tree)))
+
+    def test_line_numbers(self):
+        # the same filter with other line numbers has the same tree, so the compiled filter is shared
+        first = parse_filters(QueryDict('input_or-1=&2=or&2=assign&2=1&input_end_or-1=&3=and&3=status&3=2'))
+        second = parse_filters(QueryDict('input_or-7=&4=or&4=assign&4=1&input_end_or-7=&9=and&9=status&9=2'))
+        self.assertEqual(first, second)
+        self.assertIs(compile_filters(first), compile_filters(second))
+
+
+class PaginationTests(TestCase):
+    """The keyset pagination of the tasks of the project page (see views.paginate_tasks)"""
+
+    def setUp(self):
+        user = User.objects.create_user('a')
+        self.project = Projet.objects.create(name="Project")
+        self.project.members.set([user])
+        # few priorities, so that many tasks have the same one
+        create_tasks(self.project, [user], [Status.objects.create(name="New")], TASKS_PER_PAGE * 3 + 7)
+
+    def test_pages(self):
+        tasks = self.project.task_set.all()
+        expected = list(tasks.order_by('-priority', '-id').values_list('id', flat=True))
+
+        ids = []
+        query_dict = QueryDict()
+        pages = 0
+        while query_dict is not None:
+            page, next_page_query, first_page_query = paginate_tasks(tasks, query_dict)
+            self.assertEqual(first_page_query is None, pages == 0)
+            ids += [task.id for task in page]
+            pages += 1
+            query_dict = QueryDict(next_page_query) if next_page_query is not None else None
+
+        self.assertEqual(pages, 4)
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        # the first page is displayed
+        page = paginate_tasks(self.project.task_set.all(), QueryDict('after=abc'))[0]
+        self.assertEqual(page[0].id, self.project.task_set.order_by('-priority', '-id')[0].id)
+
+
+class ImportExportTests(TestCase):
+    """The archives made by the data export are imported back (see export.py and importer.py)"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(name, email='{}@example.com'.format(name)) for name in ('a', 'b')]
+        statuses = [Status.objects.create(name=name) for name in ('New', 'Finished')]
+        for name in ("Project 1", "Project 2"):
+            project = Projet.objects.create(name=name)
+            project.members.set(self.users)
+            for task in create_tasks(project, self.users, statuses, 5):
+                task.name = "{} {}".format(project.name, task.name)
+                task.save()
+                Journal.objects.create(task=task, author=self.users[0], entry="Entry of {}".format(task.name),
+                                       date=datetime(2020, 1, 2, 3, 4, task.id, tzinfo=timezone.utc))
+
+    def data(self):
+        projects = {(project.name, tuple(project.members.order_by('username').values_list('username', flat=True)),
+                     project.task_count, project.member_count) for project in Projet.objects.all()}
+        tasks = set(Task.objects.values_list('name', 'projet__name', 'assignee__username', 'status__name', 'priority',
+                                             'start_date', 'due_date', 'completion_percentage', 'description',
+                                             'duration_class'))
+        journals = set(Journal.objects.values_list('task__name', 'task__projet__name', 'author__username', 'entry',
+                                                   'date'))
+        statuses = set(Status.objects.values_list('name', flat=True))
+        return projects, tasks, journals, statuses
+
+    def test_round_trip(self):
+        expected = self.data()
+        for file_format in IMPORT_FORMATS:
+            with self.subTest(file_format=file_format):
+                archive = io.BytesIO(b''.join(zip_stream(export_querysets(self.users[0], True, True, True, True, True),
+                                                         file_format)))
+                Projet.objects.all().delete()
+                Status.objects.all().delete()
+
+                counts = import_archive(archive)
+                self.assertEqual((counts['projet'], counts['task'], counts['journal'], counts['status']),
+                                 (2, 10, 10, 2))
+                self.assertEqual(self.data(), expected)
+
+    def test_round_trip_same_task_names(self):
+        # the names of the tasks are unique in their project only
+        for task in Task.objects.all():
+            task.name = task.name.replace(task.projet.name + ' ', '')
+            task.save()
+        self.test_round_trip()
+
+
+class ProjectCountersTests(TestCase):
+    """The counters of the projects kept up to date by the signals (see models.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(name, password='password') for name in ('a', 'b', 'c')]
+        self.project = Projet.objects.create(name="Project")
+        self.project.members.set(self.users[:2])
+        self.client.force_login(self.users[0])
+
+    def test_edit_members_counts_members(self):
+        response = self.client.post(reverse('edit_project', args=[self.project.id]),
+                                    {'name': "Renamed", 'members': [user.id for user in self.users]})
+        self.assertRedirects(response, reverse('projects'))
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.name, "Renamed")
+        self.assertEqual(self.project.member_count, 3)
+
+    def test_edit_members_changes_assignee_choices(self):
+        # the choices are cached by the first display of the form
+        response = self.client.get(reverse('newtask', args=[self.project.id]))
+        self.assertEqual(list(response.context['form'].fields['assignee'].choices),
+                         [(user.id, user.username) for user in self.users[:2]])
+
+        self.client.post(reverse('edit_project', args=[self.project.id]),
+                         {'name': "Project", 'members': [user.id for user in self.users]})
+
+        response = self.client.get(reverse('newtask', args=[self.project.id]))
+        self.assertEqual(list(response.context['form'].fields['assignee'].choices),
+                         [(user.id, user.username) for user in self.users])
+
+    def test_delete_project(self):
+        status = Status.objects.create(name="Finished")
+        other = Projet.objects.create(name="Other")
+        other.members.set(self.users[:1])
+        create_tasks(other, self.users[:1], [status], 3)
+        create_tasks(self.project, self.users[:2], [status], 20)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.project.delete()
+        # the counters of the deleted project are not updated for each of its tasks
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "taskmanager_projet"')])
+        self.assertFalse(Task.objects.filter(projet_id=self.project.id).exists())
+
+        # the tasks deleted on their own are still counted
+        other.task_set.first().delete()
+        other.refresh_from_db()
+        self.assertEqual((other.task_count, other.finished_count), (2, 2))
+
+    def test_delete_projects_queryset(self):
+        create_tasks(self.project, self.users[:2], [Status.objects.create(name="New")], 20)
+        with CaptureQueriesContext(connection) as queries:
+            Projet.objects.filter(id=self.project.id).delete()
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "taskmanager_projet"')])
+        self.assertFalse(Task.objects.exists())
+
+    def test_rename_and_delete_finished_status(self):
+        statuses = [Status.objects.create(name=name) for name in ("New", "Done")]
+        create_tasks(self.project, self.users[:2], statuses, 10)
+
+        def finished_count():
+            self.project.refresh_from_db()
+            return self.project.finished_count
+
+        statuses[1].name = "Finished"
+        statuses[1].save()
+        self.assertEqual(finished_count(), 5)
+        Status.objects.get(pk=statuses[1].pk).delete()
+        self.assertEqual(finished_count(), 0)
+
+        statuses[0].name = "Finished"
+        statuses[0].save()
+        self.assertEqual(finished_count(), 5)
+        statuses[0].name = "New"
+        statuses[0].save()
+        self.assertEqual(finished_count(), 0)
+
+
+class TombstoneTests(TestCase):
+    """The deletions recorded for the delta exports (see models.Tombstone)"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(name) for name in ('a', 'b')]
+        self.project = Projet.objects.create(name="Project")
+        self.project.members.set(self.users)
+        self.tasks = create_tasks(self.project, self.users, [Status.objects.create(name="New")], 30)
+
+    def test_delete_project(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.project.delete()
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "taskmanager_tombstone"')]
+        self.assertLessEqual(len(inserts), 1)
+        self.assertEqual(sorted(Tombstone.objects.filter(model=Tombstone.PROJECT).values_list('user__username',
+                                                                                             flat=True)), ['a', 'b'])
+        self.assertEqual(set(Tombstone.objects.filter(model=Tombstone.TASK).values_list('object_id', 'name')),
+                         {(task.id, task.name) for task in self.tasks})
+
+    def test_delete_task(self):
+        task_id = self.tasks[0].id
+        self.tasks[0].delete()
+        self.assertEqual(list(Tombstone.objects.values_list('model', 'object_id', 'projet_id')),
+                         [(Tombstone.TASK, task_id, self.project.id)])
+
+
+class SearchTests(TestCase):
+    """The full text search of the tasks and the journals (see search.py)"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(name) for name in ('a', 'b')]
+        self.statuses = [Status.objects.create(name="New")]
+        self.projects = [Projet.objects.create(name=name) for name in ("Project", "Other")]
+        self.tasks = []
+        # a is member of the first project only
+        for project, members in zip(self.projects, (self.users, self.users[1:])):
+            project.members.set(members)
+            self.tasks += create_tasks(project, members, self.statuses, 10)
+        for task in self.tasks:
+            Journal.objects.create(task=task, entry="Entry of {}".format(task.name), author=self.users[1])
+
+    def found(self, user, text):
+        return {(result['type'], result['id']) for result in search(user, text, MAX_SEARCH_RESULTS)}
+
+    def test_projects_of_the_user(self):
+        tasks = self.tasks[:10]
+        self.assertEqual(self.found(self.users[0], "description"), {('task', task.id) for task in tasks})
+        self.assertEqual(self.found(self.users[1], "description"), {('task', task.id) for task in self.tasks})
+        self.assertEqual(self.found(self.users[0], "entry"),
+                         {('journal', journal_id)
+                          for journal_id in Journal.objects.filter(task__in=tasks).values_list('id', flat=True)})
+
+        self.client.force_login(self.users[0])
+        response = self.client.get(reverse('search'), {'q': "description", 'limit': 100})
+        self.assertEqual({result['project'] for result in response.json()['results']}, {self.projects[0].id})
+
+    def test_special_characters(self):
+        for text in ('"', 'task"', '"task', 'AND', 'task AND', 'OR task', 'NOT', 'task NOT entry', '*', 'ta*', '-task',
+                     'name:task', '^task', 'NEAR(task entry)', '(task', 'task)', "'", ''):
+            with self.subTest(text=text):
+                search(self.users[0], text)
+        self.assertEqual(self.found(self.users[0], '"Task 1*'), self.found(self.users[0], "task 1"))
+
+    def test_rename_task(self):
+        task = self.tasks[0]
+        task.name = "Renamed"
+        task.save()
+        self.assertEqual(self.found(self.users[0], "renamed"), {('task', task.id)})
+        self.assertNotIn(('task', task.id), self.found(self.users[0], "task"))
+
+    def test_delete_task(self):
+        task = self.tasks[0]
+        journal_ids = set(task.journal_set.values_list('id', flat=True))
+        task_id = task.id
+        task.delete()
+        self.assertNotIn(task_id, self.indexed_ids(TASK_SEARCH_TABLE))
+        self.assertFalse(journal_ids & self.indexed_ids(JOURNAL_SEARCH_TABLE))
+        self.assertNotIn(('task', task_id), self.found(self.users[0], "task"))
+
+    def indexed_ids(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid FROM {}'.format(table))
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_delete_project(self):
+        kept = self.projects[1]
+        with CaptureQueriesContext(connection) as queries:
+            self.projects[0].delete()
+        self.assertLessEqual(len([query for query in queries if TASK_SEARCH_TABLE in query['sql']]), 1)
+        self.assertEqual(self.indexed_ids(TASK_SEARCH_TABLE), set(kept.task_set.values_list('id', flat=True)))
+        self.assertEqual(self.indexed_ids(JOURNAL_SEARCH_TABLE),
+                         set(Journal.objects.filter(task__projet=kept).values_list('id', flat=True)))
+
+
+class TasksApiTests(TestCase):
+    """The ETag of the JSON API of the tasks (see api.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(name, password='password') for name in ('a', 'b', 'c')]
+        self.statuses = [Status.objects.create(name=name) for name in ('New', 'Started')]
+        self.projects = [Projet.objects.create(name=name) for name in ("Project", "Other")]
+        self.projects[0].members.set(self.users)
+        self.projects[1].members.set(self.users[1:])
+        for project in self.projects:
+            create_tasks(project, self.users[1:], self.statuses, 6)
+        self.client.force_login(self.users[0])
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # the client has this list already
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def test_delete_status(self):
+        url = reverse('api_project_tasks', args=[self.projects[0].id])
+        etag = self.etag(url)
+        self.statuses[1].delete()
+        self.assertNotEqual(self.etag(url), etag)
+
+    def test_delete_user(self):
+        url = reverse('api_project_tasks', args=[self.projects[0].id])
+        etag = self.etag(url)
+        self.users[2].delete()
+        self.assertNotEqual(self.etag(url), etag)
+
+    def test_requester_membership(self):
+        url = reverse('api_user_tasks', args=[self.users[1].id])
+        etag = self.etag(url)
+        self.assertEqual(self.client.get(url).json()['count'], 3)
+
+        self.projects[1].members.add(self.users[0])
+        self.assertNotEqual(self.etag(url), etag)
+        self.assertEqual(self.client.get(url).json()['count'], 6)
+
+
+class TimelineTests(TestCase):
+    """The tasks overlapping a period looked for by class of duration (see timeline.overlap_filter)"""
+
+    first_day = date(2020, 1, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        generator = random.Random(25)
+        cls.user = User.objects.create_user('a')
+        cls.project = Projet.objects.create(name="Project")
+        cls.project.members.set([cls.user])
+        for number in range(300):
+            start_date = cls.first_day + timedelta(days=generator.randint(0, 400))
+            # from one day to more than a year, and a few tasks due before their start
+            days = generator.choice([0, 1, 2, 3, 7, 8, 15, 16, 100, 365, 500, -3])
+            Task.objects.create(projet=cls.project, name="Task {}".format(number), assignee=cls.user,
+                                start_date=start_date, due_date=start_date + timedelta(days=days))
+
+    def setUp(self):
+        self.generator = random.Random(25)
+
+    def assertSameTasks(self, start, end):
+        tasks = Task.objects.filter(projet=self.project)
+        expected = set(tasks.filter(start_date__lte=end, due_date__gte=start).values_list('id', flat=True))
+        for lookups in ({'projet': self.project}, {'assignee': self.user}):
+            found = Task.objects.filter(overlap_filter(start, end, **lookups)).values_list('id', flat=True)
+            self.assertEqual(set(found), expected, (start, end, lookups))
+
+    def test_random_periods(self):
+        for _ in range(50):
+            start = self.first_day + timedelta(days=self.generator.randint(-30, 900))
+            self.assertSameTasks(start, start + timedelta(days=self.generator.randint(0, 60)))
+
+    def test_boundary_dates(self):
+        # the periods starting or ending on the start or the due date of a task
+        for task in self.generator.sample(list(Task.objects.all()), 15):
+            for day in (task.start_date, task.due_date):
+                self.assertSameTasks(day, day)
+                self.assertSameTasks(day - timedelta(days=1), day - timedelta(days=1))
+                self.assertSameTasks(day + timedelta(days=1), day + timedelta(days=10))
+                self.assertSameTasks(day - timedelta(days=10), day - timedelta(days=1))
+
+    def test_extreme_periods(self):
+        self.assertSameTasks(date.min, date.max)
+        self.assertSameTasks(date.min, self.first_day)
+        self.assertSameTasks(self.first_day + timedelta(days=900), date.max)
+
+
+@override_settings(PROJECT_PERMISSIONS_CACHE_TIMEOUT=60)
+class ProjectMembershipBackendTests(TestCase):
+    """The project permissions given by the members of the projects (see backends.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.backend = ProjectMembershipBackend()
+        self.users = [User.objects.create_user(name, password='password') for name in ('a', 'b')]
+        self.project = Projet.objects.create(name="Project")
+        self.project.members.set(self.users[:1])
+        self.permission = 'taskmanager.{}_project_permission'.format(self.project.id)
+
+    def test_member(self):
+        self.assertTrue(self.backend.has_perm(self.users[0], self.permission))
+        self.assertTrue(User.objects.get(pk=self.users[0].pk).has_perm(self.permission))
+        self.client.force_login(self.users[0])
+        self.assertEqual(self.client.get(reverse('project', args=[self.project.id])).status_code, 200)
+
+    def test_non_member(self):
+        with self.assertRaises(PermissionDenied):
+            self.backend.has_perm(self.users[1], self.permission)
+        # the other backends are not asked
+        self.assertFalse(User.objects.get(pk=self.users[1].pk).has_perm(self.permission))
+        self.client.force_login(self.users[1])
+        self.assertRedirects(self.client.get(reverse('project', args=[self.project.id])), reverse('projects'))
+        self.assertEqual(self.client.get(reverse('api_project_tasks', args=[self.project.id])).status_code, 403)
+
+    def test_other_permissions(self):
+        self.assertFalse(self.backend.has_perm(self.users[0], 'taskmanager.add_task'))
+
+    def test_request_cache(self):
+        user = User.objects.get(pk=self.users[0].pk)
+        self.assertTrue(self.backend.has_perm(user, self.permission))
+        self.assertEqual(user._project_ids_cache, {self.project.id})
+        with self.assertNumQueries(0):
+            self.assertTrue(self.backend.has_perm(user, self.permission))
+
+    def test_members_change(self):
+        # the projects are kept in the cache between the requests
+        self.assertTrue(self.backend.has_perm(User.objects.get(pk=self.users[0].pk), self.permission))
+        self.assertEqual(cache.get(project_ids_cache_key(self.users[0].id)), {self.project.id})
+        user = User.objects.get(pk=self.users[0].pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.backend.has_perm(user, self.permission))
+
+        self.project.members.set(self.users[1:])
+        self.assertIsNone(cache.get(project_ids_cache_key(self.users[0].id)))
+        with self.assertRaises(PermissionDenied):
+            self.backend.has_perm(User.objects.get(pk=self.users[0].pk), self.permission)
+        self.assertTrue(self.backend.has_perm(User.objects.get(pk=self.users[1].pk), self.permission))
+
+    def test_project_deleted(self):
+        self.assertTrue(self.backend.has_perm(User.objects.get(pk=self.users[0].pk), self.permission))
+        self.project.delete()
+        self.assertIsNone(cache.get(project_ids_cache_key(self.users[0].id)))
+        with self.assertRaises(PermissionDenied):
+            self.backend.has_perm(User.objects.get(pk=self.users[0].pk), self.permission)
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    """The reads of the read only views sent to the replica, which is a mirror of the default database in the tests (see
+    replica.py). The data is committed so that the connection of the replica reads it"""
+    databases = {DEFAULT_DB_ALIAS, REPLICA_DATABASE}
+
+    def setUp(self):
+        # the replica is mirrored, it has no file of its own
+        patcher = mock.patch('taskmanager.replica.replica_available', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+        self.user = User.objects.create_user('a', password='password')
+        project = Projet.objects.create(name="Project")
+        project.members.set([self.user])
+        create_tasks(project, [self.user], [Status.objects.create(name="New")], 5)
+        self.client.force_login(self.user)
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Task), REPLICA_DATABASE)
+            # the sessions are always read from the default database
+            self.assertEqual(self.router.db_for_read(Session), DEFAULT_DB_ALIAS)
+            with read_from_primary():
+                self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(Task), REPLICA_DATABASE)
+            # the writes always go to the default database, and the reads after them
+            self.assertEqual(self.router.db_for_write(Task), DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+        with read_from_replica(False):
+            self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+
+    def request_queries(self, url_name):
+        """The number of queries made on the default database and on the replica by a page"""
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primary, \
+                CaptureQueriesContext(connections[REPLICA_DATABASE]) as replica:
+            self.assertEqual(self.client.get(reverse(url_name)).status_code, 200)
+        return len(primary), len(replica)
+
+    def test_replica_view(self):
+        primary, replica = self.request_queries('taches_assignees')
+        self.assertGreater(replica, 0)
+        # the session and the user
+        self.assertLessEqual(primary, 2)
+
+    def test_read_after_write(self):
+        # a write of the user is remembered by the session (see middleware.ReadAfterWriteMiddleware)
+        self.assertNotIn(LAST_WRITE_SESSION_KEY, self.client.session)
+        response = self.client.post(reverse('edit_project', args=[Projet.objects.get().id]),
+                                    {'name': "Renamed", 'members': [self.user.id]})
+        self.assertRedirects(response, reverse('projects'))
+        self.assertIn(LAST_WRITE_SESSION_KEY, self.client.session)
+
+        primary, replica = self.request_queries('taches_assignees')
+        self.assertEqual(replica, 0)
+
+        # the replica has the changes REPLICA_LAG seconds later
+        with override_settings(REPLICA_LAG=0):
+            primary, replica = self.request_queries('taches_assignees')
+        self.assertGreater(replica, 0)
+
+
+class FragmentsTests(TestCase):
+    """The table of the tasks of the project page kept in the fragments cache (see fragments.py)"""
+
+    def setUp(self):
+        cache.clear()
+        caches[FRAGMENT_CACHE].clear()
+        self.users = [User.objects.create_user(name, password='password') for name in ('a', 'b')]
+        self.status = Status.objects.create(name="New")
+        self.project = Projet.objects.create(name="Project")
+        self.project.members.set(self.users)
+        self.tasks = create_tasks(self.project, self.users, [self.status], 4)
+        self.client.force_login(self.users[0])
+
+    def tasks_table(self):
+        """The table of the project page, and whether it has been read from the cache"""
+        self.project.refresh_from_db()
+        cached = caches[FRAGMENT_CACHE].get(fragment_key('project', self.project.id, self.project.version, ''))
+        response = self.client.get(reverse('project', args=[self.project.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.context['tasks_table'], cached is not None
+
+    def test_cached(self):
+        table, cached = self.tasks_table()
+        self.assertFalse(cached)
+        self.assertEqual(self.tasks_table(), (table, True))
+
+    def test_edit_task(self):
+        self.tasks_table()
+        self.tasks[0].name = "Renamed task"
+        self.tasks[0].save()
+        table, cached = self.tasks_table()
+        self.assertFalse(cached)
+        self.assertIn("Renamed task", table)
+
+    def test_change_members(self):
+        self.assertIn(">b<", self.tasks_table()[0])
+        # the tasks of b are not assigned anymore
+        self.project.members.set(self.users[:1])
+        table, cached = self.tasks_table()
+        self.assertFalse(cached)
+        self.assertNotIn(">b<", table)
+        self.assertIn("Personne", table)
+
+    def test_rename_status(self):
+        self.tasks_table()
+        self.status.name = "Started"
+        self.status.save()
+        table, cached = self.tasks_table()
+        self.assertFalse(cached)
+        self.assertIn("Started", table)
+
+    @override_settings(FRAGMENT_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.tasks_table()
+        # the version of the project does not change
+        Task.objects.filter(id=self.tasks[0].id).update(name="Renamed task")
+        table, cached = self.tasks_table()
+        self.assertFalse(cached)
+        self.assertIn("Renamed task", table)
+
+
+class ExportKeyTests(TestCase):
+    """The key of the exports changes with the names written in the archives (see jobs.data_version)"""
+
+    def setUp(self):
+        self.user, self.author = User.objects.create_user('a'), User.objects.create_user('b')
+        project = Projet.objects.create(name="Project")
+        project.members.set([self.user, self.author])
+        self.status = Status.objects.create(name="New")
+        task = Task.objects.create(projet=project, name="Task", assignee=self.user, status=self.status,
+                                   start_date='2020-01-01', due_date='2020-01-31', priority=1)
+        Journal.objects.create(task=task, author=self.author, entry="Entry")
+        # the author of the journal has left the project
+        project.members.remove(self.author)
+
+    def key(self):
+        return export_key(self.user, ['tasks', 'journals', 'status'], 'csv', True)
+
+    def test_rename_status(self):
+        key = self.key()
+        self.status.name = "Renamed"
+        self.status.save()
+        self.assertNotEqual(self.key(), key)
+
+    def test_rename_author(self):
+        key = self.key()
+        self.author.username = "renamed"
+        self.author.save()
+        self.assertNotEqual(self.key(), key)
+
+
+class ExportJobsTests(TestCase):
+    """The background exports shared by several processes (see jobs.py)"""
+
+    def setUp(self):
+        self.export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.export_root.cleanup)
+        overridden = override_settings(EXPORT_ROOT=self.export_root.name, EXPORT_WORKERS=0, EXPORT_TIMEOUT=60)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.user = User.objects.create_user('a')
+        Projet.objects.create(name="Project").members.set([self.user])
+
+    def old_job(self, status):
+        """A job created by another process EXPORT_TIMEOUT seconds ago"""
+        job = ExportJob.objects.create(user=self.user, key='key', selection='projects', file_format='csv',
+                                       status=status)
+        ExportJob.objects.filter(id=job.id).update(created=job.created - timedelta(seconds=61))
+        return job
+
+    def test_submit_running_in_other_process(self):
+        key = export_key(self.user, ['projects'], 'csv', True)
+        job = ExportJob.objects.create(user=self.user, key=key, selection='projects', file_format='csv',
+                                       status=ExportJob.RUNNING)
+        self.assertEqual(submit_export(self.user, ['projects'], 'csv', replica=False), job)
+
+        # interrupted, a new export is made
+        ExportJob.objects.filter(id=job.id).update(created=job.created - timedelta(seconds=61))
+        new_job = submit_export(self.user, ['projects'], 'csv', replica=False)
+        self.assertNotEqual(new_job, job)
+        self.assertEqual(ExportJob.objects.get(id=new_job.id).status, ExportJob.DONE)
+
+    def test_clean_running_in_other_process(self):
+        interrupted, running = self.old_job(ExportJob.RUNNING), self.old_job(ExportJob.RUNNING)
+        os.makedirs(self.export_root.name, exist_ok=True)
+        # the file of the running job is still being written
+        with open(running.file_path + '.part', 'wb') as output:
+            output.write(b'zip')
+
+        self.assertEqual(clean_exports(), (1, 0))
+        self.assertEqual(ExportJob.objects.get(id=interrupted.id).status, ExportJob.FAILED)
+        self.assertEqual(ExportJob.objects.get(id=running.id).status, ExportJob.RUNNING)
+
+
+class BulkTasksTests(TestCase):
+    """The bulk change of the tasks of a project (see bulk.py)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('a')
+        self.project = Projet.objects.create(name="Project")
+        self.project.members.set([self.user])
+        self.status = Status.objects.create(name="New")
+        self.finished = Status.objects.create(name="Finished")
+        # more tasks than the parameters of a query allowed by SQLite by default (999)
+        Task.objects.bulk_create([Task(projet=self.project, name="Task {}".format(number), status=self.status,
+                                       priority=number % 2 + 1, start_date='2020-01-01', due_date='2020-01-31')
+                                  for number in range(BULK_BATCH_SIZE * 2 + 200)])
+        Projet.objects.filter(pk=self.project.pk).update(**project_counters())
+        self.client.force_login(self.user)
+
+    def test_filter_selection(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('bulk_tasks', args=[self.project.id]), {
+                '1': ['and', 'status', self.status.id], 'status': self.finished.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], BULK_BATCH_SIZE * 2 + 200)
+
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "taskmanager_task"')]
+        self.assertEqual(len(updates), 3)
+        self.assertFalse(Task.objects.filter(status=self.status).exists())
+        self.assertEqual(Journal.objects.count(), BULK_BATCH_SIZE * 2 + 200)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.finished_count, BULK_BATCH_SIZE * 2 + 200)
+
+    def test_too_many_ids(self):
+        ids = Task.objects.values_list('id', flat=True)[:BULK_BATCH_SIZE + 1]
+        response = self.client.post(reverse('bulk_tasks', args=[self.project.id]), {
+            'ids': ','.join(map(str, ids)), 'priority': 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.json()['errors'])
@@ -0,0 +1,86 @@
+# python modules
+from datetime import date, timedelta
+
+# django modules
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+
+# models
+from .models import duration_class
+
+
+# The biggest class of duration of a task (see models.duration_class)
+MAX_DURATION_CLASS = duration_class(date.min, date.max)
+
+# The fields of the tasks given by the timeline, the foreign keys by their id (see api.TASK_API_FIELDS)
+TIMELINE_FIELDS = ('id', 'name', 'projet', 'assignee', 'status', 'start_date', 'due_date', 'completion_percentage')
+
+# The period of the timeline when it is not given: the next days from today
+TIMELINE_DAYS = 30
+
+
+class TimelineError(ValueError):
+    pass
+
+
+def parse_period(query_dict):
+    """Read the "start" and "end" parameters of a request: the first and the last days of the period (YYYY-MM-DD)
+
+    :param query_dict: the request.GET QueryDict
+    :return: the first and the last days, by default today and TIMELINE_DAYS days later
+    """
+    try:
+        start = parse_date(query_dict['start']) if query_dict.get('start') else date.today()
+        if start is not None:
+            end = parse_date(query_dict['end']) if query_dict.get('end') else start + timedelta(days=TIMELINE_DAYS)
+    except (ValueError, OverflowError):
+        start = None
+    if start is None or end is None:
+        raise TimelineError("The start and end parameters must be dates (YYYY-MM-DD)")
+    if end < start:
+        raise TimelineError("The end of the period must not be before its start")
+    return start, end
+
+
+def overlap_filter(start, end, **lookups):
+    """Q object selecting the tasks overlapping a period: started before its end and not due before its start
+
+    A condition on the due date alone, or on the start date alone, would read all the tasks due after the start, or
+    started before the end, of the period. The tasks are rather looked for by class of duration (see
+    models.duration_class): the tasks of the class k last at most 2^k - 1 days, so the ones overlapping the period
+    started at most 2^k - 1 days before it. Each class is one range of the index (projet or assignee, duration_class,
+    start_date), and at least half of the tasks read in it overlap the period or start in it: the tasks read are about
+    the tasks returned.
+
+    :param start: the first day of the period
+    :param end: the last day of the period
+    :param lookups: the tasks of a project (projet=...) or of a user (assignee=...), repeated in each range so that the
+                    index is used
+    :return: the Q object
+    """
+    ranges = Q()
+    for duration in range(MAX_DURATION_CLASS + 1):
+        longest = (1 << duration) - 1
+        earliest = start - timedelta(days=longest) if longest <= (start - date.min).days else date.min
+        ranges |= Q(duration_class=duration, start_date__gte=earliest, start_date__lte=end, **lookups)
+    return ranges & Q(due_date__gte=start)
+
+
+def timeline_response(request, tasks, **lookups):
+    """JSON response giving the tasks overlapping a period, for a Gantt chart
+
+    :param request: GET parameters "start" and "end", see parse_period
+    :param tasks: the queryset of the tasks which may be given
+    :param lookups: the project or the user of the tasks, see overlap_filter
+    :return: a JSON object with the period, the number of tasks and the tasks ordered by start date, 400 if the period
+    is not valid
+    """
+    try:
+        start, end = parse_period(request.GET)
+    except TimelineError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    tasks = list(tasks.filter(overlap_filter(start, end, **lookups)).order_by('start_date', 'id')
+                 .values(*TIMELINE_FIELDS))
+    return JsonResponse({'start': start, 'end': end, 'count': len(tasks), 'tasks': tasks})
@@ -16,6 +16,8 @@ urlpatterns = [
     path('task/<int:task_id>', views.task_view, name="task"),
     path('newtask/<project_id>', views.newtask_view, name="newtask"),
     path('edittask/<task_id>', views.edittask_view, name="edittask"),
+    # bulk change of the tasks of a project (POST, JSON)
+    path('project/<int:project_id>/tasks/bulk', views.bulk_tasks_view, name="bulk_tasks"),
 
     # URL: F1, PROJECTS STATISTICS
     # we changed the name of this part of the site only in the end, so we didn't change the name of the urls to
@@ -29,4 +31,21 @@ urlpatterns = [
 
     # URL: F_3, EXPORT DATA
     path('export-data-selection', views.data_selection, name="select-data"),
+    path('export/<int:job_id>', views.export_job_view, name="export_job"),
+    path('export/<int:job_id>/download', views.export_download, name="export_download"),
+    # import of the exported archives, staff only
+    path('import-data', views.import_data, name="import-data"),
+
+    # URL: full text search in the tasks and the journals (JSON)
+    path('search', views.search_view, name="search"),
+
+    # URL: read only JSON API of the tasks, with conditional requests (ETag)
+    path('api/projects/<int:project_id>/tasks', views.project_tasks_api, name="api_project_tasks"),
+    path('api/users/<int:user_id>/tasks', views.user_tasks_api, name="api_user_tasks"),
+    # URL: tasks overlapping a period, for a Gantt chart (JSON)
+    path('api/projects/<int:project_id>/timeline', views.project_timeline_api, name="api_project_timeline"),
+    path('api/users/<int:user_id>/timeline', views.user_timeline_api, name="api_user_timeline"),
+
+    # URL: requests metrics (Prometheus), staff only
+    path('metrics', views.metrics_view, name="metrics"),
 ]
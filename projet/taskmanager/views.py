@@ -1,26 +1,55 @@
 # python modules
-import csv
-import datetime
-import io
-import xlwt
-from zipfile import ZipFile
+import os
 
 # django modules and functions
+from django.conf import settings
 from django.contrib import messages
-from django.core import serializers
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.contrib.auth import authenticate, login
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.exceptions import PermissionDenied
+from django.views.decorators.http import require_POST
 
 # models
 from django.contrib.auth.models import User
-from django.db.models import Q, Sum, Count
-from .models import Projet, Task, Journal, Status
+from django.db.models import Q, Count
+from .models import Projet, Task, Journal, ExportJob, FINISHED_STATUS, status_registry
+
+# filters
+from .filters import parse_filters, compile_filters
+
+# export
+from .jobs import EXPORT_MODELS, submit_export
+
+# import
+from .importer import ImportDataError, import_archive
+
+# bulk operations on the tasks
+from .bulk import bulk_update_tasks
+
+# cache of the rendered fragments of the pages
+from .fragments import cached_fragment, cached_fragments, fragment_key
+
+# JSON API
+from .api import tasks_response
+from .backends import ProjectMembershipBackend
+from .timeline import timeline_response
+
+# full text search
+from .search import SEARCH_RESULTS, MAX_SEARCH_RESULTS, search
+
+# metrics
+from .metrics import registry
+
+# read only views on the replica database
+from .replica import recently_written, replica_view
 
 # forms
 from django.contrib.auth.forms import UserCreationForm
-from .forms import ProjectForm, JournalForm, TaskForm, ExportDataForm
+from .forms import ProjectForm, JournalForm, TaskForm, BulkTaskForm, ExportDataForm, ImportDataForm
 
 
 # redirect to the projects list page if the url requested is just http://localhost:8000/
@@ -133,99 +162,45 @@ def edit_project_view(request, project_id):
     return redirect("projects")
 
 
-def add_filter(filters, entry):
-    method = entry[1]
-    value = entry[2]
-    link = entry[0]
+# Number of tasks displayed on each page of the project page
+TASKS_PER_PAGE = 50
 
-    if method == 'assign':
-        if link == "and":
-            filters &= Q(assignee__id=value)
-        else:
-            filters |= Q(assignee__id=value)
-    elif method == 'not_assign':
-        if link == "and":
-            filters &= ~Q(assignee__id=value)
-        else:
-            filters |= ~Q(assignee__id=value)
-    elif method == 'status':
-        if link == "and":
-            filters &= Q(status__id=value)
-        else:
-            filters |= Q(status__id=value)
-    elif method == 'not_status':
-        if link == "and":
-            filters &= ~Q(status__id=value)
-        else:
-            filters |= ~Q(status__id=value)
-    elif method == 'start_before':
-        if link == "and":
-            filters &= Q(start_date__lte=value)
-        else:
-            filters |= Q(start_date__lte=value)
-    elif method == 'start_after':
-        if link == "and":
-            filters &= Q(start_date__gte=value)
-        else:
-            filters |= Q(start_date__gte=value)
-    elif method == 'end_before':
-        if link == "and":
-            filters &= Q(due_date__lte=value)
-        else:
-            filters |= Q(due_date__lte=value)
-    elif method == 'end_after':
-        if link == "and":
-            filters &= Q(due_date__gte=value)
-        else:
-            filters |= Q(due_date__gte=value)
-
-    return filters
-
-
-def creat_filters_rec(project, filter_dic, filter_id_tab):
-    type = ''
-    filters = Q()
-    skip = 0
-    id_sub_tab = []
-    for i in range(len(filter_id_tab)):
-        id = filter_id_tab[i]
-
-        if (skip != 0):
-            if (skip != 1):
-                id_sub_tab.append(id)
-            elif (not ((type == 'or') and ('input_end_or-' in id))) and (
-                    not ((type == 'and') and ('input_end_and-' in id))):
-                id_sub_tab.append(id)
-        elif not (('input_or-' in id) or ('input_and-' in id)):
-            filters = add_filter(filters, filter_dic[id])
-
-        if ('input_or-' in id) and (type != 'and'):
-            type = 'or'
-            skip += 1
-
-        if ('input_and-' in id) and (type != 'or'):
-            type = 'and'
-            skip += 1
-
-        if ('input_end_or-' in id) and (type == 'or'):
-            skip -= 1
-            if skip == 0:
-                filter_temp = creat_filters_rec(project, filter_dic, id_sub_tab)
-                set_temp = project.task_set.filter(filter_temp)
-                filters |= Q(pk__in=set_temp)
-                id_sub_tab = []
-                type = ''
-
-        if ('input_end_and-' in id) and (type == 'and'):
-            skip -= 1
-            if skip == 0:
-                filter_temp = creat_filters_rec(project, filter_dic, id_sub_tab)
-                set_temp = project.task_set.filter(filter_temp)
-                filters &= Q(pk__in=set_temp)
-                id_sub_tab = []
-                type = ''
-
-    return filters
+
+def paginate_tasks(tasks, query_dict):
+    """Keyset pagination of the tasks of the project page
+
+    The tasks are ordered by decreasing priority and id. The position in the list is given by the 'after' parameter
+    of the url ("<priority>_<id>" of the last task of the previous page) so that the database can start reading from it
+    instead of skipping all the tasks of the previous pages. The assignee of the tasks is retrieved in the same query
+    and their status in the registry of the statuses, since the template displays them.
+
+    :param tasks: the queryset of the tasks to be displayed
+    :param query_dict: the request.GET QueryDict. The other parameters (the filters) are kept in the pages links
+    :return: the list of the tasks of the page, the query string of the next page and the query string of the first
+    page (None if there is no such page)
+    """
+    tasks = tasks.select_related('assignee').order_by('-priority', '-id')
+
+    # Start after the last task of the previous page, or from the beginning if the cursor is not valid
+    cursor = query_dict.get('after', '').split('_')
+    first_page_query = None
+    if len(cursor) == 2 and all(value.lstrip('-').isdigit() for value in cursor):
+        priority, task_id = int(cursor[0]), int(cursor[1])
+        tasks = tasks.filter(Q(priority__lt=priority) | Q(priority=priority, id__lt=task_id))
+        first_page_query = query_dict.copy()
+        del first_page_query['after']
+        first_page_query = first_page_query.urlencode()
+
+    # Read one more task to know if there is a next page
+    page = status_registry.attach(tasks[:TASKS_PER_PAGE + 1])
+    next_page_query = None
+    if len(page) > TASKS_PER_PAGE:
+        page = page[:TASKS_PER_PAGE]
+        next_page_query = query_dict.copy()
+        next_page_query['after'] = '{}_{}'.format(page[-1].priority, page[-1].id)
+        next_page_query = next_page_query.urlencode()
+
+    return page, next_page_query, first_page_query
 
 
 @login_required()
@@ -244,55 +219,25 @@ def project_view(request, project_id):
     project = get_object_or_404(Projet, id=project_id)
 
     if request.method == 'GET':
-
-        filters = Q()
-        list_of_key = []
-        query_string = request.META['QUERY_STRING']
-        query_tab = query_string.split('&')
-        filter_id_tab = []
-        filter_dic = {}
-
-        print(query_tab)
-
-        if (query_tab != ['']):
-            for query in query_tab:
-                query_arg = query.split('=')
-                id = query_arg[0]
-
-                if not (id in filter_id_tab):
-                    filter_id_tab.append(id)
-                try:
-                    filter_dic[id].append(query_arg[1])
-                except KeyError:
-                    filter_dic[id] = [query_arg[1]]
-
-            for key in request.GET:
-                list_of_key.append(key)
-
-            print(list_of_key)
-            filters = creat_filters_rec(project, filter_dic, filter_id_tab)
-        else:
-            filters = Q()
-
-        #
-        # for key in filter_id_tab:
-        #
-        #
-        #     entry = filter_dic[key]
-        #
-        #     if (len(entry) != 3):
-        #         continue
-        #
-        #     filters = add_filter(filters, entry)
-
-        tasks = project.task_set.filter(filters).order_by('-priority')
+        # Build the filter sent by the filter form. The compiled filter is cached, see filters.compile_filters
+        filters = compile_filters(parse_filters(request.GET))
+        tasks = project.task_set.filter(filters)
     else:
-        # Retrieve all the task of the project and order them
-        tasks = project.task_set.all().order_by('-priority')
+        # Retrieve all the task of the project
+        tasks = project.task_set.all()
 
     # Check if the logged in user is allowed to see this project
     if request.user.has_perm('taskmanager.{}_project_permission'.format(project.id)):
-        status = Status.objects.all()
+        def render_tasks():
+            # Only one page of tasks is displayed, ordered by priority
+            page, next_page_query, first_page_query = paginate_tasks(tasks, request.GET)
+            return render_to_string('project_tasks.html', {'tasks': page, 'next_page_query': next_page_query,
+                                                           'first_page_query': first_page_query})
+
+        # The table is rendered again only when the project has changed (or for other filters and pages)
+        tasks_table = cached_fragment(fragment_key('project', project.id, project.version, request.GET.urlencode()),
+                                      render_tasks)
+        status = status_registry.all()
         users = project.members.all()
         return render(request, 'project.html', locals())
     else:
@@ -314,6 +259,7 @@ def task_view(request, task_id):
 
     # retrieve the task, raise an error if the task does not exist
     task = get_object_or_404(Task, id=task_id)
+    status_registry.attach([task])
     project = task.projet
     # Check if the logged in user is allowed to see this task
     if request.user.has_perm('taskmanager.{}_project_permission'.format(project.id)):
@@ -329,9 +275,8 @@ def task_view(request, task_id):
                 journal.author = request.user
                 journal.save()
 
-                # update the last modification DateTime of the Task instance
-                task.last_modification = datetime.datetime.now()
-                task.save()
+                # a new entry in the journal is a modification of the task (last_modification is auto_now)
+                task.save(update_fields=['last_modification'])
         else:
             # initialize a new form
             form = JournalForm()
@@ -369,8 +314,6 @@ def newtask_view(request, project_id):
             form = TaskForm(project, request.POST)
             if form.is_valid():
                 task = form.save(commit=True)
-                task.last_modification = datetime.datetime.now()  # it's probably not necessary
-                task.save()
 
                 return redirect("task", task_id=task.id)
         else:
@@ -407,7 +350,6 @@ def edittask_view(request, task_id):
                 task = form.save(commit=False)
                 # Manually set the project id. Otherwise a new task would be created
                 task.id = task_id
-                task.last_modification = datetime.datetime.now()
                 task.save()
 
                 return redirect("task", task_id=task.id)
@@ -420,104 +362,140 @@ def edittask_view(request, task_id):
 
 
 @login_required()
+@require_POST
+def bulk_tasks_view(request, project_id):
+    """Change the status, the assignee, the priority or the advancement of many tasks of a project at once
+
+    POST parameters: see forms.BulkTaskForm. The tasks are changed with one query and a journal is written on each of
+    them (see bulk.bulk_update_tasks)
+
+    :param request:
+    :param project_id:
+    :return: a JSON object with the number and the ids of the changed tasks, 400 with the errors of the form if it is
+    not valid, 403 if the user is not member of the project
+    """
+    project = get_object_or_404(Projet, id=project_id)
+    if not request.user.has_perm('taskmanager.{}_project_permission'.format(project.id)):
+        raise PermissionDenied
+
+    form = BulkTaskForm(project, request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    tasks = project.task_set.all()
+    if form.cleaned_data['ids']:
+        tasks = tasks.filter(id__in=form.cleaned_data['ids'])
+    if form.cleaned_data['filters']:
+        tasks = tasks.filter(form.cleaned_data['filters'])
+
+    task_ids = bulk_update_tasks(project, tasks, form.changes(), request.user, form.entry())
+    return JsonResponse({'count': len(task_ids), 'tasks': task_ids})
+
+
+@login_required()
+@replica_view
 def my_profile(request):
-    projects = request.user.projets.all()  # queryset
-
-    # PIE CHARTS (TASKS BY PROJECT and MEMBERS BY PROJECT)
-    labels = []
-    data_TBP = []
-    data_MBP = []
-
-    for project in projects:
-        # used in the progress bar
-        project.completed_tasks = project.task_set.filter(status__name='Finished')
-        # calculate the project progress
-        tasks_number = project.task_set.all().count()  # count all the tasks in this project
-        # get all the completion percentage of all the tasks in this project, sum them all and then divide this
-        # number by the number of tasks, if the task number is above 0 to avoid numeric troubles
-        if tasks_number > 0:
-            project.completion_percentage = project.task_set.all().aggregate(
-                sum=Sum('completion_percentage'))['sum'] / tasks_number
-        else:
-            project.completion_percentage = 0
+    # The statistics of the projects are kept in their counters (see models.update_project_counters)
+    projects = request.user.projets.order_by('id').prefetch_related('members')  # queryset
+
+    def render_projects():
+        # PIE CHARTS (TASKS BY PROJECT and MEMBERS BY PROJECT)
+        labels = []
+        data_TBP = []
+        data_MBP = []
 
-        # the following is used in the charts
-        labels.append(project.name)
-        data_TBP.append(project.task_set.all().count())  # appends data to the lists used for the pie charts
-        data_MBP.append(project.members.all().count())
+        for project in projects:
+            # the following is used in the charts
+            labels.append(project.name)
+            data_TBP.append(project.task_count)  # appends data to the lists used for the pie charts
+            data_MBP.append(project.member_count)
+
+        chart_elements = range(len(labels))
+        return render_to_string("myprofile_projects.html", locals())
 
-    chart_elements = range(len(labels))
+    # The projects are rendered again only when one of them has changed. The fragment does not depend on the user, the
+    # members of the same projects share it
+    versions = list(projects.values_list('id', 'version'))
+    projects_fragment = cached_fragment(fragment_key('myprofile', versions), render_projects)
 
     return render(request, "myprofile.html", locals())
 
 
 @login_required()
+@replica_view
 def taches_assignees(request):
-    tasks = Task.objects.filter(assignee=request.user).exclude(status__name__contains="Finished")
+    # the finished statuses are found by their ids in the registry instead of a join on their names
+    tasks = status_registry.attach(Task.objects.filter(assignee=request.user).exclude(
+        status__in=status_registry.ids_containing(FINISHED_STATUS)).select_related('projet'))
 
     return render(request, "tachesassignees.html", locals())
 
 
 @login_required()
+@replica_view
 def taches_terminees(request):
-    tasks = Task.objects.filter(assignee=request.user, status__name__contains="Finished")
+    tasks = status_registry.attach(Task.objects.filter(
+        assignee=request.user, status__in=status_registry.ids_containing(FINISHED_STATUS)).select_related('projet'))
 
     return render(request, "tachesterminees.html", locals())
 
 
 @login_required()
+@replica_view
 def taches_projets(request):
     projects = request.user.projets.all()
 
+    def render_project(project):
+        def render():
+            tasks = status_registry.attach(project.task_set.select_related('assignee'))
+            return render_to_string("tachesprojets_project.html",
+                                    {'project': project, 'tasks': tasks, 'user': request.user})
+        return render
+
+    # The tasks of each project are rendered again only when the project has changed. The tasks of the user are marked
+    projects_tables = cached_fragments([
+        (fragment_key('tachesprojets', project.id, project.version, request.user.id), render_project(project))
+        for project in projects])
+
     return render(request, "tachesprojets.html", locals())
 
 
 # page ACTIVITIES
 @login_required()
+@replica_view
 def taches_recents_home(request):
     projects = request.user.projets.all()
 
     # BAR CHART (ACTIONS BY PROJECT BY USER)
-    for project in projects:
-        # get the tasks of a project
-        tasks = project.task_set.all()
-        # get the journals of the project, going through the tasks
-        journals = Journal.objects.filter(task__in=tasks)
-        # get a queryset which entris are dictionary containing the number of actions made by all the users that are members of the project
-        project.actions = journals.values('author').annotate(count=Count('author'))
-        print(project.actions)
-        print(project)
+    # column of each project in the chart
+    project_index = {project.id: i for i, project in enumerate(projects)}
 
     # get all the users part of the projects that can be seen by the authenticated user
     users = User.objects.filter(projets__in=projects).distinct()
-    # build a list for each user that contains how many actions he/she has done in a particular project
-    # It's not optimized at all this part of the code, but I didn't find a better solution using Django's database
-    # requests during the time that I had to make this chart work (that's a compromise but it should work)
-    # I didn't test it that much. If it creates some BUGS please delete it [MICHELE]
+    # row of each user in the chart
+    user_index = {user.id: i for i, user in enumerate(users)}
+
+    # build a matrix users x projects that contains how many actions each user has done in each project. The chart asks
+    # for as many "data" numbers as the number of the projects in the page, so the matrix is full of zeros for the
+    # projects in which the user has not added a journal yet or of which he/she is not a member
+    actions = [[0] * len(project_index) for user in users]
+
+    # get the number of journals written by each author in each project in one query, going through the tasks
+    journals = Journal.objects.filter(task__projet__in=projects)
+    for entry in journals.values('author', 'task__projet').annotate(count=Count('id')).order_by():
+        # the authors that are not members of the projects anymore are not in the chart
+        if entry['author'] in user_index:
+            actions[user_index[entry['author']]][project_index[entry['task__projet']]] = entry['count']
+
     for user in users:
-        # build an empty list for the user that will be updated with the number of actions per project done by him
-        user.list = []
-        for project in projects:
-            print(project.name)
-            print(project.actions)
-            if len(project.actions) == 0:  # it means that nobody has added a journal yet to the any task of the project
-                user.list.append(0)
-            for i in range(len(project.actions)):       # check in the queryset if there exists a a voice author that corresponds to that user
-                if project.actions[i]['author'] == user.id:     # it means that we found an entry in the queryset that corresponds to that user, and so it means that he has done an action in that project
-                    user.list.append(project.actions[i]['count'])   # append to the list the number of actions he has done
-                    break
-                if i == len(project.actions) - 1:       # if after having gone through all the queryset nothing has been found, it means that this user has not done any action for that project,
-                    user.list.append(0)                 # so put a zero
-        print(user.list)
-    # in the end I need to build this list because the chart asks for as many "data" numbers as the number of the projects in the page
-    # so I need to put a zero not only if the user has not added yet a journal to that project, but also if he is not member
-    # of that project at all
+        user.list = actions[user_index[user.id]]
 
     return render(request, "tachesrecentshome.html", locals())
 
 
 # page ACTIVITIES
 @login_required()
+@replica_view
 def taches_recents(request, project_id):
     project = get_object_or_404(Projet, id=project_id)
     tasks = project.task_set.order_by('-last_modification')
@@ -550,209 +528,161 @@ def signup(request):
 def data_selection(request):
     """
     This view contains a form that allows the user to select the data to export. After that the form has caught the
-    user choices, it calls the function (or view) 'download_data' defined below
+    user choices, the export is made in background (see jobs.submit_export) and the user is redirected to the page of
+    the export
     """
     if request.method == 'POST':
         form = ExportDataForm(request.POST)
         if form.is_valid():
-            # parameteres passed to 'download_data'
+            # the names of the ticked models
+            selection = [name for name in EXPORT_MODELS if form.cleaned_data[name]]
             file_format = form.cleaned_data['file_format']
-            exp_m = form.cleaned_data['projects_members']
-            exp_p = form.cleaned_data['projects']
-            exp_t = form.cleaned_data['tasks']
-            exp_j = form.cleaned_data['journals']
-            exp_s = form.cleaned_data['status']
+            compress = form.cleaned_data['compress']
+            since = form.cleaned_data['since']
 
-            return download_data(request, file_format, exp_p, exp_m, exp_t, exp_j, exp_s)
+            job = submit_export(request.user, selection, file_format, compress, since,
+                                replica=not recently_written(request))
+            return redirect('export_job', job_id=job.id)
     else:
         form = ExportDataForm()
     return render(request, 'data_selection.html', locals())
 
 
-# NOT a view, but the function used to export the data
-def download_data(request, file_format, exp_p=False, exp_m=False, exp_t=False, exp_j=False, exp_s=False,
-                  querysets=None):
-    """ This view generates a zip file containing all the data required by the user.
-    I tried to write a function as general as possible: it can either export all the data or some of the data
-    that the AUTHENTICATED USER has access to, or export a general QUERYSET made by instances of the model of this app
+@login_required()
+def export_job_view(request, job_id):
+    """The page of an export made in background. Display its status and the download link once it is done"""
+    # Only the user who asked for the export can see it
+    job = get_object_or_404(ExportJob, id=job_id, user=request.user)
+    return render(request, 'exportjob.html', locals())
+
+
+@login_required()
+def export_download(request, job_id):
+    """Send the zip file of an export made in background, or let the web server send it (EXPORT_SENDFILE_HEADER)"""
+    job = get_object_or_404(ExportJob, id=job_id, user=request.user, status=ExportJob.DONE)
+    if not os.path.exists(job.file_path):
+        raise Http404("The export file does not exist anymore")
+
+    if settings.EXPORT_SENDFILE_HEADER:
+        # the response is only the headers, the web server replaces its body with the file
+        response = HttpResponse(content_type='application/zip')
+        response[settings.EXPORT_SENDFILE_HEADER] = os.path.join(settings.EXPORT_SENDFILE_ROOT,
+                                                                 os.path.basename(job.file_path))
+        response['Content-Disposition'] = 'attachment; filename="data.zip"'
+        return response
+    return FileResponse(open(job.file_path, 'rb'), as_attachment=True, filename='data.zip',
+                        content_type='application/zip')
+
+
+@user_passes_test(lambda user: user.is_staff)
+def import_data(request):
+    """Import a zip archive made by the export (staff only)
+
+    The objects may belong to any project and the missing users are created, so only the staff can import data. The
+    archive is imported in one transaction: on error, nothing is imported
+    """
+    if request.method == 'POST':
+        form = ImportDataForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                counts = import_archive(form.cleaned_data['archive'])
+            except ImportDataError as error:
+                form.add_error('archive', str(error))
+            else:
+                messages.success(request, "Imported: " + ", ".join(
+                    "{} {}".format(count, name) for name, count in counts.items()))
+                return redirect('projects')
+    else:
+        form = ImportDataForm()
+    return render(request, 'import_data.html', locals())
+
+
+@login_required()
+def search_view(request):
+    """Full text search in the tasks and the journals of the projects of the user (see search.py)
+
+    GET parameters: q, the searched words, and limit, the number of results (at most MAX_SEARCH_RESULTS)
+
+    :return: a JSON object with the results, the most relevant first
+    """
+    text = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', SEARCH_RESULTS)), 1), MAX_SEARCH_RESULTS)
+    except ValueError:
+        limit = SEARCH_RESULTS
+
+    results = search(request.user, text, limit)
+    for result in results:
+        result['url'] = reverse('task', args=[result['task']])
+    return JsonResponse({'query': text, 'results': results})
+
+
+@login_required()
+def project_tasks_api(request, project_id):
+    """The tasks of a project (JSON), see api.tasks_response
 
     :param request:
-    :param file_format: among .csv, .json, .xml, .xls (MS-Excel)
-    :param exp_t, exp_m, exp_t, exp_j, exp_s: booleans, allows to select wheter to export projects, projects members,
-                                                projects tasks, tasks journals or status models
-                                                (a particular USER can export ONLY the data of the projects of which he/
-                                                she is a member)
+    :param project_id:
+    :return: 403 if the user is not member of the project
+    """
+    project = get_object_or_404(Projet, id=project_id)
+    if not request.user.has_perm('taskmanager.{}_project_permission'.format(project.id)):
+        raise PermissionDenied
+    return tasks_response(request, project.task_set.all())
 
-    :param querysets: a list of queryset (can be passed from whatever view to export the data)
 
-    : return: the zip file containing the data
+@login_required()
+def user_tasks_api(request, user_id):
+    """The tasks assigned to a user (JSON), see api.tasks_response
+
+    Only the tasks of the projects of which the logged in user is member are given
+
+    :param request:
+    :param user_id:
+    :return:
     """
+    user = get_object_or_404(User, id=user_id)
+    tasks = Task.objects.filter(assignee=user)
+    if user == request.user:
+        return tasks_response(request, tasks)
+    # the tasks of the user are in his/her projects (see models.update_tasks_assignment). The list also changes when the
+    # logged in user joins or leaves a project, so his/her projects are part of the ETag
+    project_ids = sorted(ProjectMembershipBackend().get_project_ids(request.user))
+    return tasks_response(request, tasks.filter(projet_id__in=project_ids), project_ids)
 
-    # set the response so that the browser will understand that the user is receiving a zip file to download
-    response = HttpResponse(content_type='application/zip')
-    response['Content-Disposition'] = 'attachment; filename="data.zip"'
-
-    # create the zip archive by using the python library ZipFile
-    data_zip = ZipFile(response, 'w')
-
-    file_format = file_format.lower()  # it may be helpful
-
-    """ ONLY the data that refers to the projects of which the AUTHENTICATED USER is MEMBER will be exported"""
-    user = request.user
-    # models queryset to be used to generate to export the database
-    projects_queryset = user.projets.all()  # only projects that the user has access to
-    projects_members_queryset = User.objects.filter(
-        projets__in=projects_queryset).distinct()  # infos about project members
-    tasks_queryset = Task.objects.filter(projet__in=projects_queryset)  # all the tasks in these projects
-    journals_queryset = Journal.objects.filter(task__in=tasks_queryset)  # all the journals in these tasks
-    status_queryset = Status.objects.all()
-
-    def dump_to_file_format(queryset, file_format, data_zip):
-        """ Subfunction used not to repeat the same code for the export process
-
-        :param queryset: a generic queryset of a model
-        :param file_format:
-        :param data_zip: a zip archive
-
-        """
-        # create a temporary  output stream (temp file)
-        if file_format == 'xls':
-            # it seems that an excel file needs to be written on a BytesIo even if on the xlwt they write exactly
-            # the opposite (I was about to become fool)
-            output = io.BytesIO()
-        else:
-            output = io.StringIO()
-
-        # get queryset model
-        model = queryset.model
-        # the export code depends on the file format
-        if file_format == 'csv':
-            # create an instance of csv writer that writes on the stream 'output' opened above
-            csv_writer = csv.writer(output, dialect='excel', delimiter=';')
-
-            # there are some things that may be different from a model to another
-
-            # for example, I also want to write in the project csv the username of the members
-            if model == Projet:
-                csv_writer.writerow(['ID', 'NAME', 'MEMBERS'])
-                for project in queryset:
-                    # build a comma separated list with all the users and the tasks that are in the project
-                    members = ', '.join([member.username for member in project.members.all()])
-                    csv_writer.writerow([project.id, project.name, members])
-            # if the model is User, only export non confidential fields
-            if model == User:
-                csv_writer.writerow(['USERNAME', 'NAME', 'SURNAME', 'E-MAIL'])
-                for user in queryset:
-                    csv_writer.writerow([user.username, user.first_name, user.last_name, user.email])
-            # for the other models that's what is going to happen
-            else:
-                # get all the field names and write them as headers
-                field_names = [field.name for field in model._meta.fields]
-                csv_writer.writerow(field.upper() for field in field_names)
-                # for each instance in the queryset
-                for obj in queryset:
-                    # """general backup code"""
-                    # csv_writer.writerow([getattr(obj, field) for field in field_names])
-
-                    row = []  # create an empty row list
-                    # for each field of the model
-                    for field in field_names:
-                        # get the field value
-                        field_value = getattr(obj, field)
-                        # this is to control the format of the date that will be written in the csv
-                        if isinstance(field_value, datetime.datetime):
-                            field_value = field_value.strftime("%m/%d/%Y, %H:%M:%S")
-                        row.append(field_value)  # append the field value to the end of the row list
-
-                    csv_writer.writerow(row)
-
-        # the .json and .xml formats are generated with the django serializers utilities
-        elif file_format == 'json' or file_format == 'xml':
-            # if the model is User, only export non confidential fields
-            if model == User:
-                json_xml = serializers.serialize(file_format, queryset, use_natural_foreign_keys=True,
-                                                 fields=('username', 'first_name', 'last_name', 'email'))
-            else:
-                # use_natural_foreign_keys=True means that the foreign keys won't be written as just numbers
-                json_xml = serializers.serialize(file_format, queryset, use_natural_foreign_keys=True)
-
-            output.write(json_xml)
-
-        elif file_format == 'xls':
-            wb = xlwt.Workbook(encoding='utf-8')  # create excel workbook
-            ws = wb.add_sheet(model._meta.model.__name__)  # create sheet
-
-            # Sheet header, first row
-            row_num = 0
-            font_style = xlwt.XFStyle()
-            font_style.font.bold = True
-
-            '''This code is pretty similar to the code to export in .csv, but in excel each cell (row and column) 
-            must written separately'''
-            # get all the field names and write them as headers
-            # if User only confidential data
-            if model == User:
-                field_names = ['username', 'first_name', 'last_name', 'email']
-            else:
-                field_names = [field.name for field in model._meta.fields]
-            for col_num in range(len(field_names)):
-                ws.write(row_num, col_num, field_names[col_num].upper(), font_style)
-
-            # add a column for the members of the project
-            # (otherwise it won't be done automatically because it's ManytoMany)
-            if model == Projet:
-                ws.write(row_num, col_num + 1, 'MEMBERS', font_style)
-
-            # Sheet body, remaining rows
-            font_style = xlwt.XFStyle()
-
-            # for each instance in the queryset
-            for obj in queryset:
-                row_num += 1
-                # for each field of the model
-                for col_num in range(len(field_names)):
-                    # get the field value
-                    field_value = getattr(obj, field_names[col_num])
-                    # this is to control the format of the date that will be written in the csv
-                    if isinstance(field_value, datetime.datetime):
-                        field_value = field_value.strftime("%m/%d/%Y, %H:%M:%S")
-                    ws.write(row_num, col_num, field_value.__str__(), font_style)
-
-                # add the column with the members of the project
-                if model == Projet:
-                    members = ', '.join([member.username for member in obj.members.all()])
-                    ws.write(row_num, col_num + 1, members, font_style)
-
-            # save the excel file on the output stream
-            wb.save(output)
-
-        # generates the name of the output file depending on the model and the file format
-        file_name = model._meta.model.__name__.lower() + '_data.' + file_format
-        # add the file to the zip archive and close the output stream
-        data_zip.writestr(file_name, output.getvalue())
-        output.close()
-
-    '''
-    uses the function defined above the export the data
-    '''
-    if exp_p:
-        dump_to_file_format(projects_queryset, file_format, data_zip)
-    if exp_m:
-        dump_to_file_format(projects_members_queryset, file_format, data_zip)
-    if exp_t:
-        dump_to_file_format(tasks_queryset, file_format, data_zip)
-    if exp_j:
-        dump_to_file_format(journals_queryset, file_format, data_zip)
-    if exp_s:
-        dump_to_file_format(status_queryset, file_format, data_zip)
-
-    # it is also possible to pass whatever list of querysets to this function
-    if not querysets is None:
-        for queryset in querysets:
-            dump_to_file_format(queryset, file_format, data_zip)
-
-    # closes the zip file
-    data_zip.close()
-
-    # finally send the zip file as a the HTTP response
-    return response
+
+@login_required()
+def project_timeline_api(request, project_id):
+    """The tasks of a project overlapping a period (JSON), see timeline.timeline_response
+
+    :param request:
+    :param project_id:
+    :return: 403 if the user is not member of the project
+    """
+    project = get_object_or_404(Projet, id=project_id)
+    if not request.user.has_perm('taskmanager.{}_project_permission'.format(project.id)):
+        raise PermissionDenied
+    return timeline_response(request, Task.objects.all(), projet=project)
+
+
+@login_required()
+def user_timeline_api(request, user_id):
+    """The tasks assigned to a user overlapping a period (JSON), see timeline.timeline_response
+
+    Only the tasks of the projects of which the logged in user is member are given
+
+    :param request:
+    :param user_id:
+    :return:
+    """
+    user = get_object_or_404(User, id=user_id)
+    tasks = Task.objects.all()
+    if user != request.user:
+        tasks = tasks.filter(projet__in=request.user.projets.all())
+    return timeline_response(request, tasks, assignee=user)
+
+
+@user_passes_test(lambda user: user.is_staff)
+def metrics_view(request):
+    """The metrics of the requests handled by this process, in the Prometheus text format (staff only)"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')